@@ -0,0 +1,40 @@
+"""
+Benchmarks for the images app.  Run them from the project root, e.g.
+
+    python -m benchmarks.openai_session
+
+Scripts that touch the database expect the same POSTGRES_* environment as manage.py.
+"""
+
+import os
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'edLight.settings')
+    import django
+    django.setup()
+
+def use_benchmark_database(name='benchmark_images'):
+    """
+    Point the default connection at a separate, migrated database that is kept between
+    runs, so large synthetic tables are only generated once.  `manage.py test` never touches it.
+    """
+    from django.db import connection
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = name
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=True, serialize=False)
+
+def timed_median(fn, repeat=5):
+    # Median wall time of `fn` in milliseconds
+    import time
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentile(samples, 50)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,74 @@
+"""
+Analysis throughput of the sync path (a WSGI-style pool of worker threads, each
+blocked on OpenAiAdapter for a whole round-trip) against the async path (one
+event loop running AsyncOpenAIDescriber under async_analysis_concurrency), both
+against a local stand-in upstream with a fixed latency.  The database is not
+involved; this isolates the cost of waiting on the upstream.
+
+    python -m benchmarks.async_throughput --analyses 400 --wsgi-workers 8 --delay 0.5
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import time
+
+from . import setup_django, percentile
+from .mock_openai import MockOpenAIServer
+
+IMAGE = os.path.join(os.path.dirname(__file__), '..', 'images', 'tests', 'images', 'test-image-file.png')
+
+def report(label, samples, elapsed):
+    print(f'{label:<28} {len(samples) / elapsed:8.1f} analyses/s  '
+          f'p50={percentile(samples, 50) * 1000:8.1f}ms  p99={percentile(samples, 99) * 1000:8.1f}ms')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--analyses', type=int, default=400)
+    parser.add_argument('--wsgi-workers', type=int, default=8, help='threads in the sync pool')
+    parser.add_argument('--concurrency', type=int, default=200, help='async_analysis_concurrency')
+    parser.add_argument('--delay', type=float, default=0.5, help='simulated upstream latency in seconds')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.apps import apps
+    from images.describers import OpenAIDescriber, AsyncOpenAIDescriber
+    from images.openai_adapter import reset_session
+
+    config = apps.get_app_config('images')
+    config.openai_api_key = 'benchmark-key'
+    config.openai_pool_size = args.wsgi_workers
+    config.openai_async_pool_size = args.concurrency
+    config.async_analysis_concurrency = args.concurrency
+
+    with MockOpenAIServer(delay=args.delay, subprocess=True) as server:
+        config.openai_api_base = server.base_url
+        reset_session()
+
+        # Every analysis is submitted at once, so latency includes the wait for a free worker/slot
+        describer = OpenAIDescriber()
+        started = time.perf_counter()
+        def sync_analysis(_):
+            describer.describe_image(IMAGE)
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(max_workers=args.wsgi_workers) as pool:
+            samples = list(pool.map(sync_analysis, range(args.analyses)))
+        report(f'sync, {args.wsgi_workers} WSGI workers', samples, time.perf_counter() - started)
+
+        async def run_async():
+            async_describer = AsyncOpenAIDescriber()
+            semaphore = asyncio.Semaphore(args.concurrency)
+            async def one():
+                async with semaphore:
+                    await async_describer.describe_image(IMAGE)
+                return time.perf_counter() - started
+            return await asyncio.gather(*(one() for _ in range(args.analyses)))
+
+        started = time.perf_counter()
+        samples = asyncio.run(run_async())
+        report('async, 1 ASGI process', samples, time.perf_counter() - started)
+
+if __name__ == '__main__':
+    main()
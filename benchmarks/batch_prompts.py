@@ -0,0 +1,99 @@
+"""
+Images described per minute and tokens billed per image with batched prompts
+(OpenAIDescriber.describe_images) against one request per image, using a local
+stand-in server.  The stand-in answers after `--delay` seconds per request plus
+`--per-image` seconds per image described, and bills tokens like the API does:
+prompt text at ~4 characters a token, 85 per low detail image, `--completion`
+tokens per description.
+
+    python -m benchmarks.batch_prompts --images 96 --concurrency 4 --batch-sizes 1 4 8 16
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import tempfile
+import threading
+import time
+
+from . import setup_django
+from .mock_openai import MockOpenAIServer
+
+class Billing:
+    # Replies to plain and batch prompts, adding up the tokens each request is charged
+    def __init__(self, per_image, completion):
+        self.per_image = per_image
+        self.completion = completion
+        self.tokens = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, body):
+        content = json.loads(body)['messages'][0]['content']
+        images = [part for part in content if part['type'] == 'image_url']
+        text = sum(len(part['text']) for part in content if part['type'] == 'text')
+        prompt_tokens = 7 + text // 4 + 85 * len(images)
+        completion_tokens = self.completion * len(images)
+        time.sleep(self.per_image * len(images))
+
+        descriptions = [f'A mock description of image {i + 1}' for i in range(len(images))]
+        reply = json.dumps(descriptions) if len(images) > 1 else descriptions[0]
+        with self.lock:
+            self.tokens += prompt_tokens + completion_tokens
+        return 200, {}, {
+            'choices': [{'message': {'role': 'assistant', 'content': reply}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }
+
+def make_images(directory, count):
+    from PIL import Image as PILImage
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f'image-{i}.png')
+        PILImage.new('RGB', (256, 256), (i % 256, 80, 160)).save(path)
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=96)
+    parser.add_argument('--concurrency', type=int, default=4, help='requests in flight at once')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 8, 16])
+    parser.add_argument('--delay', type=float, default=0.5, help='fixed upstream latency per request in seconds')
+    parser.add_argument('--per-image', type=float, default=0.1, help='extra upstream latency per image in seconds')
+    parser.add_argument('--completion', type=int, default=40, help='completion tokens per description')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.apps import apps
+    from django.test import override_settings
+    from images.describers import OpenAIDescriber
+
+    config = apps.get_app_config('images')
+    config.openai_api_key = 'benchmark-key'
+    config.rate_limit_enabled = False
+
+    with tempfile.TemporaryDirectory() as workdir, override_settings(MEDIA_ROOT=workdir):
+        paths = make_images(workdir, args.images)
+        for batch_size in args.batch_sizes:
+            billing = Billing(args.per_image, args.completion)
+            with MockOpenAIServer(delay=args.delay, responder=billing) as server:
+                config.openai_api_base = server.base_url
+                describer = OpenAIDescriber()
+                batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+                describe = describer.describe_images if batch_size > 1 else (lambda files: [describer.describe_image(files[0])])
+
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+                    described = sum(
+                        sum(description is not None for description in descriptions)
+                        for descriptions in pool.map(describe, batches)
+                    )
+                elapsed = time.perf_counter() - started
+
+            print(f'batch size {batch_size:>3}: {described / elapsed * 60:8.0f} images/min  '
+                  f'{billing.tokens / args.images:6.1f} tokens/image  {server.requests:>4} requests')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Comments per second created through POST /image/<id>/comments, one comment per request,
+against POST /comments with batches of increasing size.  Comments go to random images,
+and each mode's comments are deleted afterwards so the kept tables don't grow.  Each
+request commits on its own, as it would in production.
+
+Uses the kept `benchmark_images` database; run benchmarks.keyset_pagination first to fill it.
+
+    python -m benchmarks.comment_batches --comments 5000
+"""
+
+import argparse
+import json
+import random
+import time
+
+from . import setup_django, use_benchmark_database
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--comments', type=int, default=5000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    import logging
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from images.models import Image, Comment
+
+    setup_test_environment()
+    logging.disable(logging.CRITICAL)
+    client = Client()
+    image_ids = list(Image.objects.order_by('?').values_list('id', flat=True)[:1000])
+    rng = random.Random(args.seed)
+    comments = [{'image_id': rng.choice(image_ids), 'content': f'benchmark comment {n}'} for n in range(args.comments)]
+
+    def single():
+        for comment in comments:
+            response = client.post(f'/image/{comment["image_id"]}/comments', {'content': comment['content']})
+            assert response.status_code == 200, response.content
+
+    def batched(size):
+        def post():
+            for start in range(0, len(comments), size):
+                body = json.dumps(comments[start:start + size])
+                response = client.post('/comments', body, content_type='application/json')
+                assert response.status_code == 200, response.content
+        return post
+
+    modes = [('single', single)] + [(f'batch of {size}', batched(size)) for size in args.batch_sizes]
+    print(f'{"mode":<16} {"comments":>9} {"time":>9} {"comments/s":>11}')
+    for name, post in modes:
+        started = time.perf_counter()
+        post()
+        elapsed = time.perf_counter() - started
+        # Deleted through the ORM, so comment_count and search_vector follow
+        Comment.objects.filter(content__startswith='benchmark comment ').delete()
+        print(f'{name:<16} {len(comments):>9} {elapsed:>8.2f}s {len(comments) / elapsed:>11,.0f}')
+
+if __name__ == '__main__':
+    main()
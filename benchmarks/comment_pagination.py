@@ -0,0 +1,78 @@
+"""
+Time to fetch one page of a viral image's comments at increasing depths, with
+comment_page (Paginator: COUNT(*) plus OFFSET) against comment_cursor (KeysetPaginator
+over the (image, created_at, id) index).  The viral image has --viral comments; the
+other --background comments are spread over other images.  Comments share
+created_at values, so ties are covered.
+
+Uses the kept `benchmark_images` database (see benchmarks.keyset_pagination).
+
+    python -m benchmarks.comment_pagination --viral 200000 --background 2000000
+"""
+
+import argparse
+import time
+
+from . import setup_django, use_benchmark_database, timed_median
+
+def populate(viral, background):
+    from django.db import connection
+    from images.models import Image, Comment
+
+    if Image.objects.count() < 1000:
+        Image.objects.bulk_create(Image(file=f'images/synthetic-{i}.jpg') for i in range(1000))
+    image_ids = list(Image.objects.order_by('id').values_list('id', flat=True)[:1000])
+    viral_id = image_ids[0]
+    if Comment.objects.count() == viral + background and Comment.objects.filter(image_id=viral_id).count() == viral:
+        return viral_id
+
+    print(f'generating {viral} + {background} comments...')
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute('TRUNCATE images_comment RESTART IDENTITY')
+        cursor.execute('''
+            INSERT INTO images_comment (image_id, content, created_at)
+            SELECT %s, 'A comment on a viral image',
+                   timestamptz '2024-01-01 00:00:00+00' + (g / 3) * interval '1 second'
+            FROM generate_series(1, %s) AS g
+        ''', [viral_id, viral])
+        cursor.execute('''
+            INSERT INTO images_comment (image_id, content, created_at)
+            SELECT (%s::bigint[])[1 + g %% %s], 'A comment',
+                   timestamptz '2024-01-01 00:00:00+00' + g * interval '1 second'
+            FROM generate_series(1, %s) AS g
+        ''', [image_ids[1:], len(image_ids) - 1, background])
+        cursor.execute('ANALYZE images_comment')
+    print(f'generated in {time.perf_counter() - started:.1f}s')
+    return viral_id
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--viral', type=int, default=200_000)
+    parser.add_argument('--background', type=int, default=2_000_000)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    from django.apps import apps
+    from images import actions
+    from images.models import Image
+    from images.pagination import KeysetPaginator
+
+    image = Image.objects.get(pk=populate(args.viral, args.background))
+    apps.get_app_config('images').comment_page_size = args.page_size
+    ordered = image.comment_set.order_by('created_at', 'id')
+    keyset = KeysetPaginator(image.comment_set.all(), 'created_at', args.page_size)
+
+    print(f'{"depth":>8} {"comment_page":>14} {"comment_cursor":>16}')
+    for depth in sorted({0, 1000, args.viral // 10, args.viral // 2, args.viral - args.page_size}):
+        page = depth // args.page_size + 1
+        offset_ms = timed_median(lambda: actions.get_paginated_comments(image, page), args.repeat)
+        token = keyset.encode(ordered[depth - 1], 'next') if depth else ''
+        cursor_ms = timed_median(lambda: actions.get_comment_cursor_page(image, token), args.repeat)
+        print(f'{depth:>8} {offset_ms:>12.2f}ms {cursor_ms:>14.2f}ms')
+
+if __name__ == '__main__':
+    main()
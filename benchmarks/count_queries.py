@@ -0,0 +1,73 @@
+"""
+Queries per request and latency of GET /images/?page=N and GET /image/<id>?comment_page=N
+when num_pages comes from COUNT(*) (the previous behaviour) against the cached image
+total and the denormalized comment_count.
+
+Uses the kept `benchmark_images` database; run benchmarks.keyset_pagination and
+benchmarks.comment_pagination first to fill it.
+
+    python -m benchmarks.count_queries --requests 50
+"""
+
+import argparse
+from contextlib import nullcontext
+import time
+from unittest.mock import patch
+
+from . import setup_django, use_benchmark_database, percentile
+
+def measure(client, url, requests):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    samples = []
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(url)
+            samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.content
+    return len(queries) / requests, percentile(samples, 50), percentile(samples, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    import logging
+    from django.apps import apps
+    from django.core.cache import cache
+    from django.core.paginator import Paginator
+    from django.db.models import Count
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from images import counters
+    from images.models import Comment
+
+    setup_test_environment()
+    logging.disable(logging.CRITICAL)
+    config = apps.get_app_config('images')
+    viral_id = Comment.objects.values('image_id').annotate(n=Count('id')).order_by('-n').values_list('image_id', flat=True).first()
+    counters.repair_comment_counts(counters.Image.objects.filter(pk=viral_id))
+    client = Client()
+    urls = {'index': '/images/?page=2', 'show_with_comments': f'/image/{viral_id}?comment_page=2'}
+
+    print(f'{"endpoint":<20} {"mode":<10} {"queries":>8} {"p50":>10} {"p99":>10}')
+    for name, url in urls.items():
+        for mode in ('COUNT(*)', 'counters'):
+            if mode == 'COUNT(*)':
+                config.image_total_cache_ttl = 0
+                uncounted = patch('images.actions.CountedPaginator', lambda objects, per_page, count: Paginator(objects, per_page))
+            else:
+                config.image_total_cache_ttl = 60
+                cache.delete(counters.IMAGE_TOTAL_KEY)
+                client.get(url)
+                uncounted = nullcontext()
+            with uncounted:
+                queries, p50, p99 = measure(client, url, args.requests)
+            print(f'{name:<20} {mode:<10} {queries:>8.1f} {p50:>8.2f}ms {p99:>8.2f}ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Newest comments for a page of images: GET /images/ followed by GET /image/<id> per image
+(the N+1 the gallery client did), against one GET /images/?ids=...&embed_comments=N.
+Also times ranking the page's comments with ROW_NUMBER() OVER (PARTITION BY image_id),
+which embed_comments avoids because it sorts every comment of a busy image.
+
+Each page includes the image with the most comments.  Uses the kept `benchmark_images`
+database; run benchmarks.comment_pagination first to fill it.
+
+    python -m benchmarks.embedded_comments --embed 3
+"""
+
+import argparse
+
+from . import setup_django, use_benchmark_database, timed_median
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--embed', type=int, default=3)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 50, 100])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    import logging
+    from django.apps import apps
+    from django.db import connection
+    from django.db.models import Count, F, Window
+    from django.db.models.functions import RowNumber
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from images.models import Comment
+
+    setup_test_environment()
+    logging.disable(logging.CRITICAL)
+    apps.get_app_config('images').response_cache_enabled = False
+    client = Client()
+    viral_id = Comment.objects.values('image_id').annotate(n=Count('id')).order_by('-n').values_list('image_id', flat=True).first()
+    commented = list(Comment.objects.exclude(image_id=viral_id).order_by('-image_id').values_list('image_id', flat=True).distinct()[:max(args.page_sizes)])
+
+    def n_plus_one(ids):
+        client.get('/images/', {'ids': ','.join(map(str, ids))})
+        for image_id in ids:
+            client.get(f'/image/{image_id}', {'comment_cursor': ''})
+
+    def window(ids):
+        list(Comment.objects.filter(image_id__in=ids).annotate(rank=Window(
+            RowNumber(), partition_by=F('image_id'), order_by=[F('created_at').desc(), F('id').desc()]
+        )).filter(rank__lte=args.embed))
+
+    def embedded(ids):
+        client.get('/images/', {'ids': ','.join(map(str, ids)), 'embed_comments': args.embed})
+
+    print(f'{"page size":>9} {"approach":<14} {"requests":>8} {"queries":>8} {"time":>10}')
+    for page_size in args.page_sizes:
+        ids = [viral_id] + commented[:page_size - 1]
+        for name, requests, fn in (('N+1 requests', page_size + 1, n_plus_one), ('ROW_NUMBER()', '-', window), ('embed_comments', 1, embedded)):
+            queries = []
+            with connection.execute_wrapper(lambda execute, sql, params, many, context: queries.append(sql) or execute(sql, params, many, context)):
+                fn(ids)
+            milliseconds = timed_median(lambda: fn(ids), args.repeat)
+            print(f'{page_size:>9} {name:<14} {requests:>8} {len(queries):>8} {milliseconds:>8.1f}ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Throughput and peak memory of exporting every image (GET /images/export or the
+export_ndjson command) as NDJSON, plain and gzip compressed, against reading the
+same rows into memory first as dumpdata does.  Each mode runs in its own process so
+its peak RSS is its own; the export goes to /dev/null.
+
+It reads the `benchmark_search` database (see benchmarks.search), so generate that
+first.  In-memory reads stop at --in-memory-limit rows.
+
+    python -m benchmarks.export --in-memory-limit 1000000
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from . import setup_django, use_benchmark_database
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run(mode: str, limit: int) -> dict:
+    setup_django()
+    use_benchmark_database('benchmark_search')
+    from images import export
+    from images.models import Image
+
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    written = rows = 0
+    if mode == 'in-memory':
+        records = list(Image.objects.order_by().values()[:limit])
+        rows = len(records)
+        written = len(json.dumps(records, default=str))
+    else:
+        summary = {}
+        def remember(records):
+            for record in records:
+                yield record
+            summary.update(record)
+        with open('/dev/null', 'wb') as output:
+            for block in export.ndjson(remember(export.records()), compress=mode == 'gzip'):
+                written += len(block)
+                output.write(block)
+        rows = summary['images'] + summary['comments']
+    elapsed = time.perf_counter() - started
+    return {'rows': rows, 'seconds': elapsed, 'mb': written / 1e6, 'rss_mb': peak_rss_mb() - baseline}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modes', nargs='+', default=['plain', 'gzip', 'in-memory'])
+    parser.add_argument('--in-memory-limit', type=int, default=1_000_000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run(args.child, args.in_memory_limit)))
+        return
+
+    print(f'{"mode":<10} {"rows":>10} {"time":>9} {"rows/s":>9} {"output":>10} {"peak RSS":>10}')
+    for mode in args.modes:
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.export', '--child', mode, f'--in-memory-limit={args.in_memory_limit}'],
+            check=True, capture_output=True, text=True,
+        )
+        r = json.loads(result.stdout.strip().splitlines()[-1])
+        print(f'{mode:<10} {r["rows"]:>10} {r["seconds"]:>8.1f}s {r["rows"] / r["seconds"]:>9.0f} '
+              f'{r["mb"]:>8.0f}MB {r["rss_mb"]:>8.1f}MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Time to fetch the first page (10) of GET /images/?tag=... with the jsonb_path_ops GIN
+index on analysis against the same containment filter with the index disabled (a
+sequential scan), and to count the most common labels and objects (GET /images/tags)
+for the whole table and for one tag, at growing table sizes.
+
+Each image has 5 labels and 3 objects drawn from 1,000 names (l0001 to l1000 and
+o0001 to o1000) with a Zipf-like distribution, so l0001 is on about a third of the
+images and l0500 on a handful.  The table lives in a separate `benchmark_facets`
+database that is kept and grown between runs.
+
+    python -m benchmarks.facets --sizes 100000 1000000
+"""
+
+import argparse
+import time
+
+from . import setup_django, use_benchmark_database, timed_median
+
+NAMES = 1_000
+# Label filters, from a rare label to a common one; two rare labels rarely meet
+TAGS = [['l0500'], ['l0030'], ['l0001'], ['l0500', 'l0400']]
+
+def populate(rows):
+    from django.db import connection
+    from images.models import Image
+
+    existing = Image.objects.count()
+    if existing >= rows:
+        return
+    print(f'generating {rows - existing} images (table had {existing})...')
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        # Loading is much faster without the GIN index; it's rebuilt below
+        cursor.execute('DROP INDEX IF EXISTS images_image_analysis_idx')
+        cursor.execute('''
+            INSERT INTO images_image (file, description, analysis, analyzed_at, created_at, status, content_hash, comment_count)
+            SELECT 'images/facets-' || g || '.jpg', to_jsonb('image ' || g),
+                   jsonb_build_object('labels', l.names, 'objects', o.names, 'text', '', 'confidence', 0.9),
+                   now(), now(), 'analyzed', '', 0
+            FROM generate_series(%s, %s) AS g
+            CROSS JOIN LATERAL (
+                SELECT jsonb_agg(DISTINCT 'l' || lpad(floor(exp(random() * ln(%s)))::int::text, 4, '0')) AS names
+                FROM generate_series(1, 5) WHERE g > 0
+            ) AS l
+            CROSS JOIN LATERAL (
+                SELECT jsonb_agg(DISTINCT 'o' || lpad(floor(exp(random() * ln(%s)))::int::text, 4, '0')) AS names
+                FROM generate_series(1, 3) WHERE g > 0
+            ) AS o
+        ''', [existing + 1, rows, NAMES, NAMES])
+        cursor.execute('CREATE INDEX images_image_analysis_idx ON images_image USING gin (analysis jsonb_path_ops)')
+        cursor.execute('ANALYZE images_image')
+    print(f'generated in {time.perf_counter() - started:.1f}s')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database('benchmark_facets')
+    from django.apps import apps
+    from django.db import connection
+    from images.facets import facet_counts, filter_images
+    from images.models import Image
+
+    apps.get_app_config('images').tag_counts_cache_ttl = 0
+
+    def first_page(tags, indexed):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET enable_bitmapscan = {"on" if indexed else "off"}')
+        images = filter_images(Image.objects.all(), tags).order_by('analyzed_at', 'id')
+        return timed_median(lambda: list(images[:10]), args.repeat)
+
+    print(f'{"rows":>10} {"tags":<12} {"matches":>9} {"scan":>10} {"GIN":>10} {"tag counts":>12}')
+    for rows in sorted(args.sizes):
+        populate(rows)
+        for tags in TAGS:
+            images = filter_images(Image.objects.all(), tags)
+            matches = images.count()
+            scan_ms, gin_ms = first_page(tags, False), first_page(tags, True)
+            counts_ms = timed_median(lambda: facet_counts(images, 20), args.repeat)
+            print(f'{rows:>10} {",".join(tags):<12} {matches:>9} {scan_ms:>8.1f}ms {gin_ms:>8.1f}ms {counts_ms:>10.1f}ms')
+        counts_ms = timed_median(lambda: facet_counts(Image.objects.all(), 20), args.repeat)
+        print(f'{rows:>10} {"(all)":<12} {rows:>9} {"":>10} {"":>10} {counts_ms:>10.1f}ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Rows per second turned into a JSON response body by the DRF serializers + JsonResponse
+against the fast path (values_list() rows + orjson), for pages of images and comments.
+Each sample runs the page's query, builds the rows and encodes the body.
+
+Uses the kept `benchmark_images` database; run benchmarks.keyset_pagination and
+benchmarks.comment_pagination first to fill it.
+
+    python -m benchmarks.fast_json --repeat 20
+"""
+
+import argparse
+
+from . import setup_django, use_benchmark_database, timed_median
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    from django.apps import apps
+    from django.db.models import Count
+    from images import fast_json
+    from images.models import Image, Comment
+
+    config = apps.get_app_config('images')
+    viral_id = Comment.objects.values('image_id').annotate(n=Count('id')).order_by('-n').values_list('image_id', flat=True).first()
+    querysets = {
+        'images': (Image.objects.order_by('analyzed_at', 'id'), fast_json.images),
+        'comments': (Comment.objects.filter(image_id=viral_id).order_by('created_at', 'id'), fast_json.comments),
+    }
+
+    print(f'orjson {"installed" if fast_json.orjson else "missing"}')
+    print(f'{"rows":<10} {"page size":>9} {"serializer":>14} {"fast path":>14} {"speedup":>8}')
+    for name, (queryset, rows) in querysets.items():
+        for page_size in args.page_sizes:
+            rates = []
+            for enabled in (False, True):
+                config.fast_json_enabled = enabled
+                page = queryset[page_size:page_size * 2]
+                milliseconds = timed_median(lambda: fast_json.response({'data': rows(page.all())}).content, args.repeat)
+                rates.append(page_size / milliseconds * 1000)
+            print(f'{name:<10} {page_size:>9} {rates[0]:>9,.0f} rows/s {rates[1]:>9,.0f} rows/s {rates[1] / rates[0]:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
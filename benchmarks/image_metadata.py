@@ -0,0 +1,84 @@
+"""
+Time to find the images at least --min-width wide among --images stored JPEGs: by
+opening every file with Pillow (what answering it took before the metadata columns),
+and with the ?min_width= filter on the indexed width column.  Also reports how fast
+backfill_metadata reads the metadata of images stored without it.
+
+Images and files are generated for the run and removed after it.  Uses the kept
+`benchmark_images` database.
+
+    python -m benchmarks.image_metadata --images 2000 --repeat 5
+"""
+
+import argparse
+import io
+import os
+import random
+import tempfile
+import time
+
+from . import setup_django, use_benchmark_database, timed_median
+
+def jpeg(width: int, height: int) -> bytes:
+    from PIL import Image as PILImage
+    output = io.BytesIO()
+    PILImage.new('RGB', (width, height), 'gray').save(output, format='JPEG')
+    return output.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=2000)
+    parser.add_argument('--min-width', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    from django.core.management import call_command
+    from django.test import override_settings
+    from PIL import Image as PILImage
+    from images import metadata
+    from images.models import Image
+
+    random.seed(1)
+    sizes = [(random.choice((320, 640, 1024, 2048)), random.choice((240, 480, 768))) for _ in range(args.images)]
+    with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+        os.makedirs(os.path.join(media_root, 'images'))
+        files = {size: jpeg(*size) for size in set(sizes)}
+        rows = []
+        for index, size in enumerate(sizes):
+            name = f'images/benchmark-{index}.jpg'
+            with open(os.path.join(media_root, name), 'wb') as image_file:
+                image_file.write(files[size])
+            rows.append(Image(file=name, content_hash=f'{index:064x}'))
+        images = Image.objects.bulk_create(rows, batch_size=1000)
+        ids = [image.id for image in images]
+        try:
+            queryset = Image.objects.filter(id__in=ids)
+
+            started = time.perf_counter()
+            call_command('backfill_metadata', f'--after-id={ids[0] - 1}', stdout=io.StringIO())
+            backfill_s = time.perf_counter() - started
+
+            def open_every_file():
+                wide = []
+                for pk, name in queryset.values_list('id', 'file'):
+                    with PILImage.open(os.path.join(media_root, name)) as img:
+                        if metadata.read(img).width >= args.min_width:
+                            wide.append(pk)
+                return wide
+
+            def filter_in_sql():
+                return list(metadata.filter_images(queryset, {'min_width': str(args.min_width)}).values_list('id', flat=True))
+
+            assert sorted(open_every_file()) == sorted(filter_in_sql())
+            print(f'{args.images} images, {len(filter_in_sql())} at least {args.min_width}px wide')
+            print(f'{"approach":<20} {"time":>10}')
+            print(f'{"open every file":<20} {timed_median(open_every_file, args.repeat):>8.1f}ms')
+            print(f'{"?min_width= in SQL":<20} {timed_median(filter_in_sql, args.repeat):>8.1f}ms')
+            print(f'backfill_metadata: {args.images / backfill_s:.0f} images/s')
+        finally:
+            Image.objects.filter(id__in=ids).delete()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Time to fetch one page of GET /images/ at increasing depths, with page numbers
+(Paginator: COUNT(*) plus OFFSET) against keyset cursors (KeysetPaginator over
+the (analyzed_at, id) index), on a table of synthetic images.  One in ten images
+is unanalyzed, and analyzed_at values repeat, so both NULLs and ties are covered.
+
+The table lives in a separate `benchmark_images` database that is kept between
+runs; the first run with a given --rows generates it.
+
+    python -m benchmarks.keyset_pagination --rows 5000000
+"""
+
+import argparse
+import time
+
+from . import setup_django, use_benchmark_database, timed_median
+
+def populate(rows):
+    from django.db import connection
+    from images.models import Image
+
+    existing = Image.objects.count()
+    if existing == rows:
+        return
+    print(f'generating {rows} images (table had {existing})...')
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        cursor.execute('TRUNCATE images_image RESTART IDENTITY CASCADE')
+        cursor.execute('''
+            INSERT INTO images_image (file, description, analyzed_at, created_at, status, content_hash)
+            SELECT 'images/synthetic-' || g || '.jpg',
+                   CASE WHEN g %% 10 = 0 THEN NULL ELSE to_jsonb('A synthetic image'::text) END,
+                   CASE WHEN g %% 10 = 0 THEN NULL
+                        ELSE timestamptz '2024-01-01 00:00:00+00' + ((g::bigint * 7919) %% %s) * interval '1 second' END,
+                   now(),
+                   CASE WHEN g %% 10 = 0 THEN 'pending' ELSE 'analyzed' END,
+                   ''
+            FROM generate_series(1, %s) AS g
+        ''', [max(1, rows // 4), rows])
+        cursor.execute('ANALYZE images_image')
+    print(f'generated in {time.perf_counter() - started:.1f}s')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5_000_000)
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    from django.core.paginator import Paginator
+    from images.models import Image
+    from images.pagination import KeysetPaginator
+
+    populate(args.rows)
+    ordered = Image.objects.order_by('analyzed_at', 'id')
+    keyset = KeysetPaginator(Image.objects.all(), 'analyzed_at', args.page_size)
+
+    print(f'{"depth":>10} {"page number":>14} {"cursor":>10}')
+    for depth in sorted({0, 1000, 100_000, args.rows // 4, args.rows // 2, args.rows * 95 // 100, args.rows - args.page_size}):
+        if depth >= args.rows:
+            continue
+        page_number = depth // args.page_size + 1
+        offset_ms = timed_median(lambda: list(Paginator(ordered, args.page_size).page(page_number)), args.repeat)
+
+        # The cursor a client would hold after walking to this depth; fetching it isn't timed
+        token = keyset.encode(ordered[depth - 1], 'next') if depth else ''
+        cursor_ms = timed_median(lambda: keyset.page(token), args.repeat)
+        print(f'{depth:>10} {offset_ms:>12.2f}ms {cursor_ms:>8.2f}ms')
+
+if __name__ == '__main__':
+    main()
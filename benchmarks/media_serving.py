@@ -0,0 +1,81 @@
+"""
+MB/s and CPU time per request serving a large image from MEDIA_ROOT: through
+django.views.static.serve (the DEBUG-only view MEDIA_URL used to be routed to) and
+through serve_media, whose responses are written out the way a WSGI server with a
+wsgi.file_wrapper does (gunicorn sendfile()s any file with a fileno()) and the way
+one without does (reading and writing blocks).  Also times a 1 MB range request and
+an X-Accel-Redirect offload, where the Python side only writes headers.  Bodies are
+written to /dev/null, so the numbers are the process's cost, not the network's.
+
+    python -m benchmarks.media_serving --megabytes 50 --repeat 20
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from . import setup_django, percentile
+
+def write_out(response, devnull, sendfile: bool) -> int:
+    # Send the body the way a WSGI server would, returning the bytes written
+    if response.streaming and sendfile and hasattr(getattr(response, 'file_to_stream', None), 'fileno'):
+        file = response.file_to_stream
+        fd, offset, written = file.fileno(), file.tell(), 0
+        length = int(response['Content-Length'])
+        while written < length:
+            sent = os.sendfile(devnull, fd, offset + written, length - written)
+            if not sent:
+                break
+            written += sent
+        response.close()
+        return written
+    written = 0
+    for block in (response.streaming_content if response.streaming else [response.content]):
+        written += os.write(devnull, block)
+    response.close()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megabytes', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.apps import apps
+    from django.test import RequestFactory, override_settings
+    from django.views.static import serve
+    from images.views import serve_media
+
+    config = apps.get_app_config('images')
+    factory = RequestFactory()
+    with tempfile.TemporaryDirectory() as workdir, override_settings(MEDIA_ROOT=workdir), \
+            open(os.devnull, 'wb') as devnull_file:
+        devnull = devnull_file.fileno()
+        name = 'large.jpg'
+        with open(os.path.join(workdir, name), 'wb') as image_file:
+            image_file.write(b'\xff\xd8\xff' + os.urandom(args.megabytes * 1024 * 1024))
+
+        modes = (
+            ('static.serve', lambda: serve(factory.get(f'/media/{name}'), name, document_root=workdir), False, ''),
+            ('serve_media, read/write', lambda: serve_media(factory.get(f'/media/{name}'), name), False, ''),
+            ('serve_media, sendfile', lambda: serve_media(factory.get(f'/media/{name}'), name), True, ''),
+            ('serve_media, 1 MB range', lambda: serve_media(factory.get(f'/media/{name}', HTTP_RANGE='bytes=0-1048575'), name), False, ''),
+            ('serve_media, X-Accel-Redirect', lambda: serve_media(factory.get(f'/media/{name}'), name), False, 'x-accel-redirect'),
+        )
+        print(f'{"mode":<32} {"MB/s":>8} {"CPU ms/req":>11} {"p50 ms":>8} {"p99 ms":>8}')
+        for label, view, sendfile, offload in modes:
+            config.media_offload = offload
+            wall, cpu, written = [], [], 0
+            for _ in range(args.repeat):
+                started, started_cpu = time.perf_counter(), time.process_time()
+                written += write_out(view(), devnull, sendfile)
+                wall.append((time.perf_counter() - started) * 1000)
+                cpu.append((time.process_time() - started_cpu) * 1000)
+            rate = written / 1e6 / (sum(wall) / 1000) if written else 0
+            print(f'{label:<32} {rate:>8.0f} {sum(cpu) / len(cpu):>11.2f} {percentile(wall, 50):>8.2f} {percentile(wall, 99):>8.2f}')
+        config.media_offload = ''
+
+if __name__ == '__main__':
+    main()
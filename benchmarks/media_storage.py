@@ -0,0 +1,80 @@
+"""
+File-open latency and directory listing time with every image in one directory (upload
+names) against content-addressed shards (images/ab/cd/<sha256>), at --files files.  The
+files are empty, as only directory lookups are measured; they are kept in --root between
+runs, since creating millions of them takes a while.  With --drop-caches (root only) the
+kernel's dentry and inode caches are emptied before each layout is measured.
+
+The space deduplication saves on real data is reported by `manage.py rehome_media --stats`.
+
+    python -m benchmarks.media_storage --files 5000000
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import time
+
+from . import percentile
+
+def flat_name(n: int) -> str:
+    return f'upload_{n}.jpg'
+
+def shard_name(n: int) -> str:
+    digest = hashlib.sha256(str(n).encode()).hexdigest()
+    return os.path.join(digest[:2], digest[2:4], digest + '.jpg')
+
+def populate(directory: str, names, files: int):
+    marker = os.path.join(directory, f'.populated_{files}')
+    if os.path.exists(marker):
+        return
+    for n in range(files):
+        path = os.path.join(directory, names(n))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'wb').close()
+        if n % 500_000 == 0:
+            print(f'  {directory}: {n}/{files}', flush=True)
+    open(marker, 'wb').close()
+
+def drop_caches():
+    os.sync()
+    with open('/proc/sys/vm/drop_caches', 'w') as caches:
+        caches.write('2\n')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=5_000_000)
+    parser.add_argument('--opens', type=int, default=10_000)
+    parser.add_argument('--root', default='benchmark_media')
+    parser.add_argument('--drop-caches', action='store_true')
+    args = parser.parse_args()
+
+    layouts = {'flat': flat_name, 'sharded': shard_name}
+    print(f'{"layout":<8} {"files":>10} {"open p50":>10} {"open p99":>10} {"list dir":>10} {"dir entries":>12}')
+    rng = random.Random(1)
+    picks = [rng.randrange(args.files) for _ in range(args.opens)]
+    for layout, names in layouts.items():
+        directory = os.path.join(args.root, layout)
+        os.makedirs(directory, exist_ok=True)
+        populate(directory, names, args.files)
+        if args.drop_caches:
+            drop_caches()
+
+        samples = []
+        for n in picks:
+            path = os.path.join(directory, names(n))
+            started = time.perf_counter()
+            with open(path, 'rb'):
+                pass
+            samples.append((time.perf_counter() - started) * 1e6)
+        # The directory a file is in: all of them, or one shard
+        listed = os.path.dirname(os.path.join(directory, names(picks[0])))
+        started = time.perf_counter()
+        entries = len(os.listdir(listed))
+        listing = (time.perf_counter() - started) * 1000
+        print(f'{layout:<8} {args.files:>10} {percentile(samples, 50):>8.1f}us {percentile(samples, 99):>8.1f}us '
+              f'{listing:>8.1f}ms {entries:>12}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+A local stand-in for the OpenAI chat completions endpoint, used by the benchmarks.
+
+    with MockOpenAIServer(delay=0.05) as server:
+        apps.get_app_config('images').openai_api_base = server.base_url
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import multiprocessing
+import os
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one write so Nagle/delayed ACK don't add 40ms per response
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        # Bodies are only kept for a responder; otherwise they are counted and dropped,
+        # so the stand-in doesn't add the request size to a memory measurement
+        body, received = self._read_body(keep=server.responder is not None)
+        with server.stats_lock:
+            server.requests += 1
+            server.bytes_received += received
+        time.sleep(server.delay)
+
+        status, headers = 200, {}
+        if server.responder is not None:
+            status, headers, reply = server.responder(body)
+        else:
+            reply = {
+                'choices': [{'message': {'role': 'assistant', 'content': 'A mock description of the image'}}],
+                'usage': {'prompt_tokens': 85, 'completion_tokens': 12, 'total_tokens': 97},
+            }
+        payload = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _read_body(self, keep):
+        chunks, received = [], 0
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            sizes = iter(lambda: int(self.rfile.readline().strip(), 16), 0)
+            for size in sizes:
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                received += len(chunk)
+                if keep:
+                    chunks.append(chunk)
+            self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining:
+                chunk = self.rfile.read(min(remaining, 64 * 1024))
+                remaining -= len(chunk)
+                received += len(chunk)
+                if keep:
+                    chunks.append(chunk)
+        return b''.join(chunks), received
+
+class _Server(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections when hundreds of clients connect at once
+    request_queue_size = 1024
+    daemon_threads = True
+
+class MockOpenAIServer:
+    """
+    Answers every POST with a canned chat completion after `delay` seconds.
+    `responder(body) -> (status, headers, reply_dict)` overrides the reply.
+    With tls=True a self-signed certificate is generated with the openssl CLI and
+    REQUESTS_CA_BUNDLE / SSL_CERT_FILE are pointed at it, so clients pay a real handshake.
+    """
+    def __init__(self, delay=0.0, responder=None, tls=False, subprocess=False):
+        self.delay = delay
+        self.responder = responder
+        self.tls = tls
+        # In a subprocess the server's threads don't compete with the client for the GIL
+        self.subprocess = subprocess
+        if tls and subprocess:
+            raise ValueError('tls is only supported for an in-process server')
+        self._tmpdir = None
+        self._saved_env = {}
+
+    @property
+    def base_url(self):
+        scheme = 'https' if self.tls else 'http'
+        return f'{scheme}://127.0.0.1:{self.port}/v1'
+
+    @property
+    def requests(self):
+        return self.httpd.requests
+
+    @property
+    def bytes_received(self):
+        return self.httpd.bytes_received
+
+    def __enter__(self):
+        if self.subprocess:
+            ports = multiprocessing.Queue()
+            self._process = multiprocessing.Process(target=self._serve_in_subprocess, args=(ports,), daemon=True)
+            self._process.start()
+            self.port = ports.get(timeout=30)
+            return self
+        self._start()
+        return self
+
+    def _serve_in_subprocess(self, ports):
+        self._start()
+        ports.put(self.port)
+        self._thread.join()
+
+    def _start(self):
+        self.httpd = _Server(('127.0.0.1', 0), _Handler)
+        self.port = self.httpd.server_address[1]
+        self.httpd.delay = self.delay
+        self.httpd.responder = self.responder
+        self.httpd.requests = 0
+        self.httpd.bytes_received = 0
+        self.httpd.stats_lock = threading.Lock()
+        if self.tls:
+            self._wrap_tls()
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def __exit__(self, *exc):
+        if self.subprocess:
+            self._process.terminate()
+            self._process.join()
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        for name, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        if self._tmpdir:
+            self._tmpdir.cleanup()
+
+    def _wrap_tls(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        cert = os.path.join(self._tmpdir.name, 'cert.pem')
+        key = os.path.join(self._tmpdir.name, 'key.pem')
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+             '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+             '-keyout', key, '-out', cert],
+            check=True, capture_output=True
+        )
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        for name in ('REQUESTS_CA_BUNDLE', 'SSL_CERT_FILE'):
+            self._saved_env[name] = os.environ.get(name)
+            os.environ[name] = cert
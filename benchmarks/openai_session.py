@@ -0,0 +1,60 @@
+"""
+p50/p99 latency of OpenAiAdapter.make_request with the pooled keep-alive session,
+against a bare requests.post per call (the previous behaviour), using a local
+stand-in server.
+
+    python -m benchmarks.openai_session --requests 300 --concurrency 8 --delay 0.02 --tls
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from . import setup_django, percentile
+from .mock_openai import MockOpenAIServer
+
+def run(label, call, total, concurrency):
+    def timed(_):
+        started = time.perf_counter()
+        call()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(timed, range(total)))
+    elapsed = time.perf_counter() - started
+    print(f'{label:<22} p50={percentile(samples, 50) * 1000:7.2f}ms '
+          f'p99={percentile(samples, 99) * 1000:7.2f}ms  {total / elapsed:8.1f} req/s')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.02, help='simulated upstream latency in seconds')
+    parser.add_argument('--tls', action='store_true', help='serve over https with a self-signed certificate')
+    args = parser.parse_args()
+
+    setup_django()
+    import requests
+    from django.apps import apps
+    from images.openai_adapter import OpenAiAdapter, reset_session
+
+    config = apps.get_app_config('images')
+    config.openai_api_key = 'benchmark-key'
+    config.openai_pool_size = args.concurrency
+    payload = {'model': 'gpt-4-vision-preview', 'messages': [], 'max_tokens': 300}
+
+    with MockOpenAIServer(delay=args.delay, tls=args.tls) as server:
+        config.openai_api_base = server.base_url
+        url = f'{server.base_url}/chat/completions'
+        headers = {'Content-Type': 'application/json', 'Authorization': 'Bearer benchmark-key'}
+
+        run('bare requests.post', lambda: requests.post(url, headers=headers, json=payload).raise_for_status(),
+            args.requests, args.concurrency)
+
+        reset_session()
+        adapter = OpenAiAdapter()
+        run('pooled session', lambda: adapter.make_request(payload), args.requests, args.concurrency)
+
+if __name__ == '__main__':
+    main()
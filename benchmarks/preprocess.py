@@ -0,0 +1,84 @@
+"""
+Payload bytes, encode time and upstream latency of the image prompt with and
+without the preprocessing stage, over the test fixture image plus generated
+phone-sized photos (or the image paths given on the command line).
+
+    python -m benchmarks.preprocess [image ...]
+"""
+
+import argparse
+import base64
+import json
+import os
+import tempfile
+import time
+
+from . import setup_django
+from .mock_openai import MockOpenAIServer
+
+FIXTURE_IMAGE = os.path.join(os.path.dirname(__file__), '..', 'images', 'tests', 'images', 'test-image-file.png')
+
+def make_photo(directory, name, size):
+    from PIL import Image as PILImage
+    path = os.path.join(directory, name)
+    noise = PILImage.effect_noise(size, 64).convert('RGB')
+    gradient = PILImage.linear_gradient('L').resize(size).convert('RGB')
+    PILImage.blend(noise, gradient, 0.5).save(path, format='JPEG', quality=95)
+    return path
+
+def raw_prompt(adapter, path):
+    # The payload as it was built before preprocessing: the original bytes, labelled image/jpg
+    with open(path, 'rb') as image_file:
+        encoded = base64.b64encode(image_file.read()).decode('utf-8')
+    return {
+        'model': adapter.model,
+        'messages': [{'role': 'user', 'content': [
+            {'type': 'text', 'text': adapter.prompt_text},
+            {'type': 'image_url', 'image_url': {'url': f'data:image/jpg;base64,{encoded}'}},
+        ]}],
+        'max_tokens': adapter.max_tokens,
+    }
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - started) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.apps import apps
+    from django.test import override_settings
+    from images.openai_adapter import OpenAiAdapter, reset_session
+
+    config = apps.get_app_config('images')
+    config.openai_api_key = 'benchmark-key'
+
+    with tempfile.TemporaryDirectory() as workdir, override_settings(MEDIA_ROOT=workdir), MockOpenAIServer() as server:
+        config.openai_api_base = server.base_url
+        reset_session()
+        paths = args.images or [
+            FIXTURE_IMAGE,
+            make_photo(workdir, 'photo-12mp.jpg', (4000, 3000)),
+            make_photo(workdir, 'photo-3mp.jpg', (2000, 1500)),
+        ]
+        adapter = OpenAiAdapter()
+
+        print(f'{"image":<20} {"path":<9} {"payload":>12} {"encode ms":>10} {"request ms":>11}')
+        for path in paths:
+            name = os.path.basename(path)
+            for label, build in (
+                ('original', lambda: raw_prompt(adapter, path)),
+                ('cold', lambda: adapter.make_image_prompt(path)),
+                ('cached', lambda: adapter.make_image_prompt(path)),
+            ):
+                payload, encode_ms = timed(build)
+                _, request_ms = timed(lambda: adapter.make_request(payload))
+                size = len(json.dumps(payload))
+                print(f'{name:<20} {label:<9} {size:>12,} {encode_ms:>10.1f} {request_ms:>11.1f}')
+
+if __name__ == '__main__':
+    main()
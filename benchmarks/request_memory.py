@@ -0,0 +1,66 @@
+"""
+Peak traced memory (tracemalloc) of sending one image prompt to a local stand-in
+server, building the body in memory (the previous path: one base64 string inside
+a dict that requests serializes again) versus streaming it with StreamedPayload.
+
+    python -m benchmarks.request_memory --sizes 1 10 50
+"""
+
+import argparse
+import base64
+import os
+import tempfile
+import tracemalloc
+
+from . import setup_django
+from .mock_openai import MockOpenAIServer
+
+def measure(fn):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50], help='image sizes in MB')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.apps import apps
+    from images.openai_adapter import OpenAiAdapter, StreamedPayload, image_placeholder, reset_session
+    from images.preprocessing import PreparedImage
+
+    config = apps.get_app_config('images')
+    config.openai_api_key = 'benchmark-key'
+    adapter = OpenAiAdapter()
+
+    with tempfile.TemporaryDirectory() as workdir, MockOpenAIServer() as server:
+        config.openai_api_base = server.base_url
+        reset_session()
+        adapter.make_request({})  # open the pooled connection outside the measurement
+
+        print(f'{"image":>8} {"in-memory peak":>16} {"streamed peak":>15}')
+        for size in args.sizes:
+            path = os.path.join(workdir, f'{size}mb.jpg')
+            with open(path, 'wb') as image_file:
+                image_file.write(os.urandom(size * 1024 * 1024))
+            # Skip preprocessing: random bytes stand in for an image that is already small enough
+            prepared = PreparedImage(path, 'image/jpeg', 'high', 0, 0)
+
+            def in_memory():
+                with open(prepared.path, 'rb') as image_file:
+                    encoded = base64.b64encode(image_file.read()).decode('utf-8')
+                adapter.make_request(adapter._image_prompt(f'data:{prepared.mime_type};base64,{encoded}', prepared.detail))
+
+            def streamed():
+                adapter.make_request(StreamedPayload(adapter._image_prompt(image_placeholder(0), prepared.detail), [prepared]))
+
+            print(f'{size:>6}MB {measure(in_memory) / 2**20:>14.1f}MB {measure(streamed) / 2**20:>13.1f}MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Read-heavy replay of GET /images/?page=N and GET /image/<id> with a
+comment posted every --write-every requests, with the response cache off, on, and on
+with clients revalidating by ETag.  Reports the hit ratio (304s count as hits) and latency.
+
+Requests are skewed towards a few hot images and the first list pages, like real traffic.
+The cache backend is the `responses` alias, so RESPONSE_CACHE_BACKEND picks it.  Uses the
+kept `benchmark_images` database; run benchmarks.keyset_pagination and
+benchmarks.comment_pagination first to fill it.
+
+    RESPONSE_CACHE_BACKEND=locmem python -m benchmarks.response_cache --requests 5000
+"""
+
+import argparse
+import random
+import time
+
+from . import setup_django, use_benchmark_database, percentile
+
+def replay(client, urls, weights, comment_url, requests, write_every, revalidate, seed):
+    rng = random.Random(seed)
+    etags = {}
+    samples = []
+    for n in range(1, requests + 1):
+        if write_every and n % write_every == 0:
+            client.post(comment_url, {'content': f'replayed comment {n}'})
+        url = rng.choices(urls, weights)[0]
+        headers = {'HTTP_IF_NONE_MATCH': etags[url]} if revalidate and url in etags else {}
+        started = time.perf_counter()
+        response = client.get(url, **headers)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response.status_code in (200, 304), response.content
+        if 'ETag' in response:
+            etags[url] = response['ETag']
+    return percentile(samples, 50), percentile(samples, 99)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--images', type=int, default=200, help='Distinct images requested')
+    parser.add_argument('--write-every', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    import logging
+    from django.apps import apps
+    from django.conf import settings
+    from django.db.models import Count
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from images import response_cache
+    from images.models import Image, Comment
+
+    setup_test_environment()
+    logging.disable(logging.CRITICAL)
+    config = apps.get_app_config('images')
+    viral_id = Comment.objects.values('image_id').annotate(n=Count('id')).order_by('-n').values_list('image_id', flat=True).first()
+    image_ids = [viral_id] + list(Image.objects.exclude(pk=viral_id).order_by('-id').values_list('id', flat=True)[:args.images - 1])
+
+    # Zipf-like: the i-th most popular url gets weight 1/i
+    urls = [f'/image/{image_id}' for image_id in image_ids] + [f'/images/?page={page}' for page in range(1, 21)]
+    rng = random.Random(args.seed)
+    rng.shuffle(urls)
+    weights = [1 / rank for rank in range(1, len(urls) + 1)]
+    comment_url = f'/image/{viral_id}/comments'
+    client = Client()
+
+    print(f'{settings.CACHES[config.response_cache_alias]["BACKEND"].rsplit(".", 1)[-1]}, '
+          f'{args.requests} requests, a comment every {args.write_every}')
+    print(f'{"mode":<12} {"hit ratio":>10} {"p50":>10} {"p99":>10}')
+    try:
+        for mode in ('off', 'cached', 'etags'):
+            config.response_cache_enabled = mode != 'off'
+            response_cache.get_cache().clear()
+            response_cache.reset_counters()
+            p50, p99 = replay(client, urls, weights, comment_url, args.requests, args.write_every, mode == 'etags', args.seed)
+            hit_ratio = response_cache.stats()['hit_ratio']
+            print(f'{mode:<12} {hit_ratio:>10.1%} {p50:>8.2f}ms {p99:>8.2f}ms')
+    finally:
+        # Leave the benchmark database as it was
+        for comment in Comment.objects.filter(image_id=viral_id, content__startswith='replayed comment '):
+            comment.delete()
+
+if __name__ == '__main__':
+    main()
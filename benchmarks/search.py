@@ -0,0 +1,82 @@
+"""
+Time to fetch the first page (10) of search results with the search_vector GIN index
+(GET /images/search: ranked, best first; ranking every match, and only the newest
+search_max_ranked) against the naive scan of descriptions with
+icontains (LIKE, unranked), at growing table sizes.
+
+Descriptions are 12 words drawn from a 100,000 word vocabulary (w000001 to w100000)
+with a Zipf-like distribution, so w000001 is in half the descriptions and w050000 in
+a handful.  The table
+lives in a separate `benchmark_search` database that is kept and grown between runs.
+
+    python -m benchmarks.search --sizes 1000000 10000000
+"""
+
+import argparse
+import time
+
+from . import setup_django, use_benchmark_database, timed_median
+
+VOCABULARY = 100_000
+QUERIES = ['w050000', 'w001000', 'w000030', 'w000001', 'w000030 w001000']
+
+def populate(rows):
+    from django.db import connection
+    from images.models import Image
+
+    existing = Image.objects.count()
+    if existing >= rows:
+        return
+    print(f'generating {rows - existing} images (table had {existing})...')
+    started = time.perf_counter()
+    with connection.cursor() as cursor:
+        # Loading is much faster without the GIN index; it's rebuilt below
+        cursor.execute('DROP INDEX IF EXISTS images_image_search_idx')
+        cursor.execute('''
+            INSERT INTO images_image (file, description, analyzed_at, created_at, status, content_hash, comment_count, search_vector)
+            SELECT 'images/search-' || g || '.jpg', to_jsonb(d.text), now(), now(), 'analyzed', '', 0,
+                   setweight(to_tsvector('english', d.text), 'A')
+            FROM generate_series(%s, %s) AS g
+            CROSS JOIN LATERAL (
+                SELECT string_agg('w' || lpad(floor(exp(random() * ln(%s)))::int::text, 6, '0'), ' ') AS text
+                FROM generate_series(1, 12) WHERE g > 0
+            ) AS d
+        ''', [existing + 1, rows, VOCABULARY])
+        cursor.execute('CREATE INDEX images_image_search_idx ON images_image USING gin (search_vector)')
+        cursor.execute('ANALYZE images_image')
+    print(f'generated in {time.perf_counter() - started:.1f}s')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-ranked', type=int, nargs='+', default=[0, 10000],
+                        help='search_max_ranked values to time (0 ranks every match)')
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database('benchmark_search')
+    from django.apps import apps
+    from django.contrib.postgres.search import SearchQuery
+    from images.models import Image
+    from images.pagination import KeysetPaginator
+    from images.search import search
+
+    config = apps.get_app_config('images')
+    print(f'{"rows":>10} {"query":<16} {"matches":>9} {"LIKE":>10}' + ''.join(f' {f"GIN/{n}":>12}' for n in args.max_ranked))
+    for rows in sorted(args.sizes):
+        populate(rows)
+        for text in QUERIES:
+            matches = Image.objects.filter(search_vector=SearchQuery(text, search_type='websearch', config='english')).count()
+            like = Image.objects.all()
+            for word in text.split():
+                like = like.filter(description__icontains=word)
+            like_ms = timed_median(lambda: list(like[:10]), args.repeat)
+            gin_ms = []
+            for max_ranked in args.max_ranked:
+                config.search_max_ranked = max_ranked
+                gin_ms.append(timed_median(lambda: KeysetPaginator(search(text), 'search_key', 10).page(''), args.repeat))
+            print(f'{rows:>10} {text:<16} {matches:>9} {like_ms:>8.1f}ms' + ''.join(f' {ms:>10.1f}ms' for ms in gin_ms))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Time to produce a thumbnail of a generated 12 MP photo (or the image paths given on
+the command line) at each of thumbnail_widths: rendering it without and with JPEG
+draft decoding, and serving it once it is in the thumbnail cache.
+
+    python -m benchmarks.thumbnails [--repeat N] [image ...]
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from . import setup_django
+from .preprocess import make_photo
+
+def render_without_draft(path, width, pil_format, quality):
+    # thumbnails.render as a plain resize: the full image is decoded first
+    from PIL import Image as PILImage, ImageOps
+    with PILImage.open(path) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.resize((width, max(1, round(img.height * width / img.width))), PILImage.LANCZOS)
+        buffer = io.BytesIO()
+        img.convert('RGB').save(buffer, format=pil_format, quality=quality)
+        return buffer.getvalue()
+
+def timed_ms(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.apps import apps
+    from django.test import override_settings
+    from images import thumbnails
+    from images.models import Image
+
+    config = apps.get_app_config('images')
+    with tempfile.TemporaryDirectory() as workdir, override_settings(MEDIA_ROOT=workdir):
+        paths = args.images or [make_photo(workdir, 'photo-12mp.jpg', (4000, 3000))]
+
+        print(f'{"image":<20} {"width":>6} {"no draft ms":>12} {"render ms":>10} {"cached ms":>10} {"bytes":>8}')
+        for path in paths:
+            with open(path, 'rb') as image_file:
+                content_hash = hashlib.sha256(image_file.read()).hexdigest()
+            image = Image(file=os.path.relpath(path, workdir), content_hash=content_hash)
+            for width in config.thumbnail_widths:
+                plain_ms = timed_ms(lambda: render_without_draft(path, width, 'WEBP', config.thumbnail_quality), args.repeat)
+                render_ms = timed_ms(lambda: thumbnails.render(path, width, 'WEBP'), args.repeat)
+                thumb = thumbnails.get_thumbnail(image, width, 'webp')
+                cached_ms = timed_ms(lambda: thumbnails.get_thumbnail(image, width, 'webp'), args.repeat)
+                size = os.path.getsize(thumb.path)
+                print(f'{os.path.basename(path):<20} {width:>6} {plain_ms:>12.1f} {render_ms:>10.1f} {cached_ms:>10.3f} {size:>8}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Latency, bytes read and written, and peak traced memory of POST /analyze-image with a
+20 MB image, parsed by Django's default upload handlers (a temporary file, then a full
+Pillow open by ImageField, then a copy into MEDIA_ROOT) against ImageUploadHandler, which
+streams the upload straight to its place in storage.  Bytes are the process's read and
+write syscalls (rchar/wchar in /proc/self/io), so they include the page cache.
+
+Images are queued rather than analyzed, and removed after each run.  Uses the kept
+`benchmark_images` database.
+
+    python -m benchmarks.uploads --megabytes 20 --repeat 5
+"""
+
+import argparse
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+
+from . import setup_django, use_benchmark_database, percentile
+
+def io_counters() -> dict:
+    with open('/proc/self/io') as counters:
+        return {name: int(value) for name, value in (line.split(': ') for line in counters)}
+
+def noise_png(megabytes: int) -> bytes:
+    # Random pixels don't compress, so the PNG is about as big as its pixels
+    from PIL import Image as PILImage
+    side = int((megabytes * 1024 * 1024 / 3) ** 0.5)
+    output = io.BytesIO()
+    PILImage.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(output, format='PNG', compress_level=0)
+    return output.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--megabytes', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    use_benchmark_database()
+    import logging
+    from django.apps import apps
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from django.test import Client, override_settings
+    from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+    from django.test.utils import setup_test_environment
+    from images.models import Image
+
+    setup_test_environment()
+    logging.disable(logging.CRITICAL)
+    config = apps.get_app_config('images')
+    config.analyze_async = True
+    config.upload_max_bytes = max(config.upload_max_bytes, (args.megabytes + 5) * 1024 * 1024)
+    client = Client()
+    image = noise_png(args.megabytes)
+    body = encode_multipart(BOUNDARY, {'file': SimpleUploadedFile('noise.png', image, content_type='image/png')})
+
+    print(f'{len(image) / 1e6:.1f}MB image')
+    print(f'{"handler":<10} {"p50":>9} {"read":>9} {"written":>9} {"peak memory":>12}')
+    for streaming in (False, True):
+        config.upload_streaming_enabled = streaming
+        samples, reads, writes, peaks = [], [], [], []
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for _ in range(args.repeat):
+                before = io_counters()
+                tracemalloc.start()
+                started = time.perf_counter()
+                response = client.post('/analyze-image', body, content_type=MULTIPART_CONTENT)
+                samples.append((time.perf_counter() - started) * 1000)
+                peaks.append(tracemalloc.get_traced_memory()[1] / 1e6)
+                tracemalloc.stop()
+                after = io_counters()
+                assert response.status_code == 202, response.content
+                reads.append((after['rchar'] - before['rchar']) / 1e6)
+                writes.append((after['wchar'] - before['wchar']) / 1e6)
+                Image.objects.filter(pk=response.json()['id']).delete()
+        name = 'streaming' if streaming else 'default'
+        print(f'{name:<10} {percentile(samples, 50):>7.0f}ms {percentile(reads, 50):>7.1f}MB '
+              f'{percentile(writes, 50):>7.1f}MB {percentile(peaks, 50):>10.1f}MB')
+
+if __name__ == '__main__':
+    main()
@@ -13,4 +13,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'edLight.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from images.openai_adapter import close_async_session  # noqa: E402 (needs the apps loaded)
+
+async def application(scope, receive, send):
+    """
+    Django, plus the lifespan protocol (which Django doesn't speak) so the pooled
+    OpenAI session of the server's event loop is closed on shutdown.
+    """
+    if scope['type'] != 'lifespan':
+        return await django_application(scope, receive, send)
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_session()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
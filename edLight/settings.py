@@ -4,6 +4,7 @@ Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'drf_spectacular'
 ]
@@ -82,6 +84,41 @@ DATABASES = {
 
 FIXTURE_DIRS = ['./fixtures']
 
+# Caches
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# 'responses' holds the image endpoints' cached responses and their versions.  It has to be
+# shared by the web server and the analysis worker, and it is written on every miss and version
+# bump, so the default is the redis service (O(1) writes).  The file backend lists its whole
+# directory to cull on every write, so it only suits small caches
+
+RESPONSE_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'redis')
+RESPONSE_CACHE_LOCATIONS = {
+    'locmem': 'responses',
+    'file': str(BASE_DIR / 'cache' / 'responses'),
+    'redis': 'redis://cache:6379',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': RESPONSE_CACHE_BACKENDS[RESPONSE_CACHE_BACKEND],
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', RESPONSE_CACHE_LOCATIONS[RESPONSE_CACHE_BACKEND]),
+    },
+}
+if RESPONSE_CACHE_BACKEND != 'redis':
+    CACHES['responses']['OPTIONS'] = {'MAX_ENTRIES': 50000}
+# Test runs get their own in-memory cache, so they need no cache server and leave no files behind
+if sys.argv[1:2] == ['test']:
+    CACHES['responses'] = {'BACKEND': RESPONSE_CACHE_BACKENDS['locmem'], 'LOCATION': 'test-responses'}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -3,18 +3,25 @@ Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer
 """
 
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.generic.base import RedirectView
 from django.conf import settings
-from django.conf.urls.static import static
+import re
 from images import views as images_views
 
 urlpatterns = [
     path('', RedirectView.as_view(url='images/')),
     path('admin/', admin.site.urls),
     path('images/', images_views.index, name="image_list"),
+    path('images/search', images_views.search, name="image_search"),
+    path('images/tags', images_views.tags, name="image_tags"),
+    path('images/export', images_views.export_ndjson, name="image_export"),
     path('analyze-image', images_views.ingest_image, name="analize-image"),
+    path('analyze-image/async', images_views.ingest_image_async, name="analyze-image-async"),
     # path('images/', include("images.urls")),
     path('image/<int:image_id>', images_views.show_with_comments, name="image_detail"),
     path('image/<int:image_id>/comments', images_views.comments, name="add_comment"),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    path('image/<int:image_id>/thumb', images_views.thumbnail, name="image_thumbnail"),
+    path('comments', images_views.comment_batch, name="comment_batch"),
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), images_views.serve_media, name="media"),
+]
@@ -3,14 +3,27 @@ Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer
 """
 
 from .forms import ImageForm, CommentForm
-from .models import Image, Comment
-from datetime import datetime
-from .describers import make_image_describer, ImageDescriberError
-from .serializers import CommentSerializer
-from django.core.paginator import Paginator, EmptyPage
+from .models import Image, Comment, AnalysisJob
+from datetime import timedelta
+from .describers import make_image_describer, make_async_image_describer, ImageDescriberError
+from .pagination import KeysetPaginator
+from .counters import CountedPaginator
+from . import description_cache
+from . import fast_json
+from . import serializers
+from .search import update_search_vectors
+from .response_cache import bump_images
+from asgiref.sync import sync_to_async
+from django.core.paginator import EmptyPage
 from django.apps import apps
-from django.http import Http404
+from django.db import transaction
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import Case, F, Func, OuterRef, Q, Value, When
+from django.utils import timezone
+import asyncio
 import logging
+import weakref
+from typing import Union
 
 def store_and_analyze_image(form: ImageForm) -> Image:
     imageModel = form.save()
@@ -18,30 +31,230 @@ def store_and_analyze_image(form: ImageForm) -> Image:
 
     return imageModel
 
-def analyze_image(image: Image) -> Image:
+def analyze_image(image: Image, commit: bool = True) -> Image:
     """
     Uses a "describer" to get the a description.
+    Descriptions are cached by image content, so identical uploads are only described once.
     If None is returned analysis was unsuccessful and the image has not yet been analyzed.
+    With commit=False the image is updated but not saved, so callers can bulk_update many at once.
     """ 
     logging.debug('actions.analyze_image')
     describer = make_image_describer()
     logging.debug(f'using describer: {describer}')
 
-    description = describer.describe_image(image.file.path)
-    image.description = description
-    image.analyzed_at = datetime.now()
-    image.save()
-    logging.debug('analyzed image')
+    params = describer.cache_params() if description_cache.enabled() else None
+    description = _cached_description(image, params)
+    if description is None:
+        description = describer.describe_image(image.file.path, image.content_hash or None)
+        _remember_description(image, params, description, describer)
+
+    return _save_description(image, description, commit)
+
+def analyze_images(images: list, batch_size: Union[int, None] = None, commit: bool = True) -> dict:
+    """
+    analyze_image for many images.  Images without a cached description are described
+    `batch_size` (default analysis_batch_size) at a time, one request per batch.
+    Descriptions cached with either the single-image or the batch prompt are reused, and
+    new ones are cached under the prompt that made them.
+    Returns the error for each image that couldn't be analyzed, keyed by image id;
+    the rest are saved as analyzed (or, with commit=False, only updated).
+    """
+    if batch_size is None:
+        batch_size = apps.get_app_config('images').analysis_batch_size
+    batch_size = max(1, batch_size)
+    describer = make_image_describer()
+    cached = description_cache.enabled()
+    single_params = describer.cache_params() if cached else None
+    batch_params = describer.batch_cache_params() if cached else None
+
+    errors = {}
+    pending = []
+    for image in images:
+        description = _cached_description(image, single_params)
+        if description is None and batch_params != single_params:
+            description = _cached_description(image, batch_params)
+        if description is None:
+            pending.append(image)
+        else:
+            _save_description(image, description, commit)
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        try:
+            if len(batch) == 1:
+                descriptions = [describer.describe_image(batch[0].file.path, batch[0].content_hash or None)]
+                params = single_params
+            else:
+                descriptions = describer.describe_images([image.file.path for image in batch],
+                                                          [image.content_hash or None for image in batch])
+                params = batch_params if getattr(descriptions, 'batched', True) else single_params
+        except ImageDescriberError as e:
+            errors.update((image.id, e) for image in batch)
+            continue
+        for image, description in zip(batch, descriptions):
+            try:
+                _remember_description(image, params, description, describer)
+            except ImageDescriberError as e:
+                errors[image.id] = e
+                continue
+            _save_description(image, description, commit)
+
+    return errors
+
+async def aanalyze_image(image: Image) -> Image:
+    """
+    analyze_image for async views.  At most async_analysis_concurrency descriptions
+    are requested at once per event loop; the rest wait their turn.
+    """
+    logging.debug('actions.aanalyze_image')
+    describer = make_async_image_describer()
+
+    params = describer.cache_params() if description_cache.enabled() else None
+    description = await sync_to_async(_cached_description)(image, params)
+    if description is None:
+        async with _analysis_slots():
+            description = await describer.describe_image(image.file.path, image.content_hash or None)
+        await sync_to_async(_remember_description)(image, params, description, describer)
+
+    return await sync_to_async(_save_description)(image, description)
+
+_async_analysis_semaphores = weakref.WeakKeyDictionary()
+
+def _analysis_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _async_analysis_semaphores:
+        _async_analysis_semaphores[loop] = asyncio.Semaphore(apps.get_app_config('images').async_analysis_concurrency)
+    return _async_analysis_semaphores[loop]
+
+def _cached_description(image: Image, params):
+    if not params:
+        return None
+    if not image.content_hash:
+        image.content_hash = description_cache.hash_file(image.file)
+    description = description_cache.get(image.content_hash, params)
+    logging.debug(f'description cache {"hit" if description is not None else "miss"} for {image.content_hash}')
+    return description
+
+def _remember_description(image: Image, params, description, describer):
+    if description is None:
+        raise ImageDescriberError(f'{describer} returned no description')
+    if params:
+        description_cache.put(image.content_hash, params, description)
+
+# Fields analysis sets; what a bulk_update of analyzed images has to write
+ANALYSIS_FIELDS = ['description', 'analysis', 'analyzed_at', 'status', 'content_hash']
+
+def split_analysis(description) -> tuple:
+    """
+    The description text and the structured analysis (or None) in a describer's result.
+    """
+    if isinstance(description, dict):
+        return description['description'], {key: value for key, value in description.items() if key != 'description'}
+    return description, None
+
+def _save_description(image: Image, description, commit: bool = True) -> Image:
+    image.description, image.analysis = split_analysis(description)
+    image.analyzed_at = timezone.now()
+    image.status = Image.Status.ANALYZED
+    if commit:
+        image.save()
+        logging.debug('analyzed image')
     return image
-    
+
+def enqueue_analysis(image: Image) -> AnalysisJob:
+    """
+    Queue an image for the analysis_worker command instead of analyzing it inline.
+    """
+    return AnalysisJob.objects.create(
+        image=image,
+        max_attempts=apps.get_app_config('images').analysis_max_attempts
+    )
+
+def claim_analysis_jobs(worker_id: str, limit: int) -> list:
+    """
+    Lock and mark up to `limit` due jobs as running for `worker_id`.
+    Jobs left running longer than the lease (e.g. by a killed worker) are claimed again.
+    Rows locked by another worker are skipped, so several workers can share the table.
+    """
+    now = timezone.now()
+    lease = timedelta(seconds=apps.get_app_config('images').analysis_job_lease)
+    due = (
+        Q(status=AnalysisJob.Status.QUEUED, run_after__lte=now)
+        | Q(status=AnalysisJob.Status.RUNNING, locked_at__lt=now - lease)
+    )
+    with transaction.atomic():
+        job_ids = list(
+            AnalysisJob.objects.select_for_update(skip_locked=True)
+            .filter(due)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        AnalysisJob.objects.filter(id__in=job_ids).update(
+            status=AnalysisJob.Status.RUNNING,
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1
+        )
+
+    return list(AnalysisJob.objects.filter(id__in=job_ids).select_related('image').order_by('run_after', 'id'))
+
+def run_analysis_job(job: AnalysisJob) -> AnalysisJob:
+    """
+    Analyze the job's image.  Failures are retried with an exponential delay until
+    the job runs out of attempts, at which point the image is marked as failed.
+    """
+    image = job.image
+    Image.objects.filter(pk=image.pk).update(status=Image.Status.PROCESSING)
+    bump_images([image.pk])
+    try:
+        analyze_image(image)
+    except Exception as e:
+        return _finish_analysis_job(job, e)
+    return _finish_analysis_job(job)
+
+def run_analysis_jobs(jobs: list, batch_size: Union[int, None] = None) -> list:
+    """
+    run_analysis_job for several jobs, with their images described in batches (see analyze_images).
+    """
+    Image.objects.filter(pk__in=[job.image_id for job in jobs]).update(status=Image.Status.PROCESSING)
+    bump_images([job.image_id for job in jobs])
+    try:
+        errors = analyze_images([job.image for job in jobs], batch_size)
+    except Exception as e:
+        errors = {job.image_id: e for job in jobs}
+    return [_finish_analysis_job(job, errors.get(job.image_id)) for job in jobs]
+
+def _finish_analysis_job(job: AnalysisJob, error: Union[Exception, None] = None) -> AnalysisJob:
+    image = job.image
+    if error is not None:
+        logging.warning(f'analysis job {job.id} for Image {image.id} failed (attempt {job.attempts}): {error}')
+        job.last_error = str(error)
+        if job.attempts >= job.max_attempts:
+            job.status = AnalysisJob.Status.FAILED
+            Image.objects.filter(pk=image.pk).update(status=Image.Status.FAILED)
+            bump_images([image.pk])
+        else:
+            delay = apps.get_app_config('images').analysis_retry_delay * 2 ** (job.attempts - 1)
+            job.status = AnalysisJob.Status.QUEUED
+            job.run_after = timezone.now() + timedelta(seconds=delay)
+            Image.objects.filter(pk=image.pk).update(status=Image.Status.PENDING)
+            bump_images([image.pk])
+    else:
+        job.status = AnalysisJob.Status.DONE
+        job.last_error = ''
+
+    job.locked_by = ''
+    job.locked_at = None
+    job.save()
+    return job
 
 def get_paginated_comments(image: Image, current_page: int=1) -> dict:
     try:
-        comments = image.comment_set.all().order_by('created_at')
-        paginator = Paginator(comments, apps.get_app_config('images').comment_page_size)
-        comment_page = CommentSerializer(paginator.page(current_page), many=True)
+        comments = image.comment_set.all().order_by('created_at', 'id')
+        paginator = CountedPaginator(comments, apps.get_app_config('images').comment_page_size, count=image.comment_count)
+        comment_page = paginator.page(current_page)
         return {
-            'data': comment_page.data,
+            'data': fast_json.comments(comment_page.object_list),
             'num_pages': paginator.num_pages,
             'current_page': current_page
         }
@@ -49,7 +262,99 @@ def get_paginated_comments(image: Image, current_page: int=1) -> dict:
         e.num_pages = paginator.num_pages
         raise e
 
+def get_comment_cursor_page(image: Image, cursor: str = '', with_total: bool = False) -> dict:
+    """
+    A page of the image's comments in (created_at, id) order, addressed by cursor
+    rather than page number.  The comments are only counted when `with_total` is set.
+    Raises InvalidCursor for a cursor that wasn't issued by this endpoint.
+    """
+    paginator = KeysetPaginator(image.comment_set.all(), 'created_at', apps.get_app_config('images').comment_page_size)
+    page = paginator.page(cursor)
+    comment_page = {
+        'data': fast_json.comments(page.items),
+        'next': page.next,
+        'prev': page.prev,
+    }
+    if with_total:
+        comment_page['total'] = image.comment_count
+    return comment_page
+
+def embed_comments(images: list, count: int) -> list:
+    """
+    Add the last `count` comments (newest first) and the comment total to each of the
+    serialized `images`, as `comments: {data, total}`, with one query however many images
+    there are.  Each image's comments are read backwards off the (image, created_at, id)
+    index with a LIMIT, so an image with many comments costs no more than one with a few.
+    """
+    if not count or not images:
+        return images
+    newest = Comment.objects.filter(image_id=OuterRef('pk')).order_by('-created_at', '-id').values('id')[:count]
+    candidates = Image.objects.filter(id__in=[image['id'] for image in images]).annotate(
+        comment_id=Func(ArraySubquery(newest), function='unnest')
+    ).values('comment_id')
+    comments = Comment.objects.filter(id__in=candidates).annotate(
+        total=F('image__comment_count')
+    ).order_by('image_id', '-created_at', '-id')
+
+    embedded = {}
+    for comment in comments:
+        embedded.setdefault(comment.image_id, []).append(comment)
+    for image in images:
+        image_comments = embedded.get(image['id'], [])
+        image['comments'] = {
+            'data': fast_json.comments(image_comments),
+            'total': image_comments[0].total if image_comments else 0,
+        }
+    return images
+
 def add_comment(image: Image, form: CommentForm) -> Comment:
     comment = form.save()
 
-    return comment
\ No newline at end of file
+    return comment
+
+def add_comments(items: list) -> list:
+    """
+    Create a batch of comments, each a dict of `image_id` and `content`.  Every item is
+    validated first, the image ids are checked with one query, and the valid comments are
+    inserted with bulk_create, comment_batch_chunk_size rows at a time.  Returns a result
+    per item, in order: `{'status': 201, 'comment': {...}}`, or a 404 or 422 status with
+    `errors`.
+
+    bulk_create sends no signals, so the images' comment_count, search_vector and cached
+    responses are updated here, once per batch.
+    """
+    config = apps.get_app_config('images')
+    results, valid = [], []
+    for item in items:
+        serializer = serializers.CommentBatchItemSerializer(data=item)
+        if serializer.is_valid():
+            valid.append((len(results), serializer.validated_data))
+            results.append(None)
+        else:
+            results.append({'status': 422, 'errors': serializer.errors})
+
+    existing = set(Image.objects.filter(pk__in={data['image_id'] for _, data in valid}).values_list('id', flat=True))
+    new = []
+    for index, data in valid:
+        if data['image_id'] in existing:
+            new.append((index, Comment(image_id=data['image_id'], content=data['content'])))
+        else:
+            results[index] = {'status': 404, 'errors': {'image_id': [f'Image {data["image_id"]} not found']}}
+    if not new:
+        return results
+
+    comments = [comment for _, comment in new]
+    added = {}
+    for comment in comments:
+        added[comment.image_id] = added.get(comment.image_id, 0) + 1
+    with transaction.atomic():
+        Comment.objects.bulk_create(comments, batch_size=config.comment_batch_chunk_size)
+        Image.objects.filter(pk__in=added).update(
+            comment_count=F('comment_count') + Case(*(When(pk=pk, then=Value(n)) for pk, n in added.items()), default=Value(0))
+        )
+        update_search_vectors(added)
+        bump_images(added, global_version=False, comments=True)
+
+    for (index, _), comment in zip(new, fast_json.comments(comments)):
+        results[index] = {'status': 201, 'comment': comment}
+    return results
@@ -3,7 +3,8 @@ Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer
 """
 
 from django.contrib import admin
-from .models import Image, Comment
+from .models import Image, Comment, AnalysisJob
 
 admin.site.register(Image)
-admin.site.register(Comment)
\ No newline at end of file
+admin.site.register(Comment)
+admin.site.register(AnalysisJob)
\ No newline at end of file
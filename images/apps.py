@@ -9,4 +9,111 @@ class ImagesConfig(AppConfig):
     name = 'images'
     image_page_size = 10
     comment_page_size = 10
-    openai_api_key=os.getenv('OPENAI_API_KEY')
\ No newline at end of file
+    # Limits on GET /images/?embed_comments=N and ?ids=
+    embed_comments_max = 10
+    multi_get_max_ids = 100
+    # Seconds GET /images/tags counts are cached for (0 counts every time), and the most it returns
+    tag_counts_cache_ttl = 60
+    tag_counts_max = 100
+    # Seconds the image table's row count is cached for the list's num_pages (0 counts every time)
+    image_total_cache_ttl = 60
+    # Full-text search: the Postgres text search configuration, and how many of each
+    # image's newest comments are searchable along with its description
+    search_config = 'english'
+    search_comments_max = 100
+    # Matches ranked per search, newest first (0 ranks them all)
+    search_max_ranked = 10000
+    # POST /comments takes at most comment_batch_max comments, inserted comment_batch_chunk_size rows per INSERT
+    comment_batch_max = 10000
+    comment_batch_chunk_size = 1000
+    # Exports read this many rows per round trip and write blocks of about this many bytes.
+    # Incremental exports overlap by export_since_overlap seconds, to catch slow transactions
+    export_chunk_size = 2000
+    export_block_size = 64 * 1024
+    export_since_overlap = 60
+    # Read endpoints build JSON from values() rows and encode it with orjson instead of DRF serializers
+    fast_json_enabled = True
+    # GET responses for images are cached in this cache (see CACHES) until the images change
+    response_cache_enabled = True
+    response_cache_alias = 'responses'
+    response_cache_ttl = 24 * 60 * 60
+    openai_api_key=os.getenv('OPENAI_API_KEY')
+    openai_api_base = os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')
+
+    # Pooled HTTP session used for OpenAI requests (timeouts in seconds)
+    openai_pool_size = 10
+    openai_connect_timeout = 5
+    openai_read_timeout = 60
+    openai_max_retries = 3
+    openai_backoff_base = 1.0
+    openai_backoff_max = 30.0
+    # Connections kept by the async (aiohttp) session, and analyses one ASGI process runs at once
+    openai_async_pool_size = 100
+    async_analysis_concurrency = 200
+    # Bytes of an image base64 encoded at a time while a request body is streamed
+    openai_stream_block_size = 192 * 1024
+    # Client-side pacing to the account's OpenAI rate limits (0 means no limit).  Requests
+    # queue instead of failing; 429s are retried up to rate_limit_max_throttles times
+    rate_limit_enabled = True
+    rate_limit_rpm = int(os.getenv('OPENAI_RPM_LIMIT', '500'))
+    rate_limit_tpm = int(os.getenv('OPENAI_TPM_LIMIT', '300000'))
+    rate_limit_max_concurrency = 32
+    rate_limit_max_throttles = 10
+
+    # Analysis runs in the analysis_worker command unless analyze_async is False
+    analyze_async = True
+    analysis_workers = 4
+    analysis_max_attempts = 5
+    analysis_retry_delay = 30
+    analysis_job_lease = 600
+    # Images described per OpenAI request by analyze_images and the worker's --batch-size
+    analysis_batch_size = 1
+
+    # Descriptions are reused for identical uploads; least recently used entries past the limit are
+    # evicted every description_cache_evict_interval new entries (per process), not on every write
+    description_cache_enabled = True
+    description_cache_max_entries = 100000
+    description_cache_evict_interval = 1000
+
+    # GET /image/<id>/thumb renders these widths, cached on disk (least recently used evicted);
+    # the image list links the thumbnail_list_widths
+    thumbnail_widths = (64, 128, 256, 512, 1024)
+    thumbnail_default_width = 256
+    thumbnail_list_widths = (128, 256, 512)
+    thumbnail_quality = 80
+    thumbnail_max_age = 7 * 24 * 60 * 60
+    thumbnail_cache_dir = os.path.join('cache', 'thumbnails')
+    thumbnail_cache_max_bytes = 1024 * 1024 * 1024
+
+    # MEDIA_URL is served by the serve_media view with ranges and conditional GETs.  Content-addressed
+    # files never change, so they're cached for a year.  media_offload leaves sending files to the
+    # proxy in front: 'x-accel-redirect' (nginx, an internal location at media_offload_prefix
+    # aliased to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile, lighttpd)
+    media_max_age = 60 * 60
+    media_immutable_max_age = 365 * 24 * 60 * 60
+    media_offload = os.getenv('MEDIA_OFFLOAD', '')
+    media_offload_prefix = '/protected-media/'
+
+    # Image files are named by content hash under images/ab/cd/ and stored once however often
+    # they're uploaded (see images.storage); False keeps the upload names in one directory
+    content_addressed_storage = True
+
+    # /analyze-image streams uploads into storage as they arrive, hashing them and reading the
+    # header of the first upload_sniff_bytes; larger or non-image uploads are stopped early
+    upload_streaming_enabled = True
+    upload_max_bytes = 25 * 1024 * 1024
+    upload_max_pixels = 50_000_000
+    upload_sniff_bytes = 256 * 1024
+
+    # Images are downscaled and re-encoded before upload; output is cached under MEDIA_ROOT
+    preprocess_max_side = 2048
+    preprocess_low_detail_side = 512
+    preprocess_target_bytes = 1_500_000
+    preprocess_quality = 85
+    preprocess_min_quality = 50
+    preprocess_cache_dir = os.path.join('cache', 'preprocessed')
+    preprocess_cache_max_bytes = 512 * 1024 * 1024
+
+    def ready(self):
+        # Connects the comment_count, image total, response version and search vector signal receivers
+        from . import counters, response_cache, search
@@ -0,0 +1,155 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import itertools
+import json
+import logging
+import os
+from typing import Iterable, Union
+from django.db import transaction
+from django.utils import timezone
+from .models import Image, AnalysisJob
+from .actions import split_analysis
+from .openai_adapter import OpenAiAdapter, StreamedPayload, parse_analysis
+from .response_cache import bump_images
+from .search import update_search_vectors
+
+# Limits on one input file for OpenAI's Batch API
+MAX_REQUESTS_PER_FILE = 50000
+MAX_BYTES_PER_FILE = 200 * 1024 * 1024
+CUSTOM_ID_PREFIX = 'image-'
+
+class BatchFileWriter:
+    """
+    Writes chat completion requests as Batch API JSONL lines, starting a new file
+    (name-2.jsonl, name-3.jsonl, ...) whenever the next line would break a per-file limit.
+    Image data is streamed from disk into the file, so memory stays flat.
+    """
+    def __init__(self, path: str, max_requests: int = MAX_REQUESTS_PER_FILE, max_bytes: int = MAX_BYTES_PER_FILE,
+                 block_size: int = 192 * 1024):
+        self.path = path
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.paths = []
+        self._file = None
+        self._requests = 0
+        self._bytes = 0
+
+    def write(self, custom_id: str, payload: StreamedPayload):
+        head = json.dumps({'custom_id': custom_id, 'method': 'POST', 'url': '/v1/chat/completions'})
+        head = head[:-1].encode('utf-8') + b', "body": '
+        size = len(head) + len(payload) + 2
+        if self._file is None or self._requests >= self.max_requests or (self._requests and self._bytes + size > self.max_bytes):
+            self._next_file()
+        self._file.write(head)
+        for chunk in payload.iter_bytes(self.block_size):
+            self._file.write(chunk)
+        self._file.write(b'}\n')
+        self._requests += 1
+        self._bytes += size
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _next_file(self):
+        self.close()
+        if self.paths:
+            stem, extension = os.path.splitext(self.path)
+            path = f'{stem}-{len(self.paths) + 1}{extension}'
+        else:
+            path = self.path
+        self._file = open(path, 'wb')
+        self.paths.append(path)
+        self._requests = self._bytes = 0
+
+def export_unanalyzed(writer: BatchFileWriter, limit: Union[int, None] = None, chunk_size: int = 2000) -> dict:
+    """
+    Write a request for every image that hasn't been analyzed, read with a server-side
+    cursor `chunk_size` rows at a time.  The cursor is opened in a transaction, since
+    outside one Postgres copies the whole result (WITH HOLD) before returning its first
+    row.  Images whose file can't be prepared are skipped.
+    """
+    images = Image.objects.filter(analyzed_at__isnull=True).order_by('id').only('id', 'file', 'content_hash')
+    if limit:
+        images = images[:limit]
+    counts = {'exported': 0, 'skipped': 0}
+    with transaction.atomic():
+        for image in images.iterator(chunk_size=chunk_size):
+            try:
+                payload = OpenAiAdapter.make_streamed_image_prompt(image.file.path, image.content_hash or None)
+            except (OSError, ValueError) as e:
+                logging.warning(f'not exporting Image {image.id}: {e}')
+                counts['skipped'] += 1
+                continue
+            writer.write(f'{CUSTOM_ID_PREFIX}{image.id}', payload)
+            counts['exported'] += 1
+    return counts
+
+def parse_result(line: str) -> tuple:
+    """
+    (image id, description) from one line of a Batch API output file.  The
+    description is None when the request failed.
+    """
+    result = json.loads(line)
+    custom_id = result.get('custom_id') or ''
+    if not custom_id.startswith(CUSTOM_ID_PREFIX):
+        raise ValueError(f'unexpected custom_id {custom_id!r}')
+    image_id = int(custom_id[len(CUSTOM_ID_PREFIX):])
+    response = result.get('response') or {}
+    if result.get('error') or response.get('status_code') != 200:
+        return image_id, None
+    try:
+        return image_id, parse_analysis(response['body']['choices'][0]['message']['content'])
+    except (KeyError, IndexError, TypeError):
+        return image_id, None
+
+def import_results(lines: Iterable[str], chunk_size: int = 1000) -> dict:
+    """
+    Save the descriptions in a Batch API output file, `chunk_size` images per
+    transaction.  Queued analysis jobs for those images are marked done.
+    """
+    counts = {'imported': 0, 'failed': 0, 'unknown': 0, 'malformed': 0}
+
+    def results():
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                image_id, description = parse_result(line)
+            except ValueError as e:
+                logging.warning(f'skipping batch result: {e}')
+                counts['malformed'] += 1
+                continue
+            if description is None:
+                counts['failed'] += 1
+                continue
+            yield image_id, description
+
+    results = results()
+    while chunk := list(itertools.islice(results, chunk_size)):
+        now = timezone.now()
+        images = []
+        for image_id, description in chunk:
+            text, analysis = split_analysis(description)
+            images.append(Image(id=image_id, description=text, analysis=analysis, analyzed_at=now, status=Image.Status.ANALYZED))
+        with transaction.atomic():
+            updated = Image.objects.bulk_update(images, ['description', 'analysis', 'analyzed_at', 'status'])
+            update_search_vectors(image.id for image in images)
+            AnalysisJob.objects.filter(
+                image_id__in=[image.id for image in images],
+                status__in=[AnalysisJob.Status.QUEUED, AnalysisJob.Status.FAILED]
+            ).update(status=AnalysisJob.Status.DONE, last_error='')
+        bump_images(image.id for image in images)
+        counts['imported'] += updated
+        counts['unknown'] += len(images) - updated
+    return counts
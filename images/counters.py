@@ -0,0 +1,104 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import Image, Comment
+from .response_cache import bump_images
+
+IMAGE_TOTAL_KEY = 'images:image_total'
+
+class CountedPaginator(Paginator):
+    """
+    A Paginator told its object count up front, so it never runs COUNT(*).
+    """
+    def __init__(self, object_list, per_page, count: int, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.__dict__['count'] = count
+
+def image_total() -> int:
+    """
+    The number of images, cached for image_total_cache_ttl seconds and nudged as images
+    are created and deleted, so listing images doesn't count the table on every request.
+    """
+    ttl = apps.get_app_config('images').image_total_cache_ttl
+    if not ttl:
+        return Image.objects.count()
+    total = cache.get(IMAGE_TOTAL_KEY)
+    if total is None:
+        total = Image.objects.count()
+        cache.set(IMAGE_TOTAL_KEY, total, ttl)
+    return total
+
+def _adjust_image_total(delta: int):
+    try:
+        cache.incr(IMAGE_TOTAL_KEY, delta)
+    except ValueError:
+        # Not cached; the next image_total() counts
+        pass
+
+def comment_count_expression():
+    # The number of comments on the outer image, for annotate() and update()
+    counts = Comment.objects.filter(image=OuterRef('pk')).order_by().values('image').annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counts), Value(0))
+
+def find_miscounted(images=None):
+    """
+    Images whose comment_count doesn't match their comments.
+    """
+    images = Image.objects.all() if images is None else images
+    return images.annotate(actual_comments=comment_count_expression()).exclude(comment_count=F('actual_comments'))
+
+def repair_comment_counts(images=None) -> int:
+    """
+    Recount comment_count for the miscounted `images` (default: all); returns how many were fixed.
+    """
+    ids = list(find_miscounted(images).values_list('id', flat=True))
+    repaired = Image.objects.filter(id__in=ids).update(comment_count=comment_count_expression())
+    if ids:
+        # Comment totals are in the image and embedded comment responses
+        bump_images(ids, global_version=False, comments=True)
+    return repaired
+
+def _add_comments(image_id, delta: int):
+    # Never below zero, so a count that drifted low can't trip the check constraint
+    Image.objects.filter(pk=image_id).update(comment_count=Greatest(F('comment_count') + delta, 0))
+
+@receiver(pre_save, sender=Comment)
+def _remember_comment_image(sender, instance, raw, **kwargs):
+    # An edit (e.g. in the admin) may move a comment to another image
+    if not raw and instance.pk is not None:
+        instance._previous_image_id = Comment.objects.filter(pk=instance.pk).values_list('image_id', flat=True).first()
+
+@receiver(post_save, sender=Comment)
+def _count_saved_comment(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    if created:
+        _add_comments(instance.image_id, 1)
+        return
+    previous = getattr(instance, '_previous_image_id', None)
+    if previous is not None and previous != instance.image_id:
+        _add_comments(previous, -1)
+        _add_comments(instance.image_id, 1)
+
+@receiver(post_delete, sender=Comment)
+def _count_deleted_comment(sender, instance, origin=None, **kwargs):
+    if not Comment.deleted_with_image(origin):
+        _add_comments(instance.image_id, -1)
+
+@receiver(post_save, sender=Image)
+def _count_saved_image(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: _adjust_image_total(1))
+
+@receiver(post_delete, sender=Image)
+def _count_deleted_image(sender, instance, **kwargs):
+    transaction.on_commit(lambda: _adjust_image_total(-1))
@@ -7,31 +7,140 @@ from typing import Union
 import logging
 from django.conf import settings
 from django.apps import apps
-from .openai_adapter import OpenAiAdapter, OpenAIError
+from .openai_adapter import OpenAiAdapter, AsyncOpenAiAdapter, OpenAIError, BatchReplyError
 
 class ImageDescriberError(Exception):...
 
+class Descriptions(list):
+    """
+    What describe_images returns: a description (or None) per image.  `batched` is False
+    when the images were described one by one, with the single-image prompt.
+    """
+    def __init__(self, descriptions, batched: bool):
+        super().__init__(descriptions)
+        self.batched = batched
+
 class ImageDescriber(ABC):
     @abstractmethod
-    def describe_image(self, image_file: str) -> Union[str, None]:
+    def describe_image(self, image_file: str, content_hash: Union[str, None] = None) -> Union[str, dict, None]:
+        """
+        The image's description: a string, or a structured analysis (see openai_adapter.normalize_analysis).
+        `content_hash` is the image's stored hash, if known, so the file needn't be hashed again.
+        """
+
+    def cache_params(self) -> Union[dict, None]:
+        """
+        The model, prompt and max_tokens that produce descriptions, or None if they shouldn't be cached.
+        """
+        return None
+
+    def describe_images(self, image_files: list, content_hashes: Union[list, None] = None) -> list:
+        """
+        A description (or None) for each of `image_files`.  Describers that can describe
+        several images in one request override this; by default images go one by one.
+        """
+        content_hashes = content_hashes or [None] * len(image_files)
+        return Descriptions([self.describe_image(image_file, content_hash)
+                             for image_file, content_hash in zip(image_files, content_hashes)], batched=False)
+
+    def batch_cache_params(self) -> Union[dict, None]:
+        # cache_params() for descriptions made by describe_images
+        return self.cache_params()
+
+class AsyncImageDescriber(ABC):
+    """
+    ImageDescriber for async code paths (the ASGI views); describe_image is a coroutine.
+    """
+    @abstractmethod
+    async def describe_image(self, image_file: str, content_hash: Union[str, None] = None) -> Union[str, None]:
         ...
 
+    def cache_params(self) -> Union[dict, None]:
+        return None
+
 class DummyDescriber(ImageDescriber):
-    def describe_image(self, image_file: str) -> Union[str, None]:
+    def describe_image(self, image_file: str, content_hash: Union[str, None] = None) -> Union[str, None]:
         return f"A description for {image_file}"
 
 class OpenAIDescriber(ImageDescriber):
-    def describe_image(self, image_file: str) -> Union[str, None]:
+    def __init__(self):
+        self._adapter = None
+
+    @property
+    def adapter(self) -> OpenAiAdapter:
+        # Built on first use and reused; requests share the adapter module's pooled session
+        if self._adapter is None:
+            self._adapter = OpenAiAdapter()
+        return self._adapter
+
+    def cache_params(self) -> Union[dict, None]:
+        return OpenAiAdapter.prompt_params()
+
+    def batch_cache_params(self) -> Union[dict, None]:
+        return OpenAiAdapter.batch_prompt_params()
+
+    def describe_image(self, image_file: str, content_hash: Union[str, None] = None) -> Union[str, dict, None]:
         try:
-            adapter = OpenAiAdapter()
-            return adapter.prompt_image_description(image_file)
+            return self.adapter.prompt_image_description(image_file, content_hash)
         except OpenAIError as e:
-            logging.warn(e)
-            ImageDescriberError(message = str(e))
+            logging.warning(e)
+            raise ImageDescriberError(str(e)) from e
+
+    def describe_images(self, image_files: list, content_hashes: Union[list, None] = None) -> list:
+        """
+        Describe the images in one batch request.  If the reply can't be split into one
+        description per image, each image is described on its own instead; an image that
+        still fails gets None.
+        """
+        if len(image_files) > 1:
+            try:
+                return Descriptions(self.adapter.prompt_batch_descriptions(image_files, content_hashes), batched=True)
+            except OpenAIError as e:
+                logging.warning(e)
+                raise ImageDescriberError(str(e)) from e
+            except BatchReplyError as e:
+                logging.warning(f'{e}; describing {len(image_files)} images one by one')
+
+        descriptions = []
+        for image_file, content_hash in zip(image_files, content_hashes or [None] * len(image_files)):
+            try:
+                descriptions.append(self.describe_image(image_file, content_hash))
+            except ImageDescriberError:
+                descriptions.append(None)
+        return Descriptions(descriptions, batched=False)
+
+class AsyncDummyDescriber(AsyncImageDescriber):
+    async def describe_image(self, image_file: str, content_hash: Union[str, None] = None) -> Union[str, None]:
+        return DummyDescriber().describe_image(image_file)
+
+class AsyncOpenAIDescriber(AsyncImageDescriber):
+    def __init__(self):
+        self._adapter = None
+
+    @property
+    def adapter(self) -> AsyncOpenAiAdapter:
+        if self._adapter is None:
+            self._adapter = AsyncOpenAiAdapter()
+        return self._adapter
+
+    def cache_params(self) -> Union[dict, None]:
+        return AsyncOpenAiAdapter.prompt_params()
+
+    async def describe_image(self, image_file: str, content_hash: Union[str, None] = None) -> Union[str, dict, None]:
+        try:
+            return await self.adapter.prompt_image_description(image_file, content_hash)
+        except OpenAIError as e:
+            logging.warning(e)
+            raise ImageDescriberError(str(e)) from e
 
-    
 def make_image_describer():
     if apps.get_app_config('images').openai_api_key == '':
         return DummyDescriber()
     
-    return OpenAIDescriber()
\ No newline at end of file
+    return OpenAIDescriber()
+
+def make_async_image_describer():
+    if apps.get_app_config('images').openai_api_key == '':
+        return AsyncDummyDescriber()
+
+    return AsyncOpenAIDescriber()
@@ -0,0 +1,126 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import hashlib
+import threading
+from typing import Union
+from django.apps import apps
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+from .models import DescriptionCacheEntry
+
+_counters = {'hits': 0, 'misses': 0, 'added': 0}
+_counters_lock = threading.Lock()
+
+def hash_file(file) -> str:
+    """
+    SHA-256 of a Django File/UploadedFile, read chunk by chunk.
+    """
+    digest = hashlib.sha256()
+    file.open('rb')
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+def prompt_hash(params: dict) -> str:
+    return hashlib.sha256(params['prompt'].encode('utf-8')).hexdigest()
+
+def make_key(content_hash: str, params: dict) -> str:
+    """
+    The cache key for an image's content described with `params` (model, prompt and max_tokens).
+    """
+    parts = [content_hash, params['model'], prompt_hash(params), str(params['max_tokens'])]
+    return hashlib.sha256('|'.join(parts).encode('utf-8')).hexdigest()
+
+def enabled() -> bool:
+    return apps.get_app_config('images').description_cache_enabled
+
+def get(content_hash: str, params: dict) -> Union[str, None]:
+    """
+    The cached description or None.  A hit refreshes the entry's LRU position.
+    """
+    key = make_key(content_hash, params)
+    description = DescriptionCacheEntry.objects.filter(key=key).values_list('description', flat=True).first()
+    with _counters_lock:
+        _counters['hits' if description is not None else 'misses'] += 1
+    if description is not None:
+        DescriptionCacheEntry.objects.filter(key=key).update(hits=F('hits') + 1, last_used_at=timezone.now())
+    return description
+
+def put(content_hash: str, params: dict, description) -> DescriptionCacheEntry:
+    """
+    Store a description.  Every description_cache_evict_interval new entries, the least recently
+    used ones past the limit are evicted, so a write doesn't scan the table each time.
+    """
+    entry, created = DescriptionCacheEntry.objects.update_or_create(
+        key=make_key(content_hash, params),
+        defaults={
+            'content_hash': content_hash,
+            'model': params['model'],
+            'prompt_hash': prompt_hash(params),
+            'max_tokens': params['max_tokens'],
+            'description': description,
+            'last_used_at': timezone.now(),
+        }
+    )
+    if created:
+        with _counters_lock:
+            _counters['added'] += 1
+            due = _counters['added'] % max(1, apps.get_app_config('images').description_cache_evict_interval) == 0
+        if due:
+            evict()
+    return entry
+
+def evict(max_entries: Union[int, None] = None) -> int:
+    """
+    Delete the least recently used entries beyond `max_entries`.
+    """
+    if max_entries is None:
+        max_entries = apps.get_app_config('images').description_cache_max_entries
+    surplus = DescriptionCacheEntry.objects.order_by('-last_used_at', '-id').values('id')[max_entries:]
+    deleted, _ = DescriptionCacheEntry.objects.filter(id__in=surplus).delete()
+    return deleted
+
+def invalidate(content_hash: Union[str, None] = None) -> int:
+    """
+    Delete every entry, or just the entries for one image content.
+    """
+    entries = DescriptionCacheEntry.objects.all()
+    if content_hash:
+        entries = entries.filter(content_hash=content_hash)
+    deleted, _ = entries.delete()
+    return deleted
+
+def invalidate_stale(current_params: list) -> int:
+    """
+    Delete entries made with a model, prompt and max_tokens other than any of `current_params`
+    (e.g. the single-image and batch prompts), after the prompts in OpenAiAdapter change.
+    They can never be hit again.
+    """
+    current = Q(pk__in=[])
+    for params in current_params:
+        current |= Q(model=params['model'], prompt_hash=prompt_hash(params), max_tokens=params['max_tokens'])
+    deleted, _ = DescriptionCacheEntry.objects.exclude(current).delete()
+    return deleted
+
+def stats() -> dict:
+    """
+    Hit/miss counters for this process plus totals for the stored entries.
+    """
+    with _counters_lock:
+        hits, misses = _counters['hits'], _counters['misses']
+    totals = DescriptionCacheEntry.objects.aggregate(stored_hits=Sum('hits'))
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        'entries': DescriptionCacheEntry.objects.count(),
+        'stored_hits': totals['stored_hits'] or 0,
+    }
+
+def reset_counters():
+    with _counters_lock:
+        _counters['hits'] = _counters['misses'] = _counters['added'] = 0
@@ -0,0 +1,95 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import os
+import tempfile
+import threading
+from typing import Union
+from django.conf import settings
+
+class DiskCache:
+    """
+    Files kept under MEDIA_ROOT/<directory>, sharded by the first two characters of
+    their key.  Reads refresh a file's mtime, and writes prune the least recently
+    used files once the directory holds more than `max_bytes`.  Pruning walks the
+    directory, so it only runs after a tenth of max_bytes has been written.
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._prune_lock = threading.Lock()
+        self._written_since_prune = max_bytes // 10
+
+    @property
+    def root(self) -> str:
+        return os.path.join(settings.MEDIA_ROOT, self.directory)
+
+    def path(self, key: str, extension: str) -> str:
+        return os.path.join(self.root, key[:2], f'{key}.{extension}')
+
+    def get(self, key: str, extension: str) -> Union[str, None]:
+        path = self.path(key, extension)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, extension: str, data: bytes) -> str:
+        """
+        Atomically write `data` for `key`; concurrent writers of the same key are harmless.
+        """
+        path = self.path(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._written_since_prune += len(data)
+        if self._written_since_prune >= self.max_bytes // 10:
+            self.prune()
+        return path
+
+    def prune(self) -> int:
+        """
+        Delete least recently used files until the cache fits in max_bytes.  Returns the bytes freed.
+        """
+        if not self._prune_lock.acquire(blocking=False):
+            return 0
+        try:
+            self._written_since_prune = 0
+            entries, total = [], 0
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            freed = 0
+            for _, size, path in sorted(entries):
+                if total - freed <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                    freed += size
+                except FileNotFoundError:
+                    pass
+            return freed
+        finally:
+            self._prune_lock.release()
+
+    def size(self) -> int:
+        return sum(
+            os.path.getsize(os.path.join(dirpath, filename))
+            for dirpath, _, filenames in os.walk(self.root)
+            for filename in filenames
+        )
@@ -0,0 +1,256 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import asyncio
+from contextlib import contextmanager, asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import itertools
+import logging
+import re
+import threading
+import time
+from typing import Union
+from django.apps import apps
+
+class TokenBucket:
+    """
+    A budget of `per_minute` units that refills continuously.  A zero budget means unlimited.
+    """
+    def __init__(self, per_minute: float, clock=time.monotonic):
+        self.per_minute = per_minute
+        self.clock = clock
+        self.available = float(per_minute)
+        self.updated_at = clock()
+        self.paused_until = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self.available = min(self.per_minute, self.available + (now - self.updated_at) * self.per_minute / 60)
+        self.updated_at = now
+
+    def delay_for(self, amount: float) -> float:
+        """
+        Seconds until `amount` units can be spent (0 if they can be spent now).
+        """
+        if not self.per_minute:
+            return 0.0
+        self._refill()
+        pause = max(0.0, self.paused_until - self.clock())
+        # A request bigger than the whole budget waits for a full bucket rather than forever
+        shortfall = min(amount, self.per_minute) - self.available
+        return max(pause, shortfall * 60 / self.per_minute if shortfall > 0 else 0.0)
+
+    def consume(self, amount: float):
+        if self.per_minute:
+            self._refill()
+            self.available -= amount
+
+    def sync(self, remaining: float, reset_seconds: Union[float, None]):
+        """
+        Trust the upstream's view of what's left of the budget, from its rate limit headers.
+        """
+        if not self.per_minute:
+            return
+        self._refill()
+        self.available = min(self.available, remaining)
+        if remaining <= 0 and reset_seconds:
+            self.pause(reset_seconds)
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.available = min(self.available, 0.0)
+
+class Ticket:
+    # A caller's place in the dispatcher's queue, then its running request.
+    def __init__(self, number: int, tokens: int, enqueued_at: float):
+        self.number = number
+        self.tokens = tokens
+        self.enqueued_at = enqueued_at
+        self.started_at = None
+
+class RateLimitDispatcher:
+    """
+    Paces OpenAI requests to the account's requests-per-minute and tokens-per-minute
+    limits.  Callers queue in arrival order; the head of the queue starts when both
+    token buckets can pay for it and fewer than `concurrency` requests are running.
+    Concurrency adapts AIMD-style: +1 per `concurrency` clean responses, halved on a 429.
+    The buckets follow the upstream's x-ratelimit-* and Retry-After headers.
+    """
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int,
+                 min_concurrency: int = 1, clock=time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = float(max_concurrency)
+        self.clock = clock
+        self._condition = threading.Condition()
+        self._numbers = itertools.count()
+        self._queue = []
+        self._in_flight = 0
+        self._stats = {'started': 0, 'waited': 0, 'total_wait': 0.0, 'max_wait': 0.0, 'throttle_events': 0}
+
+    @contextmanager
+    def slot(self, tokens: int):
+        """
+        Block until the request may start, then yield its Ticket; report the response with finish().
+        """
+        ticket = self._enqueue(tokens)
+        try:
+            with self._condition:
+                while (delay := self._try_start(ticket)) > 0:
+                    self._condition.wait(delay)
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int):
+        """
+        slot() for coroutines.  Waiting polls instead of holding a thread per waiter.
+        """
+        ticket = self._enqueue(tokens)
+        try:
+            while True:
+                with self._condition:
+                    delay = self._try_start(ticket)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(min(delay, 0.05))
+        except BaseException:
+            self._abandon(ticket)
+            raise
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def finish(self, ticket: Ticket, status: int, headers=None, used_tokens: Union[int, None] = None):
+        """
+        Feed a response back: adapt concurrency, sync the buckets and settle the token estimate.
+        """
+        headers = headers or {}
+        with self._condition:
+            if status == 429:
+                self._stats['throttle_events'] += 1
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                # Nobody starts until the upstream says its window has reset
+                retry_after = _parse_duration(headers.get('Retry-After'))
+                self.requests.pause(1.0 if retry_after is None else retry_after)
+                logging.warning(f'OpenAI throttled us; concurrency is now {int(self.concurrency)}')
+            elif status < 400:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / max(1.0, self.concurrency))
+
+            if used_tokens is not None:
+                self.tokens.consume(used_tokens - ticket.tokens)
+            for bucket, name in ((self.requests, 'requests'), (self.tokens, 'tokens')):
+                remaining = headers.get(f'x-ratelimit-remaining-{name}')
+                if remaining is not None:
+                    try:
+                        bucket.sync(float(remaining), _parse_duration(headers.get(f'x-ratelimit-reset-{name}')))
+                    except ValueError:
+                        pass
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                **self._stats,
+                'queue_depth': len(self._queue),
+                'in_flight': self._in_flight,
+                'concurrency': int(self.concurrency),
+            }
+
+    def _enqueue(self, tokens: int) -> Ticket:
+        ticket = Ticket(next(self._numbers), tokens, self.clock())
+        with self._condition:
+            self._queue.append(ticket)
+        return ticket
+
+    def _try_start(self, ticket: Ticket) -> float:
+        # Called with the condition held.  Returns 0 once started, else a wait hint in seconds.
+        if self._queue[0] is not ticket or self._in_flight >= int(self.concurrency):
+            return 0.05
+        delay = max(self.requests.delay_for(1), self.tokens.delay_for(ticket.tokens))
+        if delay > 0:
+            return delay
+        self._queue.pop(0)
+        self.requests.consume(1)
+        self.tokens.consume(ticket.tokens)
+        self._in_flight += 1
+        ticket.started_at = self.clock()
+        wait = ticket.started_at - ticket.enqueued_at
+        self._stats['started'] += 1
+        self._stats['total_wait'] += wait
+        self._stats['max_wait'] = max(self._stats['max_wait'], wait)
+        if wait > 0.01:
+            self._stats['waited'] += 1
+        self._condition.notify_all()
+        return 0.0
+
+    def _abandon(self, ticket: Ticket):
+        with self._condition:
+            if ticket in self._queue:
+                self._queue.remove(ticket)
+            self._condition.notify_all()
+
+    def _release(self, ticket: Ticket):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+def parse_retry_after(value: Union[str, None]) -> Union[float, None]:
+    """
+    Seconds to wait according to a Retry-After header (delta-seconds or HTTP-date).
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+
+def _parse_duration(value) -> Union[float, None]:
+    """
+    Seconds in a Retry-After ("7" or an HTTP-date) or x-ratelimit-reset-* ("6m0s", "20ms") header.
+    """
+    parts = _DURATION_PART.findall(value or '')
+    if not parts:
+        return parse_retry_after(value)
+    scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher() -> Union[RateLimitDispatcher, None]:
+    """
+    The process-wide dispatcher, or None when rate limiting is switched off.
+    """
+    global _dispatcher
+    config = apps.get_app_config('images')
+    if not config.rate_limit_enabled:
+        return None
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = RateLimitDispatcher(
+                config.rate_limit_rpm, config.rate_limit_tpm, config.rate_limit_max_concurrency
+            )
+        return _dispatcher
+
+def reset_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        _dispatcher = None
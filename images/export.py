@@ -0,0 +1,96 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from datetime import datetime, timedelta
+import json
+from typing import AsyncIterator, Iterator, Optional
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime, parse_date
+
+from .fast_json import _datetime, _file_url, orjson
+from .models import Image, Comment
+
+IMAGE_FIELDS = ('id', 'file', 'description', 'analysis', 'status', 'analyzed_at', 'created_at', 'comment_count')
+COMMENT_FIELDS = ('id', 'image_id', 'content', 'created_at')
+
+def date_or_datetime(value: str) -> datetime:
+    when = parse_datetime(value)
+    if when is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'not a date: {value}')
+        when = datetime(day.year, day.month, day.day)
+    return timezone.make_aware(when) if timezone.is_naive(when) else when
+
+def records(since: Optional[datetime] = None, chunk_size: Optional[int] = None) -> Iterator[dict]:
+    """
+    Every image, then every comment, as dicts with a `type` of 'image' or 'comment', and
+    last an 'end' record with the counts and the `next_since` of an incremental export
+    continuing from this one.  With `since`, only images created or analyzed and comments
+    created since then.
+
+    Rows are read through server-side cursors `chunk_size` at a time, so memory stays flat
+    however big the tables are.  The cursors are opened in a transaction, since outside
+    one Postgres copies the whole result (WITH HOLD) before returning its first row.
+    """
+    config = apps.get_app_config('images')
+    chunk_size = chunk_size or config.export_chunk_size
+    # Rows written by transactions still open now can carry earlier timestamps
+    next_since = timezone.now() - timedelta(seconds=config.export_since_overlap)
+    images, comments = Image.objects.order_by(), Comment.objects.order_by()
+    if since is not None:
+        images = images.filter(Q(created_at__gte=since) | Q(analyzed_at__gte=since))
+        comments = comments.filter(created_at__gte=since)
+
+    url = _file_url()
+    counts = {'images': 0, 'comments': 0}
+    with transaction.atomic():
+        rows = images.values_list(*IMAGE_FIELDS).iterator(chunk_size=chunk_size)
+        for pk, name, description, analysis, status, analyzed_at, created_at, comment_count in rows:
+            counts['images'] += 1
+            yield {
+                'type': 'image', 'id': pk, 'file': url(name), 'description': description, 'analysis': analysis,
+                'status': status, 'analyzed_at': _datetime(analyzed_at), 'created_at': _datetime(created_at),
+                'comment_count': comment_count,
+            }
+        for pk, image_id, content, created_at in comments.values_list(*COMMENT_FIELDS).iterator(chunk_size=chunk_size):
+            counts['comments'] += 1
+            yield {'type': 'comment', 'id': pk, 'image_id': image_id, 'content': content, 'created_at': _datetime(created_at)}
+    yield {'type': 'end', **counts, 'next_since': _datetime(next_since)}
+
+def ndjson(records: Iterator[dict], compress: bool = False, block_size: Optional[int] = None) -> Iterator[bytes]:
+    """
+    `records` as newline delimited JSON, in blocks of about `block_size` bytes, and
+    gzip compressed as it goes with `compress`.
+    """
+    block_size = block_size or apps.get_app_config('images').export_block_size
+    dumps = orjson.dumps if orjson else lambda record: json.dumps(record, separators=(',', ':')).encode('utf-8')
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    block = bytearray()
+    for record in records:
+        block += dumps(record)
+        block += b'\n'
+        if len(block) >= block_size:
+            if data := (compressor.compress(block) if compressor else bytes(block)):
+                yield data
+            block.clear()
+    data = compressor.compress(block) + compressor.flush() if compressor else bytes(block)
+    if data:
+        yield data
+
+async def async_blocks(blocks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    `blocks` for a StreamingHttpResponse served over ASGI, which would otherwise read a
+    sync iterator into a list.  Blocks are made on one thread, where the cursors live.
+    """
+    next_block = sync_to_async(next, thread_sensitive=True)
+    while (block := await next_block(blocks, None)) is not None:
+        yield block
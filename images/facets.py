@@ -0,0 +1,50 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import hashlib
+import json
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import QuerySet
+
+# The lists in Image.analysis that can be filtered and counted
+FACETS = ('labels', 'objects')
+
+def filter_images(images: QuerySet, labels: list = (), objects: list = ()) -> QuerySet:
+    """
+    The `images` whose analysis has all of `labels` and all of `objects`, as one
+    containment (@>) test the jsonb_path_ops index on analysis answers.
+    """
+    wanted = {facet: [name.strip().lower() for name in names] for facet, names in zip(FACETS, (labels, objects)) if names}
+    return images.filter(analysis__contains=wanted) if wanted else images
+
+def facet_counts(images: QuerySet, limit: int) -> dict:
+    """
+    The `limit` most common labels and objects among `images`, with how many of them
+    have each: {'labels': [{'name': ..., 'count': ...}], 'objects': [...]}.  Counting
+    reads every matching image, so results are cached for tag_counts_cache_ttl seconds.
+    """
+    sql, params = images.order_by().values('analysis').query.sql_with_params()
+    ttl = apps.get_app_config('images').tag_counts_cache_ttl
+    key = 'images:facet_counts:' + hashlib.sha256(json.dumps([sql, params, limit], default=str).encode('utf-8')).hexdigest()
+    counts = cache.get(key) if ttl else None
+    if counts is None:
+        counts = {facet: _count(sql, params, facet, limit) for facet in FACETS}
+        if ttl:
+            cache.set(key, counts, ttl)
+    return counts
+
+def _count(sql: str, params: tuple, facet: str, limit: int) -> list:
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            SELECT name, count(*) FROM ({sql}) AS images
+            CROSS JOIN LATERAL jsonb_array_elements_text(
+                CASE WHEN jsonb_typeof(images.analysis -> %s) = 'array' THEN images.analysis -> %s ELSE '[]' END
+            ) AS name
+            GROUP BY name
+            ORDER BY count(*) DESC, name
+            LIMIT %s
+        ''', [*params, facet, facet, limit])
+        return [{'name': name, 'count': count} for name, count in cursor.fetchall()]
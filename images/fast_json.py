@@ -0,0 +1,83 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from typing import Union
+from django.apps import apps
+from django.db.models import QuerySet
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from .models import Image
+from .serializers import ImageSerializer, CommentSerializer
+from . import thumbnails
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# What ImageSerializer and CommentSerializer read, in their field order
+IMAGE_COLUMNS = ('id', 'file', 'description', 'analyzed_at', 'status', 'analysis', 'width', 'height', 'image_format', 'byte_size')
+COMMENT_COLUMNS = ('id', 'content', 'image_id', 'created_at')
+
+def enabled() -> bool:
+    return apps.get_app_config('images').fast_json_enabled
+
+def images(objects: Union[QuerySet, list]) -> list:
+    """
+    ImageSerializer(objects, many=True).data.  With fast_json_enabled a queryset is read
+    with values_list() and a list of Images is read directly, without the serializer.
+    """
+    if not enabled():
+        return ImageSerializer(objects, many=True).data
+    url = _file_url()
+    if isinstance(objects, QuerySet):
+        rows = objects.values_list(*IMAGE_COLUMNS)
+    else:
+        rows = ((image.id, image.file.name, image.description, image.analyzed_at, image.status, image.analysis,
+                 image.width, image.height, image.image_format, image.byte_size) for image in objects)
+    return [
+        {'id': pk, 'file': url(name), 'description': description, 'analyzed': analyzed_at is not None, 'status': status,
+         'analysis': analysis, 'width': width, 'height': height, 'image_format': image_format, 'byte_size': byte_size,
+         'thumbnails': thumbnails.urls(pk, name)}
+        for pk, name, description, analyzed_at, status, analysis, width, height, image_format, byte_size in rows
+    ]
+
+def image(image: Image) -> dict:
+    # ImageSerializer(image).data
+    return images([image])[0] if enabled() else ImageSerializer(image).data
+
+def comments(objects: Union[QuerySet, list]) -> list:
+    """
+    CommentSerializer(objects, many=True).data, read like images().
+    """
+    if not enabled():
+        return CommentSerializer(objects, many=True).data
+    if isinstance(objects, QuerySet):
+        rows = objects.values_list(*COMMENT_COLUMNS)
+    else:
+        rows = ((comment.id, comment.content, comment.image_id, comment.created_at) for comment in objects)
+    return [
+        {'id': pk, 'content': content, 'image_id': image_id, 'created_at': _datetime(created_at)}
+        for pk, content, image_id, created_at in rows
+    ]
+
+def response(data: dict, status: int = 200) -> HttpResponse:
+    """
+    A JsonResponse, encoded with orjson when it's installed and fast_json_enabled.
+    """
+    if orjson is None or not enabled():
+        return JsonResponse(data, status=status)
+    return HttpResponse(orjson.dumps(data), content_type='application/json', status=status)
+
+def _file_url():
+    # The url FileField gives, with the storage looked up once rather than per row
+    storage = Image._meta.get_field('file').storage
+    return lambda name: storage.url(name) if name else None
+
+def _datetime(value):
+    # DRF's ISO 8601 format, in the current time zone
+    if value is None:
+        return None
+    value = timezone.localtime(value).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
@@ -0,0 +1,102 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+import os
+import socket
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from images import actions
+from images.dispatcher import get_dispatcher
+
+class Command(BaseCommand):
+    help = 'Runs queued image analysis jobs with a bounded pool of worker threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=apps.get_app_config('images').analysis_workers,
+                            help='Maximum number of images analyzed at the same time')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once no due jobs are left instead of polling forever')
+        parser.add_argument('--batch-size', type=int, default=apps.get_app_config('images').analysis_batch_size,
+                            help='Images described per OpenAI request; each worker thread runs one batch at a time')
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help='Seconds between rate limit dispatcher stats lines (0 turns them off)')
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        batch_size = max(1, options['batch_size'])
+        worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.stdout.write(f'analysis worker {worker_id} started with concurrency {concurrency}')
+
+        in_flight = set()
+        stats_at = time.monotonic() + options['stats_interval']
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            try:
+                while True:
+                    free_slots = concurrency - len(in_flight)
+                    jobs = actions.claim_analysis_jobs(worker_id, free_slots * batch_size) if free_slots else []
+                    if batch_size == 1:
+                        for job in jobs:
+                            in_flight.add(executor.submit(self._run_job, job))
+                    else:
+                        for start in range(0, len(jobs), batch_size):
+                            in_flight.add(executor.submit(self._run_jobs, jobs[start:start + batch_size], batch_size))
+
+                    if not in_flight:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+
+                    done, in_flight = wait(in_flight, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                    for future in done:
+                        result = future.result()
+                        for job in result if isinstance(result, list) else [result]:
+                            self.stdout.write(f'job {job.id} for image {job.image_id}: {job.status}')
+
+                    if options['stats_interval'] and time.monotonic() >= stats_at:
+                        self._write_stats()
+                        stats_at = time.monotonic() + options['stats_interval']
+            except KeyboardInterrupt:
+                self.stdout.write('stopping; waiting for in-flight jobs to finish')
+                wait(in_flight)
+
+    def _write_stats(self):
+        dispatcher = get_dispatcher()
+        if dispatcher is None:
+            return
+        stats = dispatcher.stats()
+        mean_wait = stats['total_wait'] / stats['started'] if stats['started'] else 0.0
+        self.stdout.write(
+            f"openai: {stats['queue_depth']} queued, {stats['in_flight']} in flight "
+            f"(limit {stats['concurrency']}), {stats['started']} started, {stats['waited']} waited "
+            f"(mean {mean_wait:.2f}s, max {stats['max_wait']:.2f}s), {stats['throttle_events']} throttled"
+        )
+
+    def _run_jobs(self, jobs, batch_size):
+        try:
+            return actions.run_analysis_jobs(jobs, batch_size)
+        except Exception as e:
+            logging.exception(f'analysis jobs {[job.id for job in jobs]} crashed: {e}')
+            return jobs
+        finally:
+            connection.close()
+
+    def _run_job(self, job):
+        try:
+            return actions.run_analysis_job(job)
+        except Exception as e:
+            # run_analysis_job records describer failures itself; this is a last resort
+            logging.exception(f'analysis job {job.id} crashed: {e}')
+            return job
+        finally:
+            # Each pool thread holds its own connection; don't leak it between jobs
+            connection.close()
@@ -0,0 +1,65 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from images import metadata
+from images.models import Image
+from images.response_cache import bump_images
+
+class Command(BaseCommand):
+    help = "Reads the format, dimensions, orientation and size of images stored before they were kept at ingest"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Images read and updated at a time')
+        parser.add_argument('--workers', type=int, default=4, help='Files probed at the same time')
+        parser.add_argument('--after-id', type=int, default=0, help='Start after this image id (to resume a run)')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between chunks, to leave the disk and database to the site')
+        parser.add_argument('--all', action='store_true', help='Read every image again, not just those without metadata')
+
+    def handle(self, *args, **options):
+        images = Image.objects.all() if options['all'] else Image.objects.filter(width__isnull=True)
+        storage = Image._meta.get_field('file').storage
+        last_id = options['after_id']
+        updated = failed = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            while rows := list(images.filter(id__gt=last_id).order_by('id').values_list('id', 'file', 'content_hash')[:options['chunk_size']]):
+                results = executor.map(lambda row: self._probe(storage, *row), rows)
+                probed = [Image(id=row[0], **fields) for row, fields in zip(rows, results) if fields]
+                Image.objects.bulk_update(probed, [*metadata.FIELDS, 'content_hash'])
+                # The metadata is in the cached image responses
+                bump_images([image.id for image in probed])
+
+                last_id = rows[-1][0]
+                updated += len(probed)
+                failed += len(rows) - len(probed)
+                self.stdout.write(f'{updated} images updated, {failed} unreadable, up to id {last_id}  '
+                                  f'{updated / (time.monotonic() - started):.1f} images/s')
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+    def _probe(self, storage, pk: int, name: str, content_hash: str):
+        # The metadata fields of one image, with its content hash, or None when the file can't be read
+        if not name:
+            return None
+        try:
+            path = storage.path(name)
+            fields = metadata.file_fields(path)
+            if not content_hash:
+                digest = hashlib.sha256()
+                with open(path, 'rb') as image_file:
+                    while block := image_file.read(1024 * 1024):
+                        digest.update(block)
+                content_hash = digest.hexdigest()
+            return {**fields, 'content_hash': content_hash}
+        except Exception as e:
+            logging.warning(f'backfill_metadata: image {pk} ({name}) could not be read: {e}')
+            return None
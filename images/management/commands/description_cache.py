@@ -0,0 +1,40 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from django.core.management.base import BaseCommand
+
+from images import description_cache
+from images.openai_adapter import OpenAiAdapter
+
+class Command(BaseCommand):
+    help = 'Inspects, trims and invalidates the description cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale', action='store_true',
+                            help="Delete entries made with a model, prompt or max_tokens other than OpenAiAdapter's current "
+                                 "single-image and batch ones")
+        parser.add_argument('--hash', dest='content_hash',
+                            help='Delete the entries for one image content hash')
+        parser.add_argument('--clear', action='store_true', help='Delete every entry')
+        parser.add_argument('--evict', action='store_true',
+                            help='Trim the cache to description_cache_max_entries')
+
+    def handle(self, *args, **options):
+        if options['stale']:
+            deleted = description_cache.invalidate_stale(
+                [OpenAiAdapter.prompt_params(), OpenAiAdapter.batch_prompt_params()]
+            )
+            self.stdout.write(f'deleted {deleted} stale entries')
+        if options['content_hash']:
+            deleted = description_cache.invalidate(options['content_hash'])
+            self.stdout.write(f'deleted {deleted} entries for {options["content_hash"]}')
+        if options['clear']:
+            deleted = description_cache.invalidate()
+            self.stdout.write(f'deleted {deleted} entries')
+        if options['evict']:
+            deleted = description_cache.evict()
+            self.stdout.write(f'evicted {deleted} entries')
+
+        stats = description_cache.stats()
+        self.stdout.write(f'{stats["entries"]} entries, {stats["stored_hits"]} hits served')
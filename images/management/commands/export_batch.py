@@ -0,0 +1,27 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from images.batch_files import BatchFileWriter, MAX_REQUESTS_PER_FILE, MAX_BYTES_PER_FILE, export_unanalyzed
+
+class Command(BaseCommand):
+    help = "Writes a chat completion request for every unanalyzed image to JSONL files for OpenAI's Batch API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Path of the first JSONL file; more files are numbered after it')
+        parser.add_argument('--limit', type=int, help='Export at most this many images')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per round trip to the database')
+        parser.add_argument('--max-requests', type=int, default=MAX_REQUESTS_PER_FILE, help='Requests per file')
+        parser.add_argument('--max-bytes', type=int, default=MAX_BYTES_PER_FILE, help='Bytes per file')
+
+    def handle(self, *args, **options):
+        block_size = apps.get_app_config('images').openai_stream_block_size
+        with BatchFileWriter(options['output'], options['max_requests'], options['max_bytes'], block_size) as writer:
+            counts = export_unanalyzed(writer, options['limit'], options['chunk_size'])
+
+        self.stdout.write(f'exported {counts["exported"]} images ({counts["skipped"]} skipped) to {len(writer.paths)} files')
+        for path in writer.paths:
+            self.stdout.write(path)
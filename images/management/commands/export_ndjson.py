@@ -0,0 +1,48 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from images import export
+
+class Command(BaseCommand):
+    help = 'Writes every image and comment as newline delimited JSON, streaming them from the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write, or - for standard output; a .gz name is gzip compressed")
+        parser.add_argument('--since', type=export.date_or_datetime,
+                            help='Only images created or analyzed and comments created since this date/time')
+        parser.add_argument('--gzip', action='store_true', help='Gzip compress the output')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched per round trip to the database')
+
+    def handle(self, *args, **options):
+        compress = options['gzip'] or options['output'].endswith('.gz')
+        # The last record is the 'end' summary, kept to report it
+        summary = {}
+        def remember(records):
+            for record in records:
+                yield record
+            summary.update(record)
+
+        started = time.monotonic()
+        blocks = export.ndjson(remember(export.records(options['since'], options['chunk_size'])), compress)
+        if options['output'] == '-':
+            output, report = sys.stdout.buffer, self.stderr
+        else:
+            output, report = open(options['output'], 'wb'), self.stdout
+        try:
+            for block in blocks:
+                output.write(block)
+        finally:
+            output.flush()
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        elapsed = time.monotonic() - started
+        rows = summary['images'] + summary['comments']
+        report.write(f'exported {summary["images"]} images and {summary["comments"]} comments '
+                     f'({rows / max(elapsed, 1e-6):.0f} rows/s); continue with --since {summary["next_since"]}')
@@ -0,0 +1,23 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from django.core.management.base import BaseCommand
+
+from images.batch_files import import_results
+
+class Command(BaseCommand):
+    help = "Saves the descriptions from OpenAI Batch API output files written for export_batch's requests"
+
+    def add_arguments(self, parser):
+        parser.add_argument('results', nargs='+', help='Batch API output JSONL files')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Images updated per transaction')
+
+    def handle(self, *args, **options):
+        for path in options['results']:
+            with open(path, encoding='utf-8') as results:
+                counts = import_results(results, options['chunk_size'])
+            self.stdout.write(
+                f'{path}: imported {counts["imported"]}, {counts["failed"]} failed requests, '
+                f'{counts["unknown"]} unknown images, {counts["malformed"]} malformed lines'
+            )
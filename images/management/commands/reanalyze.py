@@ -0,0 +1,125 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from images import actions
+from images.export import date_or_datetime
+from images.models import Image
+from images.response_cache import bump_images
+from images.search import update_search_vectors
+
+class Command(BaseCommand):
+    help = 'Analyzes (or re-analyzes) images across a pool of worker threads, resumably'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--unanalyzed', action='store_true', help='Only images that have never been analyzed')
+        parser.add_argument('--unstructured', action='store_true',
+                            help='Only analyzed images without a structured analysis (labels, objects, ...)')
+        parser.add_argument('--analyzed-before', type=date_or_datetime,
+                            help='Only images never analyzed or last analyzed before this date/time')
+        parser.add_argument('--min-id', type=int, help='Only images with at least this id')
+        parser.add_argument('--max-id', type=int, help='Only images with at most this id')
+        parser.add_argument('--workers', type=int, default=apps.get_app_config('images').analysis_workers,
+                            help='Images analyzed at the same time')
+        parser.add_argument('--batch-size', type=int, default=apps.get_app_config('images').analysis_batch_size,
+                            help='Images described per OpenAI request; each worker thread runs one batch at a time')
+        parser.add_argument('--chunk-size', type=int, default=100,
+                            help='Images per bulk_update and checkpoint')
+        parser.add_argument('--checkpoint', default='reanalyze.checkpoint.json',
+                            help='File recording the last finished id, so an interrupted run resumes after it')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        filters = {name: options[name] for name in ('unanalyzed', 'unstructured', 'analyzed_before', 'min_id', 'max_id')}
+        filters['analyzed_before'] = filters['analyzed_before'] and filters['analyzed_before'].isoformat()
+        last_id = self._resume_from(options['checkpoint'], filters, options['restart'])
+
+        images = self._queryset(filters)
+        total = images.filter(id__gt=last_id).count()
+        self.stdout.write(f'{total} images to analyze' + (f', resuming after id {last_id}' if last_id else ''))
+
+        batch_size = max(1, options['batch_size'])
+        done = failed = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            while chunk := list(images.filter(id__gt=last_id).order_by('id')[:options['chunk_size']]):
+                batches = [chunk[start:start + batch_size] for start in range(0, len(chunk), batch_size)]
+                failures = set().union(*executor.map(lambda batch: self._analyze(batch, batch_size), batches))
+                analyzed = [image for image in chunk if image.id not in failures]
+                with transaction.atomic():
+                    Image.objects.bulk_update(analyzed, actions.ANALYSIS_FIELDS)
+                    update_search_vectors(image.id for image in analyzed)
+                    # An image with an earlier analysis keeps it (and its status); only the error is logged
+                    Image.objects.filter(id__in=failures, analyzed_at__isnull=True).update(status=Image.Status.FAILED)
+                bump_images(image.id for image in chunk)
+
+                last_id = chunk[-1].id
+                self._save_checkpoint(options['checkpoint'], filters, last_id)
+                done += len(chunk)
+                failed += len(failures)
+                self._progress(done, failed, total, time.monotonic() - started)
+
+        if os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(f'finished: {done - failed} analyzed, {failed} failed')
+
+    def _analyze(self, batch, batch_size) -> set:
+        # The ids of the images in `batch` that couldn't be analyzed; the rest are updated, not saved
+        try:
+            errors = actions.analyze_images(batch, batch_size, commit=False)
+        except Exception as e:
+            errors = {image.id: e for image in batch}
+        finally:
+            # Each pool thread has its own connection; don't leave it open between chunks
+            connection.close()
+        for pk, error in errors.items():
+            logging.warning(f'reanalyze: Image {pk} failed: {error}')
+        return set(errors)
+
+    def _queryset(self, filters):
+        images = Image.objects.all()
+        if filters['unanalyzed']:
+            images = images.filter(analyzed_at__isnull=True)
+        if filters['unstructured']:
+            images = images.filter(analyzed_at__isnull=False, analysis__isnull=True)
+        if filters['analyzed_before']:
+            images = images.filter(Q(analyzed_at__isnull=True) | Q(analyzed_at__lt=filters['analyzed_before']))
+        if filters['min_id'] is not None:
+            images = images.filter(id__gte=filters['min_id'])
+        if filters['max_id'] is not None:
+            images = images.filter(id__lte=filters['max_id'])
+        return images
+
+    def _resume_from(self, path, filters, restart) -> int:
+        if restart or not os.path.exists(path):
+            return 0
+        with open(path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        # Checkpoints from before --unstructured existed were written without it
+        if {'unstructured': False, **checkpoint['filters']} != filters:
+            raise CommandError(f'{path} was written by a run with other filters; pass --restart to start over')
+        return checkpoint['last_id']
+
+    def _save_checkpoint(self, path, filters, last_id):
+        # Written to a temporary file and renamed, so a kill mid-write can't corrupt it
+        with open(f'{path}.tmp', 'w') as checkpoint_file:
+            json.dump({'filters': filters, 'last_id': last_id}, checkpoint_file)
+        os.replace(f'{path}.tmp', path)
+
+    def _progress(self, done, failed, total, elapsed):
+        rate = done / elapsed if elapsed else 0.0
+        eta = (total - done) / rate if rate else 0.0
+        self.stdout.write(
+            f'{done}/{total} ({failed} failed)  {rate:.1f} images/s  ETA {int(eta // 60)}m{int(eta % 60):02d}s'
+        )
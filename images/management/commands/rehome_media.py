@@ -0,0 +1,121 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F, Sum
+
+from images.models import Image, StoredFile
+from images.response_cache import bump_images
+from images.storage import ContentAddressedStorage, is_content_addressed
+
+# Files this recent may be uploads still being streamed in, so cleanup leaves them
+CLEANUP_MIN_AGE = 60 * 60
+
+class Command(BaseCommand):
+    help = 'Moves image files with upload names into content-addressed storage, while the site keeps serving them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Images read and updated at a time')
+        parser.add_argument('--workers', type=int, default=4, help='Files hashed and linked at the same time')
+        parser.add_argument('--after-id', type=int, default=0, help='Start after this image id (to resume a run)')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between chunks, to leave the disk and database to the site')
+        parser.add_argument('--keep-old', action='store_true',
+                            help="Leave the old files in place rather than removing the ones no image uses")
+        parser.add_argument('--stats', action='store_true', help='Only report what content-addressed storage holds')
+
+    def handle(self, *args, **options):
+        self.storage = Image._meta.get_field('file').storage
+        if not isinstance(self.storage, ContentAddressedStorage):
+            raise CommandError('Image files are not in content-addressed storage (ImagesConfig.content_addressed_storage)')
+        if options['stats']:
+            self._report()
+            return
+
+        last_id = options['after_id']
+        moved = skipped = 0
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            while rows := list(Image.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'file', 'content_hash')[:options['chunk_size']]):
+                # Images sharing an upload name (e.g. loaded from fixtures) move together
+                legacy = {}
+                for pk, name, content_hash in rows:
+                    if name and not is_content_addressed(name):
+                        legacy.setdefault(name, ([], content_hash))[0].append(pk)
+                results = list(executor.map(self._rehome, [(name, pks, content_hash) for name, (pks, content_hash) in legacy.items()]))
+                rehomed = [pk for (pks, _), ok in zip(legacy.values(), results) if ok for pk in pks]
+                # File URLs are in the cached image responses
+                bump_images(rehomed)
+
+                last_id = rows[-1][0]
+                moved += len(rehomed)
+                skipped += sum(1 for ok in results if not ok)
+                self.stdout.write(f'{moved} images moved, {skipped} files skipped, up to id {last_id}  '
+                                  f'{moved / (time.monotonic() - started):.1f} images/s')
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+        if not options['keep_old']:
+            self.stdout.write(f'removed {self._remove_unreferenced()} old files')
+        self._report()
+
+    def _rehome(self, item) -> bool:
+        name, pks, content_hash = item
+        try:
+            path = self.storage.path(name)
+            if not os.path.exists(path):
+                logging.warning(f'rehome_media: {name} is missing (images {pks})')
+                return False
+            if not content_hash:
+                digest = hashlib.sha256()
+                with open(path, 'rb') as source:
+                    while block := source.read(1024 * 1024):
+                        digest.update(block)
+                content_hash = digest.hexdigest()
+            # Linked, so the old name keeps working until every image has the new one
+            new_name = self.storage.adopt(path, content_hash, os.path.dirname(name), refs=len(pks), keep_source=True)
+            updated = Image.objects.filter(pk__in=pks, file=name).update(file=new_name, content_hash=content_hash)
+            # Images deleted or given another file meanwhile don't keep their reference
+            for _ in range(len(pks) - updated):
+                self.storage.delete(new_name)
+            return True
+        except Exception as e:
+            logging.warning(f'rehome_media: {name} failed: {e}')
+            return False
+        finally:
+            # Each pool thread has its own connection; don't leave it open between chunks
+            connection.close()
+
+    def _remove_unreferenced(self) -> int:
+        """
+        Remove files in the upload directory (not its shards) that no image names any more.
+        """
+        referenced = set(Image.objects.exclude(file__regex=r'[0-9a-f]{64}').values_list('file', flat=True).iterator())
+        directory = Image._meta.get_field('file').upload_to
+        cutoff = time.time() - CLEANUP_MIN_AGE
+        removed = 0
+        with os.scandir(self.storage.path(directory)) as entries:
+            for entry in entries:
+                name = f'{directory}/{entry.name}'
+                if entry.is_file() and name not in referenced and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+        return removed
+
+    def _report(self):
+        totals = StoredFile.objects.aggregate(
+            references=Sum('ref_count'), stored=Sum('size'), saved=Sum(F('size') * (F('ref_count') - 1)),
+        )
+        files = StoredFile.objects.count()
+        self.stdout.write(
+            f'{files} files for {totals["references"] or 0} images: {(totals["stored"] or 0) / 1e6:.1f}MB stored, '
+            f'{(totals["saved"] or 0) / 1e6:.1f}MB saved by deduplication'
+        )
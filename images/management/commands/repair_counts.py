@@ -0,0 +1,34 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from images import counters
+from images.models import Image
+
+class Command(BaseCommand):
+    help = "Checks every image's comment_count against its comments and fixes the ones that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only report miscounted images')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Image ids checked per query')
+
+    def handle(self, *args, **options):
+        last_id = Image.objects.aggregate(last=Max('id'))['last'] or 0
+        miscounted = fixed = 0
+        for start in range(0, last_id + 1, options['chunk_size']):
+            images = Image.objects.filter(id__gte=start, id__lt=start + options['chunk_size'])
+            if options['check']:
+                miscounted += counters.find_miscounted(images).count()
+            else:
+                fixed += counters.repair_comment_counts(images)
+
+        # Recounted on the next request
+        cache.delete(counters.IMAGE_TOTAL_KEY)
+        if options['check']:
+            self.stdout.write(f'{miscounted} images have a wrong comment_count')
+        else:
+            self.stdout.write(f'fixed comment_count on {fixed} images')
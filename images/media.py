@@ -0,0 +1,142 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import mimetypes
+import os
+import re
+import urllib.parse
+from typing import Union
+from django.apps import apps
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from .storage import is_content_addressed
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+class UnsatisfiableRange(ValueError):
+    pass
+
+class FileRange:
+    """
+    The `length` bytes of an open file from its current offset, for FileResponse to
+    stream.  It has no fileno(), so WSGI servers iterate it rather than sendfile() past
+    the end of the range.
+    """
+    def __init__(self, file, length: int):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+def byte_range(header: str, size: int) -> Union[tuple, None]:
+    """
+    The (first, last) byte of a `Range` header, or None to send the whole file, as for
+    other units and multiple ranges (which a server may ignore).
+    """
+    match = RANGE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # The last `last` bytes
+        if int(last) == 0 or size == 0:
+            raise UnsatisfiableRange()
+        return max(0, size - int(last)), size - 1
+    first = int(first)
+    if first >= size:
+        raise UnsatisfiableRange()
+    if not last:
+        return first, size - 1
+    if int(last) < first:
+        # Not a valid range spec, so the header is ignored
+        return None
+    return first, min(int(last), size - 1)
+
+def _if_range_matches(request, etag: str, mtime: int) -> bool:
+    # A Range only applies to the representation If-Range names (by strong ETag or date)
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == mtime
+
+def file_response(request, path: str, content_type: str = None, etag: str = None, max_age: int = None):
+    """
+    Serve the file at `path` (under MEDIA_ROOT): 304 and 412 for conditional requests,
+    206 for a byte range, otherwise the whole file through FileResponse, which servers
+    with a wsgi.file_wrapper send with sendfile().  Content-addressed files never change,
+    so they're cached as immutable and their hash is the ETag.  With media_offload the
+    proxy in front is told to send the file (and handle ranges) itself.
+    """
+    config = apps.get_app_config('images')
+    stat = os.stat(path)
+    mtime = int(stat.st_mtime)
+    name = os.path.basename(path)
+    if etag is None:
+        etag = os.path.splitext(name)[0] if is_content_addressed(path) else f'{stat.st_mtime_ns:x}-{stat.st_size:x}'
+    etag = f'"{etag}"'
+    if max_age is None:
+        max_age = config.media_immutable_max_age if is_content_addressed(path) else config.media_max_age
+    content_type = content_type or mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    response = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if response is None:
+        response = _file_or_range(request, path, stat.st_size, content_type, etag, mtime, config)
+    if response.status_code not in (200, 206, 304):
+        # A 412 or 416 isn't the file, so it isn't cached as it
+        return response
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    patch_cache_control(response, public=True, max_age=max_age)
+    if max_age >= config.media_immutable_max_age:
+        patch_cache_control(response, immutable=True)
+    return response
+
+def _file_or_range(request, path: str, size: int, content_type: str, etag: str, mtime: int, config):
+    if config.media_offload == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        relative = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = config.media_offload_prefix + urllib.parse.quote(relative)
+        return response
+    if config.media_offload == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = os.path.abspath(path)
+        return response
+
+    span = None
+    if 'Range' in request.headers and _if_range_matches(request, etag, mtime):
+        try:
+            span = byte_range(request.headers['Range'], size)
+        except UnsatisfiableRange:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    first, last = span or (0, size - 1)
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, status=206 if span else 200)
+    elif span:
+        file = open(path, 'rb')
+        file.seek(first)
+        response = FileResponse(FileRange(file, last - first + 1), content_type=content_type, status=206)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    if span:
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    response['Content-Length'] = str(last - first + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
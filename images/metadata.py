@@ -0,0 +1,101 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import io
+import os
+from typing import NamedTuple, Union
+from django.db.models import QuerySet
+from PIL import Image as PILImage
+from .preprocessing import EXIF_ORIENTATION
+
+# Orientations that turn the image on its side, so it is shown with width and height swapped
+TRANSPOSED_ORIENTATIONS = frozenset([5, 6, 7, 8])
+# GET /images/ query parameters: (parameter, Image field lookup)
+RANGE_FILTERS = (
+    ('min_width', 'width__gte'),
+    ('max_width', 'width__lte'),
+    ('min_height', 'height__gte'),
+    ('max_height', 'height__lte'),
+    ('min_bytes', 'byte_size__gte'),
+    ('max_bytes', 'byte_size__lte'),
+)
+# The Image fields fields() fills in
+FIELDS = ('image_format', 'width', 'height', 'orientation', 'byte_size')
+# Other names for the formats Pillow reports
+FORMAT_ALIASES = {'JPG': 'JPEG', 'TIF': 'TIFF'}
+
+class ImageMetadata(NamedTuple):
+    # What an image's header says about it.  width and height are as shown, after the EXIF orientation.
+    image_format: str
+    width: int
+    height: int
+    orientation: int
+
+def read(img: PILImage.Image) -> ImageMetadata:
+    # From an image Pillow has opened (which reads the header, not the pixels)
+    width, height = img.size
+    orientation = _orientation(img)
+    if orientation in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    return ImageMetadata(img.format, width, height, orientation)
+
+def _orientation(img: PILImage.Image) -> int:
+    # From the EXIF block read with the header; getexif() loads the whole image for some formats
+    try:
+        if img.format == 'TIFF':
+            orientation = img.tag_v2.get(EXIF_ORIENTATION, 1)
+        elif img.info.get('exif'):
+            exif = PILImage.Exif()
+            exif.load(img.info['exif'])
+            orientation = exif.get(EXIF_ORIENTATION, 1)
+        else:
+            return 1
+    except Exception:
+        return 1
+    return orientation if orientation in range(1, 9) else 1
+
+def read_header(header: bytes) -> Union[ImageMetadata, None]:
+    """
+    The metadata in the first bytes of an image file, or None when more of it is needed.
+    Raises DecompressionBombError for an image with too many pixels.
+    """
+    try:
+        with PILImage.open(io.BytesIO(header)) as img:
+            return read(img)
+    except PILImage.DecompressionBombError:
+        raise
+    except Exception:
+        return None
+
+def probe(path: str) -> ImageMetadata:
+    # The metadata of the image file at `path`, reading only as much of it as Pillow needs
+    with PILImage.open(path) as img:
+        return read(img)
+
+def fields(metadata: ImageMetadata, byte_size: int) -> dict:
+    # Image field values for `metadata`
+    return dict(zip(FIELDS, (metadata.image_format, metadata.width, metadata.height, metadata.orientation, byte_size)))
+
+def file_fields(path: str) -> dict:
+    return fields(probe(path), os.path.getsize(path))
+
+def filter_images(images: QuerySet, params) -> QuerySet:
+    """
+    The `images` within the min_/max_ width, height and bytes and of the image_format
+    (e.g. jpeg) in the query `params`, filtered on the indexed metadata columns.
+    Images whose metadata hasn't been read yet are left out by any of them.
+    Raises ValueError for a parameter that isn't valid.
+    """
+    lookups = {}
+    for param, lookup in RANGE_FILTERS:
+        value = params.get(param)
+        if value is None:
+            continue
+        if not value.isdigit():
+            raise ValueError(f'{param} must be a whole number')
+        lookups[lookup] = int(value)
+    if params.get('image_format'):
+        image_format = params['image_format'].strip().upper()
+        lookups['image_format'] = FORMAT_ALIASES.get(image_format, image_format)
+    return images.filter(**lookups) if lookups else images
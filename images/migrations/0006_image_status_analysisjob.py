@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_analyzed_images(apps, schema_editor):
+    Image = apps.get_model('images', 'Image')
+    Image.objects.filter(analyzed_at__isnull=False).update(status='analyzed')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_rename_file_path_image_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('analyzed', 'Analyzed'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16),
+        ),
+        migrations.RunPython(mark_analyzed_images, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='AnalysisJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_by', models.CharField(blank=True, default='', max_length=128)),
+                ('locked_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='images.image')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='images_job_status_run_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without locking writes to a large images table
+    atomic = False
+
+    dependencies = [
+        ('images', '0007_description_cache'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['analyzed_at', 'id'], name='images_image_analyzed_id_idx'),
+        ),
+    ]
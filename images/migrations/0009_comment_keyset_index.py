@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:14
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the index without locking writes to a large comments table
+    atomic = False
+
+    dependencies = [
+        ('images', '0008_image_keyset_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='comment',
+            index=models.Index(fields=['image', 'created_at', 'id'], name='images_comment_image_idx'),
+        ),
+        # The new index starts with image_id, so the foreign key's own index is redundant
+        migrations.AlterField(
+            model_name='comment',
+            name='image',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='images.image'),
+        ),
+    ]
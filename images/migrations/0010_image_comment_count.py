@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:23
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_comments(apps, schema_editor):
+    Image = apps.get_model('images', 'Image')
+    Comment = apps.get_model('images', 'Comment')
+    counts = Comment.objects.filter(image=OuterRef('pk')).order_by().values('image').annotate(n=Count('*')).values('n')
+    Image.objects.filter(id__in=Comment.objects.values('image_id')).update(comment_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0009_comment_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:37
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import F, Func, Max, OuterRef, TextField, Value
+
+CHUNK_SIZE = 10000
+
+
+def index_images(apps, schema_editor):
+    # images.search.search_vector() as of this migration, a range of ids at a time
+    Image = apps.get_model('images', 'Image')
+    Comment = apps.get_model('images', 'Comment')
+    description = Func(F('description'), template="(%(expressions)s #>> '{}')", output_field=TextField())
+    newest = Comment.objects.filter(image=OuterRef('pk')).order_by('-created_at', '-id').values('content')[:100]
+    comments = Func(ArraySubquery(newest), Value(' '), function='array_to_string', output_field=TextField())
+    vector = SearchVector(description, weight='A', config='english') + SearchVector(comments, weight='B', config='english')
+
+    last_id = Image.objects.aggregate(last=Max('id'))['last'] or 0
+    for start in range(0, last_id, CHUNK_SIZE):
+        Image.objects.filter(id__gt=start, id__lte=start + CHUNK_SIZE).exclude(description__isnull=True, comment_count=0).update(search_vector=vector)
+
+
+class Migration(migrations.Migration):
+    # Fill the vectors in chunks, then build the index without locking writes to a large image table
+    atomic = False
+
+    dependencies = [
+        ('images', '0010_image_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(index_images, migrations.RunPython.noop),
+        AddIndexConcurrently(
+            model_name='image',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='images_image_search_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:21
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # A nullable column needs no table rewrite; existing images get an analysis when
+    # they're next analyzed (see `reanalyze --unstructured`), and the index is built
+    # without locking writes
+    atomic = False
+
+    dependencies = [
+        ('images', '0011_image_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='analysis',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['analysis'], name='images_image_analysis_idx', opclasses=['jsonb_path_ops']),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Nullable columns (and a constant default) need no table rewrite; existing images get
+    # their metadata from `backfill_metadata`, and the indexes are built without locking writes
+    atomic = False
+
+    dependencies = [
+        ('images', '0013_storedfile_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='image_format',
+            field=models.CharField(blank=True, default='', editable=False, max_length=8),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='byte_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='orientation',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['width'], name='images_image_width_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['height'], name='images_image_height_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['byte_size'], name='images_image_byte_size_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='image',
+            index=models.Index(fields=['image_format'], name='images_image_format_idx'),
+        ),
+    ]
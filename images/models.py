@@ -2,15 +2,56 @@
 Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
 """
 
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.utils import timezone
+from .storage import media_storage
 
 class Image(models.Model):
     # Model representing an image record.
 
-    file = models.ImageField(upload_to='images')
+    class Status(models.TextChoices):
+        PENDING = 'pending'
+        PROCESSING = 'processing'
+        ANALYZED = 'analyzed'
+        FAILED = 'failed'
+
+    # Content-addressed and deduplicated unless ImagesConfig.content_addressed_storage is off
+    file = models.ImageField(upload_to='images', storage=media_storage)
     description = models.JSONField(null=True, blank=True)
     analyzed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING, db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    # Read from the file's header at ingest (see images.metadata), so nothing reopens the file to
+    # answer them; null until backfill_metadata reaches older images.  width and height are as
+    # shown, after the EXIF orientation
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_format = models.CharField(max_length=8, blank=True, default='', editable=False)
+    byte_size = models.PositiveBigIntegerField(null=True, blank=True, editable=False)
+    orientation = models.PositiveSmallIntegerField(null=True, blank=True, editable=False)
+    # Kept in step with the image's comments by images.counters
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Labels, objects, dominant text and confidence from structured analysis; None for older analyses
+    analysis = models.JSONField(null=True, blank=True, editable=False)
+    # The description and newest comments for full-text search, kept up to date by images.search
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the image list walks (analyzed_at, id)
+            models.Index(fields=['analyzed_at', 'id'], name='images_image_analyzed_id_idx'),
+            GinIndex(fields=['search_vector'], name='images_image_search_idx'),
+            # jsonb_path_ops serves the @> containment filters on labels and objects
+            GinIndex(fields=['analysis'], name='images_image_analysis_idx', opclasses=['jsonb_path_ops']),
+            # GET /images/ filters on the metadata
+            models.Index(fields=['width'], name='images_image_width_idx'),
+            models.Index(fields=['height'], name='images_image_height_idx'),
+            models.Index(fields=['byte_size'], name='images_image_byte_size_idx'),
+            models.Index(fields=['image_format'], name='images_image_format_idx'),
+        ]
 
     @property
     def analyzed(self) -> bool:
@@ -19,6 +60,68 @@ class Image(models.Model):
 class Comment(models.Model):
     # Model representing a comment.
 
-    image = models.ForeignKey(Image, on_delete=models.CASCADE)
+    # The (image, created_at, id) index below serves image_id lookups too
+    image = models.ForeignKey(Image, on_delete=models.CASCADE, db_index=False)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # An image's comments are paged in (created_at, id) order
+            models.Index(fields=['image', 'created_at', 'id'], name='images_comment_image_idx'),
+        ]
+
+    @staticmethod
+    def deleted_with_image(origin) -> bool:
+        """
+        Whether a delete signal's `origin` is the deletion of images, which cascades to their
+        comments.  Receivers skip per-comment work for images that are going anyway.
+        """
+        return isinstance(origin, Image) or (isinstance(origin, models.QuerySet) and origin.model is Image)
+
+class AnalysisJob(models.Model):
+    # Model representing a queued analysis of an image, run by the analysis_worker command.
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued'
+        RUNNING = 'running'
+        DONE = 'done'
+        FAILED = 'failed'
+
+    image = models.ForeignKey(Image, on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=128, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='images_job_status_run_idx'),
+        ]
+
+class DescriptionCacheEntry(models.Model):
+    # Model representing a cached description, keyed on the image content and the prompt that produced it.
+
+    key = models.CharField(max_length=64, unique=True)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    model = models.CharField(max_length=128)
+    prompt_hash = models.CharField(max_length=64)
+    max_tokens = models.PositiveIntegerField()
+    description = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+class StoredFile(models.Model):
+    # Model representing a file in content-addressed storage, and how many images use it.
+
+    name = models.CharField(max_length=255, unique=True)
+    content_hash = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
@@ -2,66 +2,587 @@
 Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
 """
 
+import asyncio
 import base64
+import itertools
+import json
+import os
+import random
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Union
 from django.apps import apps
 import logging
+from .dispatcher import get_dispatcher, parse_retry_after
+from .preprocessing import image_tokens, prepare_image
+
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+_session = None
+_session_lock = threading.Lock()
+# One aiohttp session per event loop; a session can't be shared between loops
+_async_sessions = weakref.WeakKeyDictionary()
+
+def get_session() -> requests.Session:
+    """
+    The process-wide session for OpenAI requests.  Its connection pool keeps
+    connections alive, so each request doesn't pay for a new TCP+TLS handshake.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = apps.get_app_config('images').openai_pool_size
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+def reset_session():
+    """
+    Close the pooled session; the next request builds a new one from the current config.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+def get_async_session() -> aiohttp.ClientSession:
+    """
+    The pooled, keep-alive aiohttp session for OpenAI requests made from the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    session = _async_sessions.get(loop)
+    if session is None or session.closed:
+        config = apps.get_app_config('images')
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=config.openai_async_pool_size),
+            timeout=aiohttp.ClientTimeout(sock_connect=config.openai_connect_timeout,
+                                          sock_read=config.openai_read_timeout),
+        )
+        _async_sessions[loop] = session
+    return session
+
+async def close_async_session():
+    """
+    Close the running event loop's session; edLight.asgi calls this when the server shuts down.
+    """
+    session = _async_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+def image_placeholder(index: int) -> str:
+    """
+    Marks where StreamedPayload splices in the data URL of its `index`th image.
+    """
+    return f"\x00streamed-image-{index}\x00"
+
+# Charged for an inline image whose size we don't know; four high detail tiles
+UNKNOWN_IMAGE_TOKENS = 765
+
+def estimate_tokens(payload: dict) -> int:
+    """
+    A rough upper bound on the tokens a chat completion will be charged, for the
+    dispatcher's token budget: ~4 characters of text per token, plus the completion.
+    """
+    tokens = payload.get('max_tokens') or 0
+    for message in payload.get('messages', []):
+        content = message.get('content')
+        for part in ([{'type': 'text', 'text': content}] if isinstance(content, str) else content or []):
+            if part.get('type') == 'image_url':
+                tokens += 85 if part['image_url'].get('detail') == 'low' else UNKNOWN_IMAGE_TOKENS
+            else:
+                tokens += len(part.get('text', '')) // 4 + 1
+    return tokens
+
+def used_tokens(body) -> Union[int, None]:
+    # Tokens a completion was actually charged, when the response says
+    try:
+        return int(body['usage']['total_tokens'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class Retries:
+    """
+    The retry policy of one make_request call, shared by the sync and async transports.
+    Connection errors, timeouts, 429s and 5xxs are retried with jittered exponential
+    backoff (honouring Retry-After) up to openai_max_retries times.  With the rate limit
+    dispatcher on, a 429 instead goes back in its queue, up to rate_limit_max_throttles times.
+    Each method returns the seconds to wait before the next attempt, or None to stop.
+    """
+    def __init__(self, requeue_throttled: bool):
+        config = apps.get_app_config('images')
+        self.max_attempts = config.openai_max_retries + 1
+        self.max_throttles = config.rate_limit_max_throttles
+        self.backoff_base = config.openai_backoff_base
+        self.backoff_max = config.openai_backoff_max
+        self.requeue_throttled = requeue_throttled
+        self.failures = self.throttles = 0
+
+    def after_error(self, attempt: int, reason: str) -> Union[float, None]:
+        # After a connection error or timeout; None when that was the last attempt
+        self.failures += 1
+        if self.failures == self.max_attempts:
+            return None
+        return self._delay(attempt, reason)
+
+    def after_response(self, attempt: int, status: int, headers) -> Union[float, None]:
+        """
+        None when the response is final (a success, an error not worth retrying, or
+        retries ran out); 0 for a 429 the dispatcher has requeued.
+        """
+        throttled = self.requeue_throttled and status == 429
+        if throttled:
+            self.throttles += 1
+        elif status in RETRY_STATUS_CODES:
+            self.failures += 1
+        if (
+            status not in RETRY_STATUS_CODES
+            or self.failures == self.max_attempts
+            or self.throttles > self.max_throttles
+        ):
+            return None
+        if throttled:
+            logging.info(f"OpenAI attempt {attempt} throttled; requeued behind the rate limit")
+            return 0.0
+        return self._delay(attempt, f"HTTP {status}", parse_retry_after(headers.get('Retry-After')))
+
+    def _delay(self, attempt: int, reason: str, retry_after: Union[float, None] = None) -> float:
+        ceiling = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        logging.warning(f"OpenAI attempt {attempt} failed ({reason}); retrying in {delay:.2f}s")
+        return delay
+
+class StreamedPayload:
+    """
+    A chat completions body whose images are base64 encoded from disk, block by
+    block, while the request is being sent.  Only one block of an image is held in
+    memory at a time, however large the image is.  `payload` is the JSON body with
+    image_placeholder(i) where the data URL of images[i] belongs.
+    """
+    def __init__(self, payload: dict, images: list):
+        self.payload = payload
+        self.images = images
+        # json.dumps escapes the placeholders' NULs as \u0000, leaving the quotes around
+        # each placeholder in the neighbouring parts
+        parts = json.dumps(payload).encode('utf-8').split(b'\\u0000')
+        self._parts = parts[::2]
+        self._order = [int(marker.rsplit(b'-', 1)[1]) for marker in parts[1::2]]
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self._parts) + sum(
+            len(self._url_prefix(self.images[index])) + 4 * -(-os.path.getsize(self.images[index].path) // 3)
+            for index in self._order
+        )
+
+    def iter_bytes(self, block_size: int):
+        """
+        Yield the encoded body.  block_size is rounded down to a multiple of 3 so the
+        base64 of consecutive blocks concatenates without padding in between.
+        """
+        block_size = max(3, block_size - block_size % 3)
+        yield self._parts[0]
+        for position, index in enumerate(self._order):
+            image = self.images[index]
+            yield self._url_prefix(image)
+            with open(image.path, 'rb') as image_file:
+                for block in iter(lambda: image_file.read(block_size), b''):
+                    yield base64.b64encode(block)
+            yield self._parts[position + 1]
+
+    async def aiter_bytes(self, block_size: Union[int, None] = None):
+        """
+        iter_bytes for an async request; file reads and encoding run in a worker thread.
+        A few blocks are pulled per trip to the thread, since each trip costs a thread switch.
+        """
+        chunks = self.iter_bytes(block_size or apps.get_app_config('images').openai_stream_block_size)
+        while batch := await asyncio.to_thread(lambda: list(itertools.islice(chunks, 4))):
+            for chunk in batch:
+                yield chunk
+
+    def estimated_tokens(self) -> int:
+        return estimate_tokens(self.payload) + sum(
+            image_tokens(image.width, image.height, image.detail) for image in self.images
+        )
+
+    def reader(self, block_size: Union[int, None] = None) -> 'PayloadReader':
+        return PayloadReader(self, block_size or apps.get_app_config('images').openai_stream_block_size)
+
+    def to_dict(self) -> dict:
+        """
+        The equivalent in-memory payload, with every image fully encoded.
+        """
+        return json.loads(b''.join(self.iter_bytes(1024 * 1024)))
+
+    def _url_prefix(self, image) -> bytes:
+        return f'data:{image.mime_type};base64,'.encode('utf-8')
+
+class PayloadReader:
+    """
+    A file-like view of a StreamedPayload with a known length, so requests sends it
+    with a Content-Length header rather than chunked.  A retry needs a new reader.
+    """
+    def __init__(self, payload: StreamedPayload, block_size: int):
+        self._length = len(payload)
+        self._chunks = payload.iter_bytes(block_size)
+        self._chunk = b''
+        self._offset = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            rest = self._chunk[self._offset:] + b''.join(self._chunks)
+            self._chunk, self._offset = b'', 0
+            return rest
+        while self._offset >= len(self._chunk):
+            self._chunk, self._offset = next(self._chunks, None), 0
+            if self._chunk is None:
+                self._chunk = b''
+                return b''
+        data = self._chunk[self._offset:self._offset + size]
+        self._offset += len(data)
+        return data
 
 class OpenAIError(requests.RequestException):
-    def __repr__():
-        repr(self.original)
+    def __init__(self, *args, original=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.original = original
+
+    def __repr__(self):
+        return repr(self.original) if self.original else super().__repr__()
+
+    def __str__(self):
+        return str(self.original) if self.original else super().__str__()
+
+class BatchReplyError(ValueError):
+    # The model's reply to a batch prompt couldn't be split into one description per image
+    ...
+
+def parse_analysis(content: Union[str, None]) -> Union[str, dict, None]:
+    """
+    The result of an image prompt: the JSON object asked for, normalized by
+    normalize_analysis, or the reply itself when the model answered in prose.
+    """
+    try:
+        value = json.loads(_strip_code_fence((content or '').strip()))
+    except ValueError:
+        return content
+    return normalize_analysis(value) if _is_analysis(value) else content
+
+def normalize_analysis(value: dict) -> dict:
+    """
+    A structured result with a `description`, lowercase, de-duplicated `labels` and
+    `objects`, the dominant `text` ('' for none) and a `confidence` from 0 to 1 (or None).
+    """
+    def names(items) -> list:
+        found = []
+        for item in items if isinstance(items, list) else []:
+            name = item.get('name') if isinstance(item, dict) else item
+            if isinstance(name, str) and name.strip() and name.strip().lower() not in found:
+                found.append(name.strip().lower())
+        return found
+
+    try:
+        confidence = min(1.0, max(0.0, float(value['confidence'])))
+    except (KeyError, TypeError, ValueError):
+        confidence = None
+    text = value.get('text')
+    return {
+        'description': value['description'].strip(),
+        'labels': names(value.get('labels')),
+        'objects': names(value.get('objects')),
+        'text': text.strip() if isinstance(text, str) else '',
+        'confidence': confidence,
+    }
+
+def _is_analysis(value) -> bool:
+    return isinstance(value, dict) and isinstance(value.get('description'), str) and bool(value['description'].strip())
 
-    def __str__():
-        str(self.original)
+def _strip_code_fence(text: str) -> str:
+    # Models sometimes wrap JSON replies in a markdown code fence
+    if text.startswith('```'):
+        text = text.strip('`')
+        text = text[text.find('\n') + 1:] if '\n' in text else text
+    return text
+
+ANALYSIS_KEYS = (
+    '"description" (a few sentences describing the image), "labels" (short lowercase tags for what it shows), '
+    '"objects" (the things in it), "text" (the main text in the image, or an empty string) and '
+    '"confidence" (from 0 to 1, how sure you are of the description)'
+)
 
 class OpenAiAdapter:
+    model = "gpt-4-vision-preview"
+    prompt_text = f"What's in this image? Reply with only a JSON object with the keys {ANALYSIS_KEYS}."
+    batch_prompt_text = (
+        "Describe what's in each of the following {count} images. Reply with only a JSON array "
+        "of {count} objects, one for each image in the order the images are given, with the keys "
+        + ANALYSIS_KEYS + "."
+    )
+    max_tokens = 300
+
+    @classmethod
+    def prompt_params(cls) -> dict:
+        """
+        Everything besides the image that determines the description; used to key the description cache.
+        """
+        return {'model': cls.model, 'prompt': cls.prompt_text, 'max_tokens': cls.max_tokens}
+
+    @classmethod
+    def batch_prompt_params(cls) -> dict:
+        # Batch descriptions come from a different prompt, so they are cached apart
+        return {'model': cls.model, 'prompt': cls.batch_prompt_text, 'max_tokens': cls.max_tokens}
+
     def __init__(self):
         self.api_key = apps.get_app_config('images').openai_api_key
         if self.api_key == '':
             raise ValueError('OPENAI_API_KEY not set')
         
-    def prompt_image_description(self, image_file: str) -> Union[str, None]:
-        response = self.make_request(self.make_image_prompt(image_file))
+    def prompt_image_description(self, image_file: str, content_hash: Union[str, None] = None) -> Union[str, dict, None]:
+        response = self.make_request(self.make_streamed_image_prompt(image_file, content_hash))
         
-        return response.json()['choices'][0]['message']['content']
+        return parse_analysis(response.json()['choices'][0]['message']['content'])
+
+    def prompt_batch_descriptions(self, image_files: list, content_hashes: Union[list, None] = None) -> list:
+        """
+        Describe several images in one request.  Raises BatchReplyError if the reply
+        doesn't hold exactly one description per image.
+        """
+        response = self.make_request(self.make_streamed_batch_prompt(image_files, content_hashes))
+
+        return self.parse_batch_reply(response.json()['choices'][0]['message']['content'], len(image_files))
        
     def make_request(self, payload):
-        headers =  {
+        """
+        POST a chat completion over the pooled session.  `payload` is a dict or a
+        StreamedPayload.  Connection errors, timeouts, 429s and 5xxs are retried with
+        jittered exponential backoff (honouring Retry-After); the returned response's
+        `attempts` says which attempt succeeded.  With the rate limit dispatcher on,
+        each attempt first waits its turn there, and a 429 just puts the request back
+        in the queue (up to rate_limit_max_throttles times) instead of backing off.
+        """
+        config = apps.get_app_config('images')
+        headers = self._headers()
+        url = self._url()
+        timeout = (config.openai_connect_timeout, config.openai_read_timeout)
+        dispatcher = get_dispatcher()
+        tokens = self._estimated_tokens(payload)
+        retries = Retries(requeue_throttled=dispatcher is not None)
+
+        for attempt in itertools.count(1):
+            if isinstance(payload, StreamedPayload):
+                body = {'data': payload.reader()}
+            else:
+                body = {'json': payload}
+            with dispatcher.slot(tokens) if dispatcher else nullcontext() as ticket:
+                try:
+                    response = get_session().post(url, headers=headers, timeout=timeout, **body)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    delay = retries.after_error(attempt, str(e))
+                    if delay is None:
+                        logging.warning(f"Error Accessing OpenAI after {attempt} attempts: {e}")
+                        raise OpenAIError(request=e.request, original=e)
+                    response = None
+                else:
+                    if dispatcher:
+                        usage = used_tokens(self._json(response)) if response.ok else None
+                        dispatcher.finish(ticket, response.status_code, response.headers, usage)
+
+            if response is not None:
+                delay = retries.after_response(attempt, response.status_code, response.headers)
+                if delay is None:
+                    try:
+                        response.raise_for_status()
+                    except requests.exceptions.HTTPError as e:
+                        logging.warning(f"Error Accessing OpenAI: {e}")
+                        raise OpenAIError(response=e.response, request=e.request, original=e)
+                    response.attempts = attempt
+                    logging.debug(f"OpenAI request succeeded on attempt {attempt}")
+                    return response
+            if delay:
+                time.sleep(delay)
+
+    def _estimated_tokens(self, payload) -> int:
+        if isinstance(payload, StreamedPayload):
+            return payload.estimated_tokens()
+        return estimate_tokens(payload)
+
+    def _json(self, response):
+        try:
+            return response.json()
+        except ValueError:
+            return None
+
+    def _headers(self) -> dict:
+        return {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
-        
-        try:
-            response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-            response.raise_for_status()
-            return response
-        except requests.exceptions.HTTPError as e:
-            logging.warn(f"Error Accessing OpenAI: str(e)")
-            raise OpenAIError(response=e.response, request=e.request, original=e)
+
+    def _url(self) -> str:
+        return f"{apps.get_app_config('images').openai_api_base}/chat/completions"
+
     
-    def make_image_prompt(self, image_file: str) -> dict:
-        base64_image = self._encode_image(image_file)
+    def make_image_prompt(self, image_file: str, content_hash: Union[str, None] = None) -> dict:
+        prepared = prepare_image(image_file, content_hash)
+        base64_image = self._encode_image(prepared.path)
+        return self._image_prompt(f"data:{prepared.mime_type};base64,{base64_image}", prepared.detail)
+
+    @classmethod
+    def make_streamed_image_prompt(cls, image_file: str, content_hash: Union[str, None] = None) -> StreamedPayload:
+        """
+        The same prompt as make_image_prompt, with the image encoded as the request is sent.
+        Needs no API key, so offline batch files can be written with OpenAiAdapter.make_streamed_image_prompt.
+        Pass the image's stored content_hash so preprocessing doesn't read the file again to hash it.
+        """
+        prepared = prepare_image(image_file, content_hash)
+        return StreamedPayload(cls._image_prompt(image_placeholder(0), prepared.detail), [prepared])
+
+    def make_streamed_batch_prompt(self, image_files: list, content_hashes: Union[list, None] = None) -> StreamedPayload:
+        """
+        One prompt for all of `image_files`, each image labelled with its position, and
+        room for max_tokens of description per image.  `content_hashes`, if given, are the
+        images' stored hashes, in the same order.
+        """
+        content_hashes = content_hashes or [None] * len(image_files)
+        prepared = [prepare_image(image_file, content_hash) for image_file, content_hash in zip(image_files, content_hashes)]
+        content = [{"type": "text", "text": self.batch_prompt_text.format(count=len(prepared))}]
+        for index, image in enumerate(prepared):
+            content.append({"type": "text", "text": f"Image {index + 1}:"})
+            content.append({"type": "image_url", "image_url": {'url': image_placeholder(index), 'detail': image.detail}})
+        payload = {
+            'model': self.model,
+            'messages': [{"role": "user", "content": content}],
+            'max_tokens': self.max_tokens * len(prepared)
+        }
+        return StreamedPayload(payload, prepared)
+
+    @staticmethod
+    def parse_batch_reply(content: Union[str, None], count: int) -> list:
+        """
+        The descriptions in a reply to a batch prompt: normalized analyses, or strings
+        for a model that answered with plain descriptions.  A markdown code fence around
+        the JSON, or an object holding the array, is tolerated.
+        """
+        try:
+            descriptions = json.loads(_strip_code_fence((content or '').strip()))
+        except ValueError as e:
+            raise BatchReplyError(f'batch reply is not JSON: {e}') from e
+        if isinstance(descriptions, dict) and len(descriptions) == 1:
+            descriptions = next(iter(descriptions.values()))
+        if (
+            not isinstance(descriptions, list)
+            or len(descriptions) != count
+            or not all(_is_analysis(description) or (isinstance(description, str) and description.strip())
+                       for description in descriptions)
+        ):
+            raise BatchReplyError(f'batch reply does not hold {count} descriptions')
+        return [normalize_analysis(description) if isinstance(description, dict) else description
+                for description in descriptions]
+
+    @classmethod
+    def _image_prompt(cls, image_url: str, detail: str) -> dict:
         return {
-            'model': "gpt-4-vision-preview",
+            'model': cls.model,
             'messages': [
                 {
                     "role": "user", 
                     "content": [
-                        {"type": "text", "text": "what's in this image?"},
+                        {"type": "text", "text": cls.prompt_text},
                         {
                             "type": "image_url", 
                             "image_url": {
-                                'url': f"data:image/jpg;base64,{base64_image}"
+                                'url': image_url,
+                                'detail': detail
                             }
                         }
                     ],
                 },
             ],
-            'max_tokens': 300
+            'max_tokens': cls.max_tokens
         }
 
     
     def _encode_image(self, image_path):
         with open(image_path, "rb") as image_file:
             return base64.b64encode(image_file.read()).decode('utf-8')
+
+class AsyncOpenAiAdapter(OpenAiAdapter):
+    """
+    OpenAiAdapter for async code: requests go over a non-blocking aiohttp session,
+    so one event loop can keep many analyses in flight.  Prompts are built exactly
+    as the sync adapter builds them.
+    """
+    async def prompt_image_description(self, image_file: str, content_hash: Union[str, None] = None) -> Union[str, dict, None]:
+        payload = await asyncio.to_thread(self.make_streamed_image_prompt, image_file, content_hash)
+        response = await self.make_request(payload)
+
+        return parse_analysis((await response.json())['choices'][0]['message']['content'])
+
+    async def prompt_batch_descriptions(self, image_files: list, content_hashes: Union[list, None] = None) -> list:
+        payload = await asyncio.to_thread(self.make_streamed_batch_prompt, image_files, content_hashes)
+        response = await self.make_request(payload)
+
+        return self.parse_batch_reply((await response.json())['choices'][0]['message']['content'], len(image_files))
+
+    async def make_request(self, payload):
+        """
+        The async twin of OpenAiAdapter.make_request, with the same retry policy.
+        The returned response's body has already been read.
+        """
+        dispatcher = get_dispatcher()
+        tokens = self._estimated_tokens(payload)
+        retries = Retries(requeue_throttled=dispatcher is not None)
+
+        for attempt in itertools.count(1):
+            headers = self._headers()
+            if isinstance(payload, StreamedPayload):
+                headers['Content-Length'] = str(len(payload))
+                body = {'data': payload.aiter_bytes()}
+            else:
+                body = {'json': payload}
+            async with dispatcher.aslot(tokens) if dispatcher else nullcontext() as ticket:
+                try:
+                    async with get_async_session().post(self._url(), headers=headers, **body) as response:
+                        await response.read()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    delay = retries.after_error(attempt, repr(e))
+                    if delay is None:
+                        logging.warning(f"Error Accessing OpenAI after {attempt} attempts: {e!r}")
+                        raise OpenAIError(original=e)
+                    response = None
+                else:
+                    if dispatcher:
+                        usage = used_tokens(await self._ajson(response)) if response.ok else None
+                        dispatcher.finish(ticket, response.status, response.headers, usage)
+
+            if response is not None:
+                delay = retries.after_response(attempt, response.status, response.headers)
+                if delay is None:
+                    try:
+                        response.raise_for_status()
+                    except aiohttp.ClientResponseError as e:
+                        logging.warning(f"Error Accessing OpenAI: {e}")
+                        raise OpenAIError(original=e)
+                    response.attempts = attempt
+                    logging.debug(f"OpenAI request succeeded on attempt {attempt}")
+                    return response
+            if delay:
+                await asyncio.sleep(delay)
+
+    async def _ajson(self, response):
+        try:
+            return await response.json(content_type=None)
+        except ValueError:
+            return None
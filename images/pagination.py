@@ -0,0 +1,103 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import NamedTuple, Union
+from django.db.models import Q, QuerySet
+
+class InvalidCursor(ValueError):...
+
+class CursorPage(NamedTuple):
+    items: list
+    next: Union[str, None]
+    prev: Union[str, None]
+
+class KeysetPaginator:
+    """
+    Pages through `queryset` ordered by (`field`, id) with opaque cursors rather than
+    page numbers: no COUNT, and no OFFSET, so every page costs the same at any depth
+    given an index on (field, id).  `field` may be NULL; as in a plain Postgres ORDER BY,
+    NULLs sort last.  Each page is at most two index range scans, one over the non-NULL
+    keys and one over the NULL keys by id.
+    """
+    def __init__(self, queryset: QuerySet, field: str, page_size: int):
+        self.queryset = queryset
+        self.field = field
+        self.page_size = page_size
+
+    def page(self, token: Union[str, None] = None) -> CursorPage:
+        """
+        The page `token` points at, or the first page when it's empty.
+        """
+        if not token:
+            items, more = self._forward(None, None, start=True)
+            return CursorPage(items, self._next(items, more), None)
+
+        value, pk, direction = self.decode(token)
+        if direction == 'next':
+            items, more = self._forward(value, pk)
+            return CursorPage(items, self._next(items, more), self._prev(items))
+        items, more = self._backward(value, pk)
+        return CursorPage(items, self._next(items, True), self._prev(items) if more else None)
+
+    def encode(self, item, direction: str) -> str:
+        value = getattr(item, self.field)
+        if isinstance(value, datetime):
+            value = {'dt': value.isoformat()}
+        raw = json.dumps([value, item.pk, direction], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    def decode(self, token: str) -> tuple:
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            value, pk, direction = json.loads(raw)
+            if isinstance(value, dict):
+                value = datetime.fromisoformat(value['dt'])
+            if not isinstance(pk, int) or direction not in ('next', 'prev'):
+                raise ValueError(token)
+        except (ValueError, TypeError, KeyError) as e:
+            raise InvalidCursor(f'invalid cursor: {token}') from e
+        return value, pk, direction
+
+    def _next(self, items, more) -> Union[str, None]:
+        return self.encode(items[-1], 'next') if items and more else None
+
+    def _prev(self, items) -> Union[str, None]:
+        return self.encode(items[0], 'prev') if items else None
+
+    def _forward(self, value, pk, start=False) -> tuple:
+        # Rows after (value, pk) in (field NULLS LAST, id) order, and whether more follow
+        f = self.field
+        limit = self.page_size + 1
+        items = []
+        if start or value is not None:
+            keyed = self.queryset.filter(**{f'{f}__isnull': False})
+            if not start:
+                # The >= bound is the index range; the OR only filters rows tied on `field`
+                keyed = keyed.filter(Q(**{f'{f}__gte': value}) & (Q(**{f'{f}__gt': value}) | Q(pk__gt=pk)))
+            items = list(keyed.order_by(f, 'pk')[:limit])
+        if len(items) < limit:
+            nulls = self.queryset.filter(**{f'{f}__isnull': True})
+            if value is None and not start:
+                nulls = nulls.filter(pk__gt=pk)
+            items += list(nulls.order_by('pk')[:limit - len(items)])
+        return items[:self.page_size], len(items) == limit
+
+    def _backward(self, value, pk) -> tuple:
+        # Rows before (value, pk), nearest first, then put back in page order
+        f = self.field
+        limit = self.page_size + 1
+        items = []
+        if value is None:
+            nulls = self.queryset.filter(**{f'{f}__isnull': True}, pk__lt=pk)
+            items = list(nulls.order_by('-pk')[:limit])
+        if len(items) < limit:
+            keyed = self.queryset.filter(**{f'{f}__isnull': False})
+            if value is not None:
+                keyed = keyed.filter(Q(**{f'{f}__lte': value}) & (Q(**{f'{f}__lt': value}) | Q(pk__lt=pk)))
+            items += list(keyed.order_by(f'-{f}', '-pk')[:limit - len(items)])
+        more = len(items) == limit
+        return list(reversed(items[:self.page_size])), more
@@ -0,0 +1,112 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import hashlib
+import io
+import os
+from typing import NamedTuple, Union
+from django.apps import apps
+from PIL import Image as PILImage, ImageOps
+from .disk_cache import DiskCache
+
+# Formats the vision model accepts as-is
+PASSTHROUGH_FORMATS = frozenset(['JPEG', 'PNG', 'WEBP', 'GIF'])
+EXIF_ORIENTATION = 0x0112
+
+class PreparedImage(NamedTuple):
+    # The bytes to upload for an image, and how to label them.
+    path: str
+    mime_type: str
+    detail: str
+    width: int
+    height: int
+
+_cache = None
+
+def get_cache() -> DiskCache:
+    global _cache
+    config = apps.get_app_config('images')
+    if _cache is None or _cache.max_bytes != config.preprocess_cache_max_bytes:
+        _cache = DiskCache(config.preprocess_cache_dir, config.preprocess_cache_max_bytes)
+    return _cache
+
+def pick_detail(width: int, height: int) -> str:
+    """
+    'low' costs a fixed 85 tokens and is enough when the image is no bigger than the low-detail tile.
+    """
+    return 'low' if max(width, height) <= apps.get_app_config('images').preprocess_low_detail_side else 'high'
+
+def image_tokens(width: int, height: int, detail: str) -> int:
+    """
+    What the vision model charges for an image: 85 tokens at low detail, or 85 plus 170
+    per 512px tile once the image is scaled to fit 2048px and then to 768px on its short side.
+    """
+    if detail == 'low':
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    tiles = -(-int(width * scale) // 512) * -(-int(height * scale) // 512)
+    return 85 + 170 * tiles
+
+def prepare_image(image_path: str, content_hash: Union[str, None] = None) -> PreparedImage:
+    """
+    Fix the EXIF orientation, cap the longest side and re-encode an image to the
+    configured size target before it is base64 encoded for the vision model.
+    Images that already fit are uploaded untouched.  Re-encoded output is cached on
+    disk by content hash and settings, so reanalysis doesn't pay for it again.
+    """
+    config = apps.get_app_config('images')
+    with PILImage.open(image_path) as img:
+        width, height = img.size
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        if (
+            img.format in PASSTHROUGH_FORMATS
+            and max(width, height) <= config.preprocess_max_side
+            and orientation == 1
+            and os.path.getsize(image_path) <= config.preprocess_target_bytes
+        ):
+            return PreparedImage(image_path, PILImage.MIME[img.format], pick_detail(width, height), width, height)
+
+        key = _cache_key(image_path, content_hash)
+        for extension, mime_type in (('jpg', 'image/jpeg'), ('png', 'image/png')):
+            cached_path = get_cache().get(key, extension)
+            if cached_path:
+                with PILImage.open(cached_path) as cached:
+                    width, height = cached.size
+                return PreparedImage(cached_path, mime_type, pick_detail(width, height), width, height)
+
+        data, extension, mime_type, (width, height) = _reencode(img)
+
+    path = get_cache().put(key, extension, data)
+    return PreparedImage(path, mime_type, pick_detail(width, height), width, height)
+
+def _cache_key(image_path: str, content_hash: Union[str, None]) -> str:
+    config = apps.get_app_config('images')
+    if not content_hash:
+        digest = hashlib.sha256()
+        with open(image_path, 'rb') as image_file:
+            for block in iter(lambda: image_file.read(1024 * 1024), b''):
+                digest.update(block)
+        content_hash = digest.hexdigest()
+    settings_part = f'{config.preprocess_max_side}:{config.preprocess_target_bytes}:{config.preprocess_quality}'
+    return hashlib.sha256(f'{content_hash}:{settings_part}'.encode('utf-8')).hexdigest()
+
+def _reencode(img: PILImage.Image):
+    config = apps.get_app_config('images')
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((config.preprocess_max_side, config.preprocess_max_side), PILImage.LANCZOS)
+
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG', optimize=True)
+        return buffer.getvalue(), 'png', 'image/png', img.size
+
+    img = img.convert('RGB')
+    quality = config.preprocess_quality
+    while True:
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, optimize=True)
+        if buffer.tell() <= config.preprocess_target_bytes or quality <= config.preprocess_min_quality:
+            return buffer.getvalue(), 'jpg', 'image/jpeg', img.size
+        quality = max(config.preprocess_min_quality, quality - 10)
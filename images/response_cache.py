@@ -0,0 +1,158 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import functools
+import hashlib
+import secrets
+import threading
+from typing import Iterable, Union
+from django.apps import apps
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from .models import Image, Comment
+
+GLOBAL_VERSION_KEY = 'images:version'
+# Changes with any image's comments, for lists that embed them
+COMMENTS_VERSION_KEY = 'images:version:comments'
+_counters = {'hits': 0, 'misses': 0, 'not_modified': 0}
+_counters_lock = threading.Lock()
+
+def get_cache():
+    return caches[apps.get_app_config('images').response_cache_alias]
+
+def enabled() -> bool:
+    return apps.get_app_config('images').response_cache_enabled
+
+def image_version_key(image_id) -> str:
+    return f'images:version:{image_id}'
+
+def _new_version() -> str:
+    # Random rather than incremented, so versions never repeat, even after an eviction
+    return secrets.token_hex(8)
+
+def versions(*keys: str) -> list:
+    """
+    The current version of each key, creating versions that don't exist (yet, or any more).
+    """
+    cache = get_cache()
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            cache.add(key, _new_version(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+def bump_images(image_ids: Iterable, global_version: bool = True, comments: bool = False):
+    """
+    Give the images (and by default the image list) new versions, so responses cached
+    for the old versions are never served again.  Done straight away and again once the
+    current transaction commits, so no response built before the commit outlives it.
+    Set `comments` when the images' comments changed.
+    """
+    keys = [image_version_key(image_id) for image_id in image_ids]
+    if global_version:
+        keys.append(GLOBAL_VERSION_KEY)
+    if comments:
+        keys.append(COMMENTS_VERSION_KEY)
+    if not keys:
+        return
+
+    def bump():
+        get_cache().set_many({key: _new_version() for key in keys}, None)
+
+    bump()
+    transaction.on_commit(bump)
+
+def cached_response(per_image: bool = False, comments_param: Union[str, None] = None):
+    """
+    Cache a GET view's 200 responses under the current version of the image list, or of
+    the `image_id` the view is called with when `per_image` is set.  Requests with the
+    `comments_param` query parameter embed comments, so also depend on the comments version.
+    Every response gets a strong ETag derived from the versions, and a request whose
+    If-None-Match still matches is answered 304 without calling the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not enabled():
+                return view(request, *args, **kwargs)
+
+            version_keys = [image_version_key(kwargs['image_id']) if per_image else GLOBAL_VERSION_KEY]
+            if comments_param and comments_param in request.GET:
+                version_keys.append(COMMENTS_VERSION_KEY)
+            version = ':'.join(versions(*version_keys))
+            fingerprint = f'{view.__name__}|{version}|{request.get_full_path()}'
+            digest = hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:32]
+            etag = f'"{digest}"'
+
+            if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+                _count('not_modified')
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+            cache = get_cache()
+            cache_key = f'images:response:{digest}'
+            cached = cache.get(cache_key)
+            if cached is not None:
+                _count('hits')
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Cache'] = 'hit'
+            else:
+                _count('misses')
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                if hasattr(response, 'render') and not response.is_rendered:
+                    response.render()
+                cache.set(cache_key, (response.content, response['Content-Type']),
+                          apps.get_app_config('images').response_cache_ttl)
+                response['X-Cache'] = 'miss'
+            response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
+
+def _count(name: str):
+    with _counters_lock:
+        _counters[name] += 1
+
+def stats() -> dict:
+    """
+    Hits (including 304s) and misses of this process.
+    """
+    with _counters_lock:
+        counters = dict(_counters)
+    served = counters['hits'] + counters['not_modified']
+    total = served + counters['misses']
+    return {**counters, 'hit_ratio': served / total if total else 0.0}
+
+def reset_counters():
+    with _counters_lock:
+        for name in _counters:
+            _counters[name] = 0
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+def _bump_image(sender, instance, **kwargs):
+    bump_images([instance.pk])
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def _bump_commented_image(sender, instance, origin=None, **kwargs):
+    # Comments are only part of the image list when it embeds them.  An edit that moves a
+    # comment (see counters._remember_comment_image) changes the image it left as well.
+    # The image's own delete bumps it when its comments go with it
+    if Comment.deleted_with_image(origin):
+        return
+    image_ids = {instance.image_id}
+    previous = getattr(instance, '_previous_image_id', None)
+    if previous is not None:
+        image_ids.add(previous)
+    bump_images(image_ids, global_version=False, comments=True)
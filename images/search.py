@@ -0,0 +1,67 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+from typing import Iterable
+from django.apps import apps
+from django.contrib.postgres.expressions import ArraySubquery
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, Func, OuterRef, QuerySet, TextField, Value
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Image, Comment
+
+def search_vector():
+    """
+    The search_vector of the outer image: its description (weighted A) and the text of
+    its newest search_comments_max comments (weighted B), for update().
+    """
+    config = apps.get_app_config('images')
+    # The description is a JSON string; #>> '{}' unwraps it to plain text
+    description = Func(F('description'), template="(%(expressions)s #>> '{}')", output_field=TextField())
+    newest = Comment.objects.filter(image=OuterRef('pk')).order_by('-created_at', '-id').values('content')[:config.search_comments_max]
+    comments = Func(ArraySubquery(newest), Value(' '), function='array_to_string', output_field=TextField())
+    return (
+        SearchVector(description, weight='A', config=config.search_config)
+        + SearchVector(comments, weight='B', config=config.search_config)
+    )
+
+def update_search_vectors(image_ids: Iterable) -> int:
+    """
+    Recompute the images' search_vector.  Needed after writes that send no signals,
+    such as bulk_update() or update() of descriptions.
+    """
+    return Image.objects.filter(pk__in=list(image_ids)).update(search_vector=search_vector())
+
+def search(text: str) -> QuerySet:
+    """
+    Images matching `text` (web search syntax: words, "quoted phrases", or, -word),
+    annotated with their `rank`, and `search_key`, the negated rank to page on in
+    ascending order so the best matches come first.  Only the newest search_max_ranked
+    matches are ranked, as ranking all of a common word's matches takes seconds.
+    """
+    config = apps.get_app_config('images')
+    query = SearchQuery(text, search_type='websearch', config=config.search_config)
+    matches = Image.objects.filter(search_vector=query)
+    if config.search_max_ranked:
+        matches = Image.objects.filter(pk__in=matches.order_by('-pk').values('pk')[:config.search_max_ranked])
+    return matches.annotate(
+        rank=SearchRank(F('search_vector'), query),
+    ).annotate(search_key=-F('rank'))
+
+@receiver(post_save, sender=Image)
+def _index_saved_image(sender, instance, created, **kwargs):
+    # New uploads have nothing to index until they're described
+    if not (created and instance.description is None):
+        update_search_vectors([instance.pk])
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def _index_commented_image(sender, instance, origin=None, **kwargs):
+    if Comment.deleted_with_image(origin):
+        return
+    image_ids = {instance.image_id}
+    previous = getattr(instance, '_previous_image_id', None)
+    if previous is not None:
+        image_ids.add(previous)
+    update_search_vectors(image_ids)
@@ -4,6 +4,7 @@ Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer
 
 from rest_framework import serializers
 from images.models import Image, Comment
+from images import thumbnails
 
 class ImageUploadSerializer(serializers.ModelSerializer):
     class Meta:
@@ -11,14 +12,25 @@ class ImageUploadSerializer(serializers.ModelSerializer):
         fields = ['file']
 
 class ImageSerializer(serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = Image
-        fields = ['id', 'file', 'description', 'analyzed']
+        fields = ['id', 'file', 'description', 'analyzed', 'status', 'analysis', 'width', 'height', 'image_format', 'byte_size', 'thumbnails']
+
+    def get_thumbnails(self, image) -> dict:
+        # Thumbnail URLs by width, or None without a file
+        return thumbnails.urls(image.id, image.file.name)
         
 class CommentCreateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
         fields = ['content']
+class CommentBatchItemSerializer(serializers.Serializer):
+    # One comment of a batch posted to /comments
+    image_id = serializers.IntegerField(min_value=1)
+    content = serializers.CharField()
+
 class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Comment
@@ -0,0 +1,164 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import hashlib
+import os
+import re
+import shutil
+from typing import Union
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.deconstruct import deconstructible
+
+# Leading bytes of the image formats uploads may be in, what Pillow calls them, and the
+# extension content-addressed names get, so the same bytes always get the same name
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+    (b'BM', 'BMP'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+)
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp', 'BMP': '.bmp', 'TIFF': '.tif'}
+# Bytes needed to tell the formats apart (a WEBP is RIFF....WEBP)
+SIGNATURE_BYTES = 12
+CONTENT_ADDRESSED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+def sniff_format(header: bytes) -> Union[str, None]:
+    # The image format `header` starts with, or None
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    for signature, image_format in SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    return None
+
+def is_content_addressed(name: str) -> bool:
+    return bool(name and CONTENT_ADDRESSED_NAME.search(name))
+
+def _stored_files():
+    # Looked up when used, as models.py imports this module for Image.file's storage
+    return apps.get_model('images', 'StoredFile').objects
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Names each file by the SHA-256 of its bytes, under two levels of shard directories
+    (`images/ab/cd/abcd...ef.jpg`), so no directory holds more than a few hundred
+    entries and identical uploads share one file.  StoredFile counts the references to
+    each file: saving takes one, delete() drops one, and the file goes with the last.
+
+    Saves, adoptions and deletions of a name are serialized by a lock on its StoredFile
+    row, so a file is never removed while another upload is relying on it.
+    """
+    def shard_name(self, directory: str, content_hash: str, extension: str) -> str:
+        return os.path.join(directory, content_hash[:2], content_hash[2:4], content_hash + extension)
+
+    def _extension(self, name: str, header: bytes) -> str:
+        image_format = sniff_format(header)
+        return EXTENSIONS[image_format] if image_format else os.path.splitext(name)[1].lower()
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        content.seek(0)
+        header = content.read(SIGNATURE_BYTES)
+        content.seek(0)
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        name = self.shard_name(os.path.dirname(name), digest.hexdigest(), self._extension(name, header))
+        with transaction.atomic():
+            self._reference(name, digest.hexdigest(), content.size)
+            if not self.exists(name):
+                super()._save(name, content)
+        return name
+
+    def adopt(self, path: str, content_hash: str, directory: str = 'images', refs: int = 1, keep_source: bool = False) -> str:
+        """
+        Take `refs` references to the file at `path` (already on this filesystem) under its
+        content-addressed name.  The file is moved there, or linked with `keep_source`; when
+        the bytes are stored already the source is just removed (or kept).  Returns the name.
+        """
+        with open(path, 'rb') as source:
+            header = source.read(SIGNATURE_BYTES)
+        name = self.shard_name(directory, content_hash, self._extension(path, header))
+        target = self.path(name)
+        with transaction.atomic():
+            self._reference(name, content_hash, os.path.getsize(path), refs)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                if not keep_source:
+                    os.replace(path, target)
+                else:
+                    try:
+                        os.link(path, target)
+                    except OSError:
+                        shutil.copyfile(path, target)
+            elif not keep_source:
+                os.remove(path)
+        return name
+
+    def _reference(self, name: str, content_hash: str, size: int, refs: int = 1):
+        # Lock the StoredFile row for `name`, creating it, and count `refs` more references
+        stored, _ = _stored_files().select_for_update().get_or_create(
+            name=name, defaults={'content_hash': content_hash, 'size': size},
+        )
+        _stored_files().filter(pk=stored.pk).update(ref_count=F('ref_count') + refs)
+
+    def delete(self, name):
+        """
+        Drop a reference to a content-addressed file, removing it with the last one.
+        Other names (from before this storage) are deleted outright.
+        """
+        if not is_content_addressed(name):
+            return super().delete(name)
+        with transaction.atomic():
+            stored = _stored_files().select_for_update().filter(name=name).first()
+            if stored is None or stored.ref_count <= 1:
+                _stored_files().filter(name=name).delete()
+                super().delete(name)
+            else:
+                _stored_files().filter(pk=stored.pk).update(ref_count=F('ref_count') - 1)
+
+def media_storage():
+    # Image.file's storage, picked by ImagesConfig.content_addressed_storage
+    if apps.get_app_config('images').content_addressed_storage:
+        return ContentAddressedStorage()
+    return FileSystemStorage()
+
+def _release_file(storage, name: str):
+    # Once the transaction commits, so a rollback keeps the file
+    if isinstance(storage, ContentAddressedStorage) and is_content_addressed(name):
+        transaction.on_commit(lambda: storage.delete(name))
+
+@receiver(post_delete, sender='images.Image')
+def _release_deleted_image_file(sender, instance, **kwargs):
+    _release_file(instance.file.storage, instance.file.name)
+
+@receiver(pre_save, sender='images.Image')
+def _remember_image_file(sender, instance, raw, update_fields=None, **kwargs):
+    # Replacing Image.file must drop the old file's reference.  A new upload takes its
+    # own when saved, as does adopt() for a name that is assigned.
+    if raw or instance.pk is None or not isinstance(instance.file.storage, ContentAddressedStorage):
+        return
+    if update_fields is not None and 'file' not in update_fields:
+        return
+    instance._previous_file_name = sender.objects.filter(pk=instance.pk).values_list('file', flat=True).first()
+    instance._file_uploaded = bool(instance.file) and not instance.file._committed
+
+@receiver(post_save, sender='images.Image')
+def _release_replaced_image_file(sender, instance, created, raw, **kwargs):
+    previous = instance.__dict__.pop('_previous_file_name', None)
+    uploaded = instance.__dict__.pop('_file_uploaded', False)
+    if raw or created or not previous:
+        return
+    # Re-uploading the same bytes keeps the name but still took a reference
+    if previous != instance.file.name or uploaded:
+        _release_file(instance.file.storage, previous)
@@ -0,0 +1,54 @@
+import io
+import os
+import tempfile
+
+from django.test import override_settings
+from PIL import Image as PILImage
+
+from ..counters import repair_comment_counts
+from ..preprocessing import EXIF_ORIENTATION
+
+def image_bytes(size=(8, 8), format='PNG', color='red', mode='RGB', orientation=None) -> bytes:
+    # A solid `color` image file, with an EXIF orientation when one is given
+    output = io.BytesIO()
+    image = PILImage.new(mode, size, color)
+    if orientation:
+        exif = PILImage.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        image.save(output, format=format, exif=exif)
+    else:
+        image.save(output, format=format)
+    return output.getvalue()
+
+class MediaRootMixin:
+    """
+    For TestCases that store files: MEDIA_ROOT is a temporary directory, removed after each test.
+    """
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root.name)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_root.cleanup()
+        super().tearDown()
+
+    def _media_path(self, name: str) -> str:
+        return os.path.join(self.media_root.name, name)
+
+    def _stored_files(self) -> list:
+        # Names of the files under MEDIA_ROOT, relative to it
+        return sorted(os.path.relpath(os.path.join(root, name), self.media_root.name)
+                      for root, _, names in os.walk(self.media_root.name) for name in names)
+
+class CountedCommentsMixin:
+    """
+    For TestCases loading the comments fixture: loaddata saves comments raw, bypassing the
+    comment_count receivers, so the counts are derived from the rows once they're loaded.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        repair_comment_counts()
@@ -0,0 +1,120 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from .. import actions
+from ..describers import ImageDescriberError
+from ..models import Image, AnalysisJob
+
+class AnalysisJobTest(TestCase):
+    def setUp(self):
+        # Use the DummyDescriber so nothing leaves the process
+        apps.get_app_config('images').openai_api_key = ''
+        apps.get_app_config('images').analysis_retry_delay = 30
+        self.image = Image.objects.create(file='some_test_file.jpg')
+
+    def test_enqueue_analysis_creates_a_queued_job(self):
+        job = actions.enqueue_analysis(self.image)
+
+        self.assertEqual(job.status, AnalysisJob.Status.QUEUED)
+        self.assertEqual(job.attempts, 0)
+
+    def test_claim_marks_due_jobs_running_and_counts_the_attempt(self):
+        due = actions.enqueue_analysis(self.image)
+        later = AnalysisJob.objects.create(image=self.image, run_after=timezone.now() + timedelta(hours=1))
+
+        claimed = actions.claim_analysis_jobs('test-worker', 10)
+
+        self.assertEqual([due.id], [job.id for job in claimed])
+        self.assertEqual(claimed[0].status, AnalysisJob.Status.RUNNING)
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(claimed[0].locked_by, 'test-worker')
+        later.refresh_from_db()
+        self.assertEqual(later.status, AnalysisJob.Status.QUEUED)
+
+    def test_claim_respects_the_limit(self):
+        for _ in range(3):
+            actions.enqueue_analysis(self.image)
+
+        self.assertEqual(len(actions.claim_analysis_jobs('test-worker', 2)), 2)
+
+    def test_claim_reclaims_jobs_whose_lease_expired(self):
+        stale = AnalysisJob.objects.create(
+            image=self.image,
+            status=AnalysisJob.Status.RUNNING,
+            attempts=1,
+            locked_by='dead-worker',
+            locked_at=timezone.now() - timedelta(days=1)
+        )
+
+        claimed = actions.claim_analysis_jobs('test-worker', 10)
+
+        self.assertEqual([stale.id], [job.id for job in claimed])
+        self.assertEqual(claimed[0].attempts, 2)
+
+    def test_run_analysis_job_analyzes_the_image(self):
+        actions.enqueue_analysis(self.image)
+        job = actions.run_analysis_job(actions.claim_analysis_jobs('test-worker', 1)[0])
+
+        self.image.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.Status.DONE)
+        self.assertTrue(self.image.analyzed)
+        self.assertEqual(self.image.status, Image.Status.ANALYZED)
+
+    @patch('images.actions.analyze_image', side_effect=ImageDescriberError('upstream is down'))
+    def test_failed_jobs_are_requeued_with_a_delay(self, analyze_mock):
+        actions.enqueue_analysis(self.image)
+        job = actions.run_analysis_job(actions.claim_analysis_jobs('test-worker', 1)[0])
+
+        self.image.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.Status.QUEUED)
+        self.assertEqual(job.last_error, 'upstream is down')
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=20))
+        self.assertEqual(self.image.status, Image.Status.PENDING)
+
+    @patch('images.actions.analyze_image', side_effect=ImageDescriberError('upstream is down'))
+    def test_jobs_fail_for_good_after_max_attempts(self, analyze_mock):
+        AnalysisJob.objects.create(image=self.image, max_attempts=1)
+        job = actions.run_analysis_job(actions.claim_analysis_jobs('test-worker', 1)[0])
+
+        self.image.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.Status.FAILED)
+        self.assertEqual(self.image.status, Image.Status.FAILED)
+
+    @patch('images.describers.DummyDescriber.describe_images', autospec=True)
+    def test_run_analysis_jobs_describes_images_in_batches(self, describe_mock):
+        describe_mock.side_effect = lambda describer, files, content_hashes=None: [f'about {file}' for file in files[:-1]] + [None]
+        for i in range(4):
+            actions.enqueue_analysis(Image.objects.create(file=f'some_test_file_{i}.jpg'))
+
+        jobs = actions.run_analysis_jobs(actions.claim_analysis_jobs('test-worker', 4), batch_size=2)
+
+        self.assertEqual(describe_mock.call_count, 2)
+        self.assertEqual([job.status for job in jobs], [AnalysisJob.Status.DONE, AnalysisJob.Status.QUEUED] * 2)
+        self.assertEqual(Image.objects.filter(status=Image.Status.ANALYZED).count(), 2)
+
+class AnalysisWorkerCommandTest(TransactionTestCase):
+    def test_once_drains_the_queue_and_exits(self):
+        apps.get_app_config('images').openai_api_key = ''
+        images = [Image.objects.create(file=f'some_test_file_{i}.jpg') for i in range(3)]
+        for image in images:
+            actions.enqueue_analysis(image)
+
+        call_command('analysis_worker', '--once', '--concurrency=2', stdout=StringIO())
+
+        self.assertEqual(AnalysisJob.objects.filter(status=AnalysisJob.Status.DONE).count(), 3)
+        self.assertEqual(Image.objects.filter(status=Image.Status.ANALYZED).count(), 3)
+
+    def test_batch_size_groups_jobs_into_batches(self):
+        apps.get_app_config('images').openai_api_key = ''
+        for i in range(5):
+            actions.enqueue_analysis(Image.objects.create(file=f'some_test_file_{i}.jpg'))
+
+        call_command('analysis_worker', '--once', '--concurrency=2', '--batch-size=2', stdout=StringIO())
+
+        self.assertEqual(Image.objects.filter(status=Image.Status.ANALYZED).count(), 5)
@@ -0,0 +1,107 @@
+import json
+import os
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import actions
+from ..batch_files import BatchFileWriter, export_unanalyzed, import_results
+from ..models import Image, AnalysisJob
+from ..openai_adapter import OpenAiAdapter
+from .helpers import MediaRootMixin, image_bytes
+
+class BatchFileTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        apps.get_app_config('images').openai_api_key = 'some-random-key'
+        os.makedirs(self._media_path('images'))
+        self.images = [self._make_image(f'image-{i}.png') for i in range(3)]
+
+    def _make_image(self, name):
+        with open(self._media_path(f'images/{name}'), 'wb') as image_file:
+            image_file.write(image_bytes((32, 32)))
+        return Image.objects.create(file=f'images/{name}')
+
+    def _export(self, *args):
+        output = self._media_path('batch.jsonl')
+        call_command('export_batch', output, *args, stdout=StringIO())
+        return output
+
+    def _read_lines(self, path):
+        with open(path) as batch_file:
+            return [json.loads(line) for line in batch_file]
+
+    def test_export_writes_one_batch_request_per_unanalyzed_image(self):
+        Image.objects.filter(pk=self.images[1].pk).update(analyzed_at=timezone.now())
+        Image.objects.create(file='images/missing.png')
+
+        lines = self._read_lines(self._export())
+
+        self.assertEqual([line['custom_id'] for line in lines], [f'image-{self.images[0].id}', f'image-{self.images[2].id}'])
+        self.assertEqual(lines[0]['url'], '/v1/chat/completions')
+        self.assertEqual(lines[0]['body'], OpenAiAdapter().make_image_prompt(self.images[0].file.path))
+
+    def test_export_does_not_need_an_api_key(self):
+        apps.get_app_config('images').openai_api_key = ''
+
+        self.assertEqual(len(self._read_lines(self._export())), 3)
+
+    def test_the_writer_starts_a_new_file_at_the_request_limit(self):
+        with BatchFileWriter(self._media_path('batch.jsonl'), max_requests=2) as writer:
+            counts = export_unanalyzed(writer)
+
+        self.assertEqual(counts, {'exported': 3, 'skipped': 0})
+        self.assertEqual([os.path.basename(path) for path in writer.paths], ['batch.jsonl', 'batch-2.jsonl'])
+        self.assertEqual([len(self._read_lines(path)) for path in writer.paths], [2, 1])
+
+    def test_import_saves_the_descriptions_from_a_results_file(self):
+        job = actions.enqueue_analysis(self.images[0])
+        results = self._media_path('results.jsonl')
+        with open(results, 'w') as results_file:
+            for i, request in enumerate(self._read_lines(self._export())):
+                ok = i != 1
+                results_file.write(json.dumps({
+                    'custom_id': request['custom_id'],
+                    'response': {'status_code': 200 if ok else 500, 'body': {
+                        'choices': [{'message': {'content': f'description of {request["custom_id"]}'}}]
+                    }},
+                    'error': None,
+                }) + '\n')
+            results_file.write(json.dumps({'custom_id': 'image-999999', 'response': {
+                'status_code': 200, 'body': {'choices': [{'message': {'content': 'nobody'}}]}
+            }}) + '\n')
+            results_file.write('not json\n')
+
+        output = StringIO()
+        call_command('import_batch', results, '--chunk-size=2', stdout=output)
+
+        self.assertIn('imported 2, 1 failed requests, 1 unknown images, 1 malformed lines', output.getvalue())
+        first, second, third = (Image.objects.get(pk=image.pk) for image in self.images)
+        self.assertEqual(first.description, f'description of image-{first.id}')
+        self.assertEqual(first.status, Image.Status.ANALYZED)
+        self.assertTrue(third.analyzed)
+        self.assertFalse(second.analyzed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.Status.DONE)
+
+    def test_import_stores_structured_results_in_analysis(self):
+        content = json.dumps({'description': 'a red square', 'labels': ['Shape'], 'objects': ['square']})
+        line = json.dumps({'custom_id': f'image-{self.images[0].id}', 'response': {
+            'status_code': 200, 'body': {'choices': [{'message': {'content': content}}]}
+        }})
+
+        import_results([line])
+
+        image = Image.objects.get(pk=self.images[0].pk)
+        self.assertEqual(image.description, 'a red square')
+        self.assertEqual(image.analysis, {'labels': ['shape'], 'objects': ['square'], 'text': '', 'confidence': None})
+
+    def test_import_results_accepts_any_iterable_of_lines(self):
+        line = json.dumps({'custom_id': f'image-{self.images[0].id}', 'response': {
+            'status_code': 200, 'body': {'choices': [{'message': {'content': 'a red square'}}]}
+        }})
+
+        self.assertEqual(import_results(iter([line, ''])), {'imported': 1, 'failed': 0, 'unknown': 0, 'malformed': 0})
@@ -0,0 +1,119 @@
+from io import StringIO
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..counters import CountedPaginator, image_total, IMAGE_TOTAL_KEY
+from ..models import Image, Comment
+from ..response_cache import bump_images
+
+class CommentCountTest(TestCase):
+    def setUp(self):
+        self.image = Image.objects.create(file='some_test_file.jpg')
+        self.other = Image.objects.create(file='some_test_file_2.jpg')
+
+    def _counts(self):
+        return [Image.objects.get(pk=image.pk).comment_count for image in (self.image, self.other)]
+
+    def test_comments_posted_through_the_endpoint_are_counted(self):
+        for content in ['first', 'second']:
+            self.client.post(f'/image/{self.image.id}/comments', {'content': content})
+
+        self.assertEqual(self._counts(), [2, 0])
+
+    def test_deleting_comments_decrements_the_count(self):
+        comments = [Comment.objects.create(image=self.image, content=str(i)) for i in range(3)]
+        comments[0].delete()
+        Comment.objects.filter(pk=comments[1].pk).delete()
+
+        self.assertEqual(self._counts(), [1, 0])
+
+    def test_deleting_an_image_skips_the_per_comment_work(self):
+        Comment.objects.bulk_create([Comment(image=self.image, content=str(i)) for i in range(50)])
+        # A count that drifted low doesn't stop the delete
+        Image.objects.filter(pk=self.image.pk).update(comment_count=3)
+
+        image = Image.objects.get(pk=self.image.pk)
+        with CaptureQueriesContext(connection) as queries:
+            image.delete()
+
+        # Not a query or three per comment
+        self.assertLess(len(queries), 20)
+        self.assertFalse(Comment.objects.filter(image_id=self.image.pk).exists())
+
+    def test_counts_never_go_below_zero(self):
+        comment = Comment.objects.create(image=self.image, content='uncounted')
+        Image.objects.filter(pk=self.image.pk).update(comment_count=0)
+        comment.delete()
+
+        self.assertEqual(self._counts(), [0, 0])
+
+    def test_moving_a_comment_to_another_image_moves_its_count(self):
+        comment = Comment.objects.create(image=self.image, content='misfiled')
+        comment.image = self.other
+        comment.save()
+        comment.content = 'edited'
+        comment.save()
+
+        self.assertEqual(self._counts(), [0, 1])
+
+    def test_the_repair_command_fixes_counts_that_drifted(self):
+        # bulk_create sends no signals
+        Comment.objects.bulk_create([Comment(image=self.image, content=str(i)) for i in range(4)])
+        Image.objects.filter(pk=self.other.pk).update(comment_count=7)
+
+        check = StringIO()
+        call_command('repair_counts', '--check', stdout=check)
+        call_command('repair_counts', '--chunk-size=1', stdout=StringIO())
+
+        self.assertIn('2 images have a wrong comment_count', check.getvalue())
+        self.assertEqual(self._counts(), [4, 0])
+
+class ImageTotalTest(TestCase):
+    def setUp(self):
+        cache.delete(IMAGE_TOTAL_KEY)
+        self.config = apps.get_app_config('images')
+        self.saved_ttl = self.config.image_total_cache_ttl
+        self.config.image_page_size = 2
+        images = Image.objects.bulk_create([Image(file=f'some_test_file_{i}.jpg') for i in range(3)])
+        # bulk_create sends no signals, so nothing else retires earlier cached pages
+        bump_images(image.id for image in images)
+
+    def tearDown(self):
+        self.config.image_total_cache_ttl = self.saved_ttl
+        cache.delete(IMAGE_TOTAL_KEY)
+
+    def test_the_total_is_counted_once_and_then_served_from_the_cache(self):
+        self.assertEqual(image_total(), 3)
+
+        with self.assertNumQueries(1):
+            rsp = self.client.get('/images/?page=2')
+        self.assertEqual(rsp.json()['num_pages'], 2)
+
+    def test_a_zero_ttl_counts_every_time(self):
+        self.config.image_total_cache_ttl = 0
+        image_total()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(image_total(), 3)
+
+    def test_the_cached_total_follows_committed_creates_and_deletes(self):
+        image_total()
+        with self.captureOnCommitCallbacks(execute=True):
+            image = Image.objects.create(file='some_test_file.jpg')
+        self.assertEqual(image_total(), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertEqual(image_total(), 3)
+
+    def test_a_counted_paginator_never_counts(self):
+        paginator = CountedPaginator(Image.objects.order_by('id'), 2, count=3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(paginator.page(2)), 1)
+        self.assertEqual(paginator.num_pages, 2)
@@ -1,9 +1,13 @@
-from unittest.mock import patch
+from unittest.mock import patch, AsyncMock
 
 from django.apps import apps
 from django.test import TestCase
 
-from ..describers  import ImageDescriber, DummyDescriber, OpenAIDescriber, make_image_describer
+from ..describers  import (
+    ImageDescriber, DummyDescriber, OpenAIDescriber, make_image_describer,
+    AsyncImageDescriber, AsyncDummyDescriber, AsyncOpenAIDescriber, make_async_image_describer
+)
+from ..openai_adapter import BatchReplyError, OpenAIError
 
 class DummyDescriberTest(TestCase):
     def setUp(self):
@@ -33,8 +37,31 @@ class OpenAIDescriberTest(TestCase):
         image_path = 'some_image_path.jpg'
         description = self.describer.describe_image(image_path)
         
-        adapter_method_mock.assert_called_with(image_path)
+        adapter_method_mock.assert_called_with(image_path, None)
         self.assertEqual(description, adapter_method_mock.return_value)
+
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_image_description')
+    def test_it_reuses_its_adapter_between_calls(self, adapter_method_mock):
+        self.describer.describe_image('first.jpg')
+        adapter = self.describer.adapter
+        self.describer.describe_image('second.jpg')
+
+        self.assertIs(self.describer.adapter, adapter)
+
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_batch_descriptions')
+    def test_it_describes_several_images_in_one_batch(self, batch_mock):
+        batch_mock.return_value = ['first', 'second']
+
+        self.assertEqual(self.describer.describe_images(['first.jpg', 'second.jpg']), ['first', 'second'])
+        batch_mock.assert_called_once_with(['first.jpg', 'second.jpg'], None)
+
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_image_description')
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_batch_descriptions', side_effect=BatchReplyError('garbled'))
+    def test_a_malformed_batch_reply_falls_back_to_one_request_per_image(self, batch_mock, single_mock):
+        single_mock.side_effect = ['first', OpenAIError('upstream is down')]
+
+        self.assertEqual(self.describer.describe_images(['first.jpg', 'second.jpg']), ['first', None])
+        self.assertEqual(single_mock.call_count, 2)
 class ImageDescriberFactoryTest(TestCase):
     def test_if_open_api_key_is_blank_it_should_return_DummyDescriber(self):
         apps.get_app_config('images').openai_api_key = ''
@@ -45,3 +72,27 @@ class ImageDescriberFactoryTest(TestCase):
         apps.get_app_config('images').openai_api_key = 'some-api-key'
         
         self.assertIsInstance(make_image_describer(), OpenAIDescriber)
+
+class AsyncDescriberTest(TestCase):
+    async def test_the_async_dummy_describer_returns_a_dummy_description(self):
+        describer = AsyncDummyDescriber()
+
+        self.assertIsInstance(describer, AsyncImageDescriber)
+        self.assertIsInstance(await describer.describe_image('any_path.png'), str)
+
+    @patch('images.openai_adapter.AsyncOpenAiAdapter.prompt_image_description', new_callable=AsyncMock)
+    async def test_the_async_openai_describer_awaits_the_async_adapter(self, adapter_method_mock):
+        apps.get_app_config('images').openai_api_key = 'some-random-key'
+        adapter_method_mock.return_value = 'This is a description of the image from OpenAI'
+
+        description = await AsyncOpenAIDescriber().describe_image('some_image_path.jpg')
+
+        adapter_method_mock.assert_awaited_with('some_image_path.jpg')
+        self.assertEqual(description, adapter_method_mock.return_value)
+
+    def test_the_async_factory_follows_the_api_key(self):
+        apps.get_app_config('images').openai_api_key = ''
+        self.assertIsInstance(make_async_image_describer(), AsyncDummyDescriber)
+
+        apps.get_app_config('images').openai_api_key = 'some-api-key'
+        self.assertIsInstance(make_async_image_describer(), AsyncOpenAIDescriber)
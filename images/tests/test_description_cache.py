@@ -0,0 +1,137 @@
+import hashlib
+from io import StringIO
+from unittest.mock import patch
+
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+
+from .. import actions, description_cache
+from ..models import Image, DescriptionCacheEntry
+from ..openai_adapter import OpenAiAdapter, BatchReplyError
+
+PARAMS = {'model': 'gpt-4-vision-preview', 'prompt': "what's in this image?", 'max_tokens': 300}
+
+class DescriptionCacheTest(TestCase):
+    def setUp(self):
+        apps.get_app_config('images').description_cache_max_entries = 100
+        apps.get_app_config('images').description_cache_evict_interval = 1000
+        description_cache.reset_counters()
+
+    def test_hash_file_is_the_sha256_of_the_content(self):
+        upload = SimpleUploadedFile('image.png', b'some image bytes')
+
+        self.assertEqual(description_cache.hash_file(upload), hashlib.sha256(b'some image bytes').hexdigest())
+
+    def test_it_misses_then_hits_and_counts_both(self):
+        self.assertIsNone(description_cache.get('abc', PARAMS))
+        description_cache.put('abc', PARAMS, 'a cat on a mat')
+
+        self.assertEqual(description_cache.get('abc', PARAMS), 'a cat on a mat')
+        stats = description_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stored_hits']), (1, 1, 1))
+
+    def test_the_key_includes_the_prompt_model_and_max_tokens(self):
+        description_cache.put('abc', PARAMS, 'a cat on a mat')
+
+        self.assertIsNone(description_cache.get('abc', {**PARAMS, 'prompt': 'describe this worksheet'}))
+        self.assertIsNone(description_cache.get('abc', {**PARAMS, 'model': 'another-model'}))
+        self.assertIsNone(description_cache.get('abc', {**PARAMS, 'max_tokens': 50}))
+
+    def test_it_evicts_the_least_recently_used_entries(self):
+        apps.get_app_config('images').description_cache_max_entries = 2
+        apps.get_app_config('images').description_cache_evict_interval = 1
+        description_cache.put('first', PARAMS, 'one')
+        description_cache.put('second', PARAMS, 'two')
+        description_cache.get('first', PARAMS)
+        description_cache.put('third', PARAMS, 'three')
+
+        self.assertEqual(
+            {'first', 'third'},
+            set(DescriptionCacheEntry.objects.values_list('content_hash', flat=True))
+        )
+
+    def test_eviction_waits_for_the_interval(self):
+        apps.get_app_config('images').description_cache_max_entries = 1
+        apps.get_app_config('images').description_cache_evict_interval = 3
+        description_cache.put('first', PARAMS, 'one')
+        description_cache.put('second', PARAMS, 'two')
+        # Replacing an entry doesn't count towards the interval
+        description_cache.put('second', PARAMS, 'two again')
+        self.assertEqual(DescriptionCacheEntry.objects.count(), 2)
+
+        description_cache.put('third', PARAMS, 'three')
+        self.assertEqual(list(DescriptionCacheEntry.objects.values_list('content_hash', flat=True)), ['third'])
+
+    def test_invalidate_stale_drops_entries_for_other_prompts(self):
+        description_cache.put('abc', PARAMS, 'current')
+        description_cache.put('abc', {**PARAMS, 'prompt': 'an old prompt'}, 'stale')
+
+        self.assertEqual(description_cache.invalidate_stale([PARAMS]), 1)
+        self.assertEqual(description_cache.get('abc', PARAMS), 'current')
+
+    def test_the_management_command_invalidates_stale_entries(self):
+        description_cache.put('abc', {**PARAMS, 'prompt': 'an old prompt'}, 'stale')
+        description_cache.put('abc', OpenAiAdapter.prompt_params(), 'current')
+        description_cache.put('abc', OpenAiAdapter.batch_prompt_params(), 'current batch')
+
+        call_command('description_cache', '--stale', stdout=StringIO())
+
+        self.assertEqual(
+            set(DescriptionCacheEntry.objects.values_list('description', flat=True)), {'current', 'current batch'}
+        )
+
+class AnalyzeImageCacheTest(TestCase):
+    def setUp(self):
+        apps.get_app_config('images').openai_api_key = 'some-api-key'
+        apps.get_app_config('images').description_cache_enabled = True
+
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_image_description', return_value='a worksheet about fractions')
+    def test_identical_images_are_only_described_once(self, describe_mock):
+        first = actions.analyze_image(Image.objects.create(file='first.jpg', content_hash='abc'))
+        second = actions.analyze_image(Image.objects.create(file='second.jpg', content_hash='abc'))
+
+        describe_mock.assert_called_once()
+        self.assertEqual(second.description, first.description)
+        self.assertTrue(second.analyzed)
+
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_image_description', return_value='a worksheet about fractions')
+    def test_different_images_are_described_separately(self, describe_mock):
+        actions.analyze_image(Image.objects.create(file='first.jpg', content_hash='abc'))
+        actions.analyze_image(Image.objects.create(file='second.jpg', content_hash='def'))
+
+        self.assertEqual(describe_mock.call_count, 2)
+
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_image_description', return_value='a worksheet about fractions')
+    def test_the_stored_content_hash_is_passed_on_for_preprocessing(self, describe_mock):
+        image = actions.analyze_image(Image.objects.create(file='first.jpg', content_hash='abc'))
+
+        describe_mock.assert_called_once_with(image.file.path, 'abc')
+
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_batch_descriptions')
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_image_description', return_value='described alone')
+    def test_batches_reuse_descriptions_from_the_single_image_prompt(self, single_mock, batch_mock):
+        description_cache.put('abc', OpenAiAdapter.prompt_params(), 'a worksheet about fractions')
+        first = Image.objects.create(file='first.jpg', content_hash='abc')
+        second = Image.objects.create(file='second.jpg', content_hash='def')
+
+        self.assertEqual(actions.analyze_images([first, second], batch_size=2), {})
+
+        batch_mock.assert_not_called()
+        self.assertEqual(first.description, 'a worksheet about fractions')
+        # The one image left was described with the single-image prompt, and cached under it
+        self.assertEqual(description_cache.get('def', OpenAiAdapter.prompt_params()), 'described alone')
+        self.assertIsNone(description_cache.get('def', OpenAiAdapter.batch_prompt_params()))
+
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_image_description', return_value='described alone')
+    @patch('images.openai_adapter.OpenAiAdapter.prompt_batch_descriptions', side_effect=BatchReplyError('garbled'))
+    def test_descriptions_from_a_failed_batch_are_cached_under_the_single_image_prompt(self, batch_mock, single_mock):
+        images = [Image.objects.create(file='first.jpg', content_hash='abc'),
+                  Image.objects.create(file='second.jpg', content_hash='def')]
+
+        self.assertEqual(actions.analyze_images(images, batch_size=2), {})
+
+        for content_hash in ('abc', 'def'):
+            self.assertEqual(description_cache.get(content_hash, OpenAiAdapter.prompt_params()), 'described alone')
+            self.assertIsNone(description_cache.get(content_hash, OpenAiAdapter.batch_prompt_params()))
@@ -0,0 +1,153 @@
+from django.apps import apps
+from django.test import TestCase
+from ..dispatcher import TokenBucket, RateLimitDispatcher, get_dispatcher, reset_dispatcher, _parse_duration
+from ..openai_adapter import OpenAiAdapter, OpenAIError
+from ..preprocessing import image_tokens
+from .test_open_ai_adapter import make_response
+from unittest.mock import patch
+import asyncio
+import threading
+import time
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class TokenBucketTest(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.bucket = TokenBucket(60, self.clock)
+
+    def test_it_refills_continuously_up_to_its_budget(self):
+        self.bucket.consume(60)
+        self.assertAlmostEqual(self.bucket.delay_for(1), 1.0)
+
+        self.clock.now += 30
+        self.assertEqual(self.bucket.delay_for(30), 0)
+        self.clock.now += 600
+        self.assertAlmostEqual(self.bucket.delay_for(60), 0)
+
+    def test_it_follows_the_remaining_budget_and_reset_the_upstream_reports(self):
+        self.bucket.sync(0, 5.0)
+
+        self.assertAlmostEqual(self.bucket.delay_for(1), 5.0)
+
+    def test_a_zero_budget_is_unlimited(self):
+        bucket = TokenBucket(0, self.clock)
+        bucket.consume(10 ** 9)
+
+        self.assertEqual(bucket.delay_for(10 ** 9), 0)
+
+class RateLimitDispatcherTest(TestCase):
+    def test_a_429_halves_concurrency_and_clean_responses_grow_it_back(self):
+        dispatcher = RateLimitDispatcher(0, 0, max_concurrency=8)
+        with dispatcher.slot(100) as ticket:
+            dispatcher.finish(ticket, 429, {'Retry-After': '0'})
+        self.assertEqual(dispatcher.stats()['concurrency'], 4)
+        self.assertEqual(dispatcher.stats()['throttle_events'], 1)
+
+        for _ in range(5):
+            with dispatcher.slot(100) as ticket:
+                dispatcher.finish(ticket, 200)
+        self.assertEqual(dispatcher.stats()['concurrency'], 5)
+
+    def test_it_waits_out_the_window_the_rate_limit_headers_report(self):
+        dispatcher = RateLimitDispatcher(500, 0, max_concurrency=8)
+        with dispatcher.slot(100) as ticket:
+            dispatcher.finish(ticket, 200, {'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '50ms'})
+
+        started = time.monotonic()
+        with dispatcher.slot(100):
+            pass
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.045)
+        self.assertEqual(dispatcher.stats()['waited'], 1)
+
+    def test_the_token_budget_is_settled_against_actual_usage(self):
+        dispatcher = RateLimitDispatcher(0, 1000, max_concurrency=8)
+        with dispatcher.slot(800) as ticket:
+            dispatcher.finish(ticket, 200, used_tokens=200)
+
+        self.assertEqual(dispatcher.tokens.delay_for(700), 0)
+
+    def test_callers_start_in_arrival_order(self):
+        dispatcher = RateLimitDispatcher(0, 0, max_concurrency=1)
+        order = []
+        def call(name):
+            with dispatcher.slot(1):
+                order.append(name)
+
+        with dispatcher.slot(1):
+            threads = []
+            for name in ['first', 'second', 'third']:
+                thread = threading.Thread(target=call, args=(name,))
+                thread.start()
+                threads.append(thread)
+                while dispatcher.stats()['queue_depth'] < len(threads):
+                    time.sleep(0.001)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(order, ['first', 'second', 'third'])
+
+    async def test_async_callers_share_the_limits(self):
+        dispatcher = RateLimitDispatcher(0, 0, max_concurrency=2)
+        peak = 0
+        async def call():
+            nonlocal peak
+            async with dispatcher.aslot(1):
+                peak = max(peak, dispatcher.stats()['in_flight'])
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(call() for _ in range(6)))
+
+        self.assertEqual(peak, 2)
+        self.assertEqual(dispatcher.stats()['started'], 6)
+
+    def test_it_parses_retry_after_and_reset_durations(self):
+        self.assertEqual(_parse_duration('7'), 7.0)
+        self.assertEqual(_parse_duration('6m0s'), 360.0)
+        self.assertAlmostEqual(_parse_duration('1s20ms'), 1.02)
+        self.assertIsNone(_parse_duration(None))
+
+class DispatchedRequestTest(TestCase):
+    def setUp(self):
+        self.config = apps.get_app_config('images')
+        self.config.openai_api_key = 'some-random-key'
+        self.config.openai_max_retries = 1
+        self.saved = (self.config.rate_limit_enabled, self.config.rate_limit_max_throttles)
+        self.config.rate_limit_enabled = True
+        reset_dispatcher()
+
+    def tearDown(self):
+        self.config.rate_limit_enabled, self.config.rate_limit_max_throttles = self.saved
+        reset_dispatcher()
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_throttled_requests_are_requeued_instead_of_failing(self, post_mock, sleep_mock):
+        throttled = lambda: make_response(429, headers={'Retry-After': '0'})
+        post_mock.side_effect = [throttled(), throttled(), throttled(), make_response(200, b'{"usage": {"total_tokens": 90}}')]
+
+        response = OpenAiAdapter().make_request({'max_tokens': 10})
+
+        self.assertEqual(response.attempts, 4)
+        sleep_mock.assert_not_called()
+        self.assertEqual(get_dispatcher().stats()['throttle_events'], 3)
+
+    @patch('requests.Session.post')
+    def test_it_gives_up_after_rate_limit_max_throttles(self, post_mock):
+        self.config.rate_limit_max_throttles = 2
+        post_mock.side_effect = lambda *args, **kwargs: make_response(429, headers={'Retry-After': '0'})
+
+        self.assertRaises(OpenAIError, OpenAiAdapter().make_request, {})
+        self.assertEqual(post_mock.call_count, 3)
+
+class ImageTokensTest(TestCase):
+    def test_it_prices_images_like_the_vision_model(self):
+        self.assertEqual(image_tokens(4000, 4000, 'low'), 85)
+        self.assertEqual(image_tokens(1024, 1024, 'high'), 765)
+        self.assertEqual(image_tokens(2048, 4096, 'high'), 1105)
@@ -0,0 +1,78 @@
+from datetime import timedelta
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import actions, export
+from ..models import Image, Comment
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.old = Image.objects.create(file='images/old.jpg')
+        self.analyzed = actions._save_description(Image.objects.create(file='images/analyzed.jpg'), 'A whiteboard')
+        self.comment = Comment.objects.create(image=self.analyzed, content='Nice fractions')
+        Image.objects.filter(pk=self.old.pk).update(created_at=timezone.now() - timedelta(days=10))
+
+    def _lines(self, body: bytes) -> list:
+        return [json.loads(line) for line in body.decode('utf-8').splitlines()]
+
+    def test_every_image_and_comment_is_exported_then_a_summary(self):
+        records = self._lines(b''.join(export.ndjson(export.records(chunk_size=1), block_size=10)))
+
+        self.assertEqual([record['type'] for record in records], ['image', 'image', 'comment', 'end'])
+        self.assertEqual({record['id'] for record in records[:2]}, {self.old.id, self.analyzed.id})
+        self.assertEqual(records[2]['id'], self.comment.id)
+        image = next(record for record in records if record.get('id') == self.analyzed.id)
+        self.assertEqual(image['description'], 'A whiteboard')
+        self.assertEqual(image['comment_count'], 1)
+        self.assertTrue(image['analyzed_at'].endswith('Z'))
+        self.assertEqual(records[-1]['type'], 'end')
+        self.assertEqual((records[-1]['images'], records[-1]['comments']), (2, 1))
+
+    def test_since_exports_images_created_or_analyzed_and_comments_created_since(self):
+        Image.objects.filter(pk=self.analyzed.pk).update(created_at=timezone.now() - timedelta(days=10))
+        Comment.objects.filter(pk=self.comment.pk).update(created_at=timezone.now() - timedelta(days=10))
+
+        records = list(export.records(timezone.now() - timedelta(days=1)))
+
+        self.assertEqual([(record['type'], record.get('id')) for record in records[:-1]], [('image', self.analyzed.id)])
+        self.assertLess(export.date_or_datetime(records[-1]['next_since']), timezone.now())
+
+    def test_the_endpoint_streams_gzip_when_accepted(self):
+        rsp = self.client.get('/images/export', HTTP_ACCEPT_ENCODING='gzip, deflate')
+
+        self.assertEqual(rsp.status_code, 200)
+        self.assertTrue(rsp.streaming)
+        self.assertEqual(rsp['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(rsp['Content-Encoding'], 'gzip')
+        self.assertEqual(self._lines(gzip.decompress(b''.join(rsp.streaming_content)))[-1]['images'], 2)
+
+        plain = self.client.get('/images/export?since=2000-01-01')
+        self.assertNotIn('Content-Encoding', plain)
+        self.assertEqual(self._lines(b''.join(plain.streaming_content))[-1]['comments'], 1)
+        self.assertEqual(self.client.get('/images/export?since=yesterday').status_code, 400)
+
+    def test_blocks_can_be_served_asynchronously(self):
+        async def collect():
+            return b''.join([block async for block in export.async_blocks(export.ndjson(export.records()))])
+
+        self.assertEqual(self._lines(async_to_sync(collect)())[-1]['images'], 2)
+
+    def test_the_command_writes_a_gzip_file(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, 'export.ndjson.gz')
+            output = StringIO()
+            call_command('export_ndjson', path, '--chunk-size=1', stdout=output)
+
+            with gzip.open(path) as export_file:
+                records = self._lines(export_file.read())
+        self.assertEqual(len(records), 4)
+        self.assertIn('exported 2 images and 1 comments', output.getvalue())
+        self.assertIn(f'--since {records[-1]["next_since"]}', output.getvalue())
@@ -0,0 +1,76 @@
+from django.apps import apps
+from django.test import TestCase
+
+from .. import actions
+from ..facets import facet_counts, filter_images
+from ..models import Image
+
+def analysis(description, labels=(), objects=()):
+    return {'description': description, 'labels': list(labels), 'objects': list(objects), 'text': '', 'confidence': 0.9}
+
+class FacetTest(TestCase):
+    def setUp(self):
+        self.config = apps.get_app_config('images')
+        self.saved = (self.config.tag_counts_cache_ttl, self.config.response_cache_enabled)
+        self.config.tag_counts_cache_ttl = 0
+        self.whiteboard = actions._save_description(
+            Image.objects.create(file='a.jpg'), analysis('A whiteboard', ['math', 'classroom'], ['whiteboard', 'marker']))
+        self.worksheet = actions._save_description(
+            Image.objects.create(file='b.jpg'), analysis('A worksheet', ['math'], ['paper']))
+        self.prose = actions._save_description(Image.objects.create(file='c.jpg'), 'A dog asleep on a rug')
+
+    def tearDown(self):
+        self.config.tag_counts_cache_ttl, self.config.response_cache_enabled = self.saved
+
+    def _ids(self, **filters):
+        return sorted(filter_images(Image.objects.all(), **filters).values_list('id', flat=True))
+
+    def test_structured_results_are_stored_apart_from_the_description(self):
+        image = Image.objects.get(pk=self.whiteboard.pk)
+
+        self.assertEqual(image.description, 'A whiteboard')
+        self.assertEqual(image.analysis['labels'], ['math', 'classroom'])
+        self.assertNotIn('description', image.analysis)
+        self.assertIsNone(Image.objects.get(pk=self.prose.pk).analysis)
+
+    def test_images_are_filtered_by_all_of_the_given_labels_and_objects(self):
+        self.assertEqual(self._ids(labels=['math']), [self.whiteboard.id, self.worksheet.id])
+        self.assertEqual(self._ids(labels=['Math', 'classroom']), [self.whiteboard.id])
+        self.assertEqual(self._ids(labels=['math'], objects=['paper']), [self.worksheet.id])
+        self.assertEqual(self._ids(objects=['dog']), [])
+
+    def test_the_most_common_labels_and_objects_are_counted(self):
+        self.assertEqual(facet_counts(Image.objects.all(), 20), {
+            'labels': [{'name': 'math', 'count': 2}, {'name': 'classroom', 'count': 1}],
+            'objects': [{'name': 'marker', 'count': 1}, {'name': 'paper', 'count': 1}, {'name': 'whiteboard', 'count': 1}],
+        })
+        self.assertEqual(facet_counts(filter_images(Image.objects.all(), objects=['paper']), 1), {
+            'labels': [{'name': 'math', 'count': 1}],
+            'objects': [{'name': 'paper', 'count': 1}],
+        })
+
+    def test_counts_are_cached_for_the_configured_time(self):
+        self.config.tag_counts_cache_ttl = 60
+        facet_counts(Image.objects.filter(pk__gte=self.whiteboard.pk), 5)
+        actions._save_description(Image.objects.create(file='d.jpg'), analysis('A ruler', ['math']))
+
+        self.assertEqual(facet_counts(Image.objects.filter(pk__gte=self.whiteboard.pk), 5)['labels'][0], {'name': 'math', 'count': 2})
+
+    def test_the_image_list_is_filtered_by_tag_and_object(self):
+        self.config.response_cache_enabled = False
+        rsp = self.client.get('/images/?tag=math&object=whiteboard')
+
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual([image['id'] for image in rsp.json()['data']], [self.whiteboard.id])
+        self.assertEqual(rsp.json()['data'][0]['analysis']['objects'], ['whiteboard', 'marker'])
+        self.assertEqual(rsp.json()['num_pages'], 1)
+        self.assertEqual(self.client.get(f'/images/?tag=classroom&ids={self.worksheet.id}').json()['data'], [])
+
+    def test_the_tags_endpoint_responds_with_counts(self):
+        rsp = self.client.get('/images/tags?tag=classroom&limit=1')
+
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp.json(), {'labels': [{'name': 'classroom', 'count': 1}], 'objects': [{'name': 'marker', 'count': 1}]})
+        for limit in ['0', '101', 'x']:
+            with self.subTest(limit=limit):
+                self.assertEqual(self.client.get(f'/images/tags?limit={limit}').status_code, 400)
@@ -0,0 +1,55 @@
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.apps import apps
+from django.test import TestCase
+from django.utils import timezone
+
+from .. import fast_json
+from ..models import Image, Comment
+from ..serializers import ImageSerializer, CommentSerializer
+from .helpers import CountedCommentsMixin
+
+class FastJsonTest(CountedCommentsMixin, TestCase):
+    fixtures = ['images.json', 'comments.json']
+
+    def setUp(self):
+        self.config = apps.get_app_config('images')
+        self.saved_enabled = self.config.fast_json_enabled
+        self.saved_response_cache = self.config.response_cache_enabled
+        # Both paths have to run, not one path and the cache
+        self.config.response_cache_enabled = False
+        image = Image.objects.create(file='', description={'objects': ['a', 'b']}, status=Image.Status.FAILED)
+        Comment.objects.create(image=image, content='précis "quoted"')
+        Comment.objects.filter(image=image).update(created_at=datetime(2024, 2, 3, 4, 5, 6, 789012, tzinfo=dt_timezone.utc))
+
+    def tearDown(self):
+        self.config.fast_json_enabled = self.saved_enabled
+        self.config.response_cache_enabled = self.saved_response_cache
+
+    def test_images_match_the_serializer(self):
+        images = Image.objects.order_by('id')
+
+        with self.assertNumQueries(1):
+            rows = fast_json.images(images)
+
+        self.assertEqual(rows, ImageSerializer(images, many=True).data)
+        self.assertEqual(fast_json.images(list(images)), rows)
+
+    def test_comments_match_the_serializer(self):
+        comments = Comment.objects.order_by('id')
+
+        self.assertEqual(fast_json.comments(comments), CommentSerializer(comments, many=True).data)
+        with timezone.override('America/New_York'):
+            self.assertEqual(fast_json.comments(list(comments)), CommentSerializer(comments, many=True).data)
+
+    def test_endpoints_return_the_same_json_either_way(self):
+        image_id = Image.objects.order_by('-id').values_list('id', flat=True).first()
+        urls = ['/images/', '/images/?page=1', '/images/?cursor=', f'/image/{image_id}', '/image/1?comment_cursor=', '/image/1?comment_page=1']
+        fast = {url: self.client.get(url) for url in urls}
+        self.config.fast_json_enabled = False
+        slow = {url: self.client.get(url) for url in urls}
+
+        for url in urls:
+            self.assertEqual(fast[url]['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(fast[url].content), json.loads(slow[url].content), url)
@@ -0,0 +1,123 @@
+import hashlib
+import os
+
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
+from django.utils.http import http_date
+
+from ..media import UnsatisfiableRange, byte_range
+from ..models import Image
+from .helpers import MediaRootMixin, image_bytes
+
+class ByteRangeTest(SimpleTestCase):
+    def test_ranges_are_clamped_to_the_file(self):
+        self.assertEqual(byte_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(byte_range('bytes=900-', 1000), (900, 999))
+        self.assertEqual(byte_range('bytes=900-5000', 1000), (900, 999))
+        self.assertEqual(byte_range('bytes=-100', 1000), (900, 999))
+        self.assertEqual(byte_range('bytes=-5000', 1000), (0, 999))
+
+    def test_ranges_we_dont_serve_send_the_whole_file(self):
+        for header in ('bytes=0-10,20-30', 'items=0-1', 'bytes=10-5', 'bytes=-', 'nonsense'):
+            self.assertIsNone(byte_range(header, 1000), header)
+
+    def test_ranges_past_the_end_cannot_be_satisfied(self):
+        for header in ('bytes=1000-', 'bytes=-0'):
+            with self.assertRaises(UnsatisfiableRange):
+                byte_range(header, 1000)
+
+class ServeMediaTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.saved_offload = apps.get_app_config('images').media_offload
+        self.data = image_bytes((64, 64))
+        self.image = Image.objects.create(file=SimpleUploadedFile('red.png', self.data))
+        self.url = f'/media/{self.image.file.name}'
+
+    def tearDown(self):
+        apps.get_app_config('images').media_offload = self.saved_offload
+        super().tearDown()
+
+    def test_files_are_served_with_validators_and_cache_headers(self):
+        rsp = self.client.get(self.url)
+
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(b''.join(rsp.streaming_content), self.data)
+        self.assertEqual(rsp['Content-Type'], 'image/png')
+        self.assertEqual(rsp['Content-Length'], str(len(self.data)))
+        self.assertEqual(rsp['Accept-Ranges'], 'bytes')
+        self.assertEqual(rsp['ETag'], f'"{hashlib.sha256(self.data).hexdigest()}"')
+        self.assertIn('Last-Modified', rsp)
+        # Content-addressed names never change
+        self.assertIn('immutable', rsp['Cache-Control'])
+
+    def test_files_with_other_names_are_revalidated(self):
+        with open(self._media_path('images/notes.txt'), 'w') as notes:
+            notes.write('hello')
+
+        rsp = self.client.get('/media/images/notes.txt')
+
+        self.assertEqual(b''.join(rsp.streaming_content), b'hello')
+        self.assertNotIn('immutable', rsp['Cache-Control'])
+        self.assertEqual(self.client.get('/media/images/notes.txt', headers={'If-None-Match': rsp['ETag']}).status_code, 304)
+
+    def test_conditional_requests_get_a_304(self):
+        rsp = self.client.get(self.url)
+
+        for headers in ({'If-None-Match': rsp['ETag']}, {'If-Modified-Since': rsp['Last-Modified']}):
+            not_modified = self.client.get(self.url, headers=headers)
+            self.assertEqual(not_modified.status_code, 304, headers)
+            self.assertEqual(not_modified['ETag'], rsp['ETag'])
+
+    def test_a_byte_range_gets_a_206_with_just_those_bytes(self):
+        rsp = self.client.get(self.url, headers={'Range': 'bytes=10-19'})
+
+        self.assertEqual(rsp.status_code, 206)
+        self.assertEqual(b''.join(rsp.streaming_content), self.data[10:20])
+        self.assertEqual(rsp['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(rsp['Content-Length'], '10')
+
+        rsp = self.client.get(self.url, headers={'Range': 'bytes=-8'})
+        self.assertEqual(b''.join(rsp.streaming_content), self.data[-8:])
+
+    def test_ranges_past_the_end_get_a_416(self):
+        rsp = self.client.get(self.url, headers={'Range': f'bytes={len(self.data)}-'})
+
+        self.assertEqual(rsp.status_code, 416)
+        self.assertEqual(rsp['Content-Range'], f'bytes */{len(self.data)}')
+        self.assertNotIn('Cache-Control', rsp)
+        self.assertNotIn('ETag', rsp)
+
+    def test_a_range_for_another_version_of_the_file_sends_all_of_it(self):
+        headers = {'Range': 'bytes=0-9', 'If-Range': '"something-else"'}
+        rsp = self.client.get(self.url, headers=headers)
+        self.assertEqual(rsp.status_code, 200)
+
+        headers['If-Range'] = http_date(os.stat(self.image.file.path).st_mtime)
+        self.assertEqual(self.client.get(self.url, headers=headers).status_code, 206)
+
+    def test_paths_outside_media_root_and_missing_files_are_404(self):
+        for url in ('/media/../manage.py', '/media/%2e%2e/manage.py', '/media/images', '/media/images/missing.png',
+                    '/media/images/../cache/notes.txt'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_only_uploads_are_served(self):
+        os.makedirs(self._media_path('cache/preprocessed/ab'))
+        with open(self._media_path('cache/preprocessed/ab/derived.jpg'), 'wb') as derived:
+            derived.write(self.data)
+
+        self.assertEqual(self.client.get('/media/cache/preprocessed/ab/derived.jpg').status_code, 404)
+
+    def test_offloading_leaves_the_body_to_the_proxy(self):
+        config = apps.get_app_config('images')
+        config.media_offload = 'x-accel-redirect'
+        rsp = self.client.get(self.url)
+        self.assertEqual(rsp['X-Accel-Redirect'], f'/protected-media/{self.image.file.name}')
+        self.assertEqual(rsp.content, b'')
+        self.assertEqual(rsp['Content-Type'], 'image/png')
+
+        config.media_offload = 'x-sendfile'
+        rsp = self.client.get(self.url)
+        self.assertEqual(rsp['X-Sendfile'], os.path.abspath(self.image.file.path))
+        self.assertIn('ETag', rsp)
@@ -0,0 +1,78 @@
+import os
+from io import StringIO
+
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..metadata import ImageMetadata, read_header
+from ..models import Image
+from .helpers import MediaRootMixin, image_bytes
+
+class ImageMetadataTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.config = apps.get_app_config('images')
+        self.saved = (self.config.analyze_async, self.config.upload_streaming_enabled, self.config.response_cache_enabled)
+        self.config.analyze_async = True
+        self.config.response_cache_enabled = False
+
+    def tearDown(self):
+        self.config.analyze_async, self.config.upload_streaming_enabled, self.config.response_cache_enabled = self.saved
+        super().tearDown()
+
+    def _ingest(self, data: bytes, name='photo.jpg') -> Image:
+        rsp = self.client.post('/analyze-image', data={'file': SimpleUploadedFile(name, data)})
+        self.assertEqual(rsp.status_code, 202)
+        return Image.objects.get(pk=rsp.json()['id'])
+
+    def _ids(self, query: str) -> list:
+        return sorted(image['id'] for image in self.client.get(f'/images/?{query}').json()['data'])
+
+    def test_the_header_gives_the_format_dimensions_and_orientation(self):
+        self.assertEqual(read_header(image_bytes((40, 30), 'PNG')), ImageMetadata('PNG', 40, 30, 1))
+        # Turned on its side by the EXIF orientation
+        self.assertEqual(read_header(image_bytes((40, 30), 'JPEG', orientation=6)), ImageMetadata('JPEG', 30, 40, 6))
+        self.assertIsNone(read_header(b'\xff\xd8\xff'))
+
+    def test_streamed_uploads_store_their_metadata(self):
+        data = image_bytes((640, 480), 'JPEG', orientation=8)
+        image = self._ingest(data)
+
+        self.assertEqual((image.image_format, image.width, image.height, image.orientation), ('JPEG', 480, 640, 8))
+        self.assertEqual(image.byte_size, len(data))
+
+    def test_uploads_through_djangos_handlers_store_their_metadata(self):
+        self.config.upload_streaming_enabled = False
+        data = image_bytes((64, 32), 'PNG')
+        image = self._ingest(data, name='small.png')
+
+        self.assertEqual((image.image_format, image.width, image.height, image.orientation), ('PNG', 64, 32, 1))
+        self.assertEqual(image.byte_size, len(data))
+
+    def test_the_image_list_is_filtered_on_metadata(self):
+        large = self._ingest(image_bytes((1200, 800), 'JPEG'))
+        small = self._ingest(image_bytes((100, 80), 'PNG'), name='small.png')
+
+        self.assertEqual(self._ids('min_width=1000'), [large.id])
+        self.assertEqual(self._ids('max_height=100'), [small.id])
+        self.assertEqual(self._ids('image_format=jpg'), [large.id])
+        self.assertEqual(self._ids(f'min_bytes={small.byte_size}&image_format=png'), [small.id])
+        self.assertEqual(self.client.get('/images/?min_width=wide').status_code, 400)
+        self.assertEqual(self.client.get('/images/').json()['data'][0]['width'], 1200)
+
+    def test_backfill_reads_images_stored_without_metadata(self):
+        image = self._ingest(image_bytes((300, 200), 'JPEG'))
+        Image.objects.filter(pk=image.pk).update(width=None, height=None, image_format='', byte_size=None, orientation=None, content_hash='')
+        missing = Image.objects.create(file='images/missing.jpg')
+
+        output = StringIO()
+        call_command('backfill_metadata', '--chunk-size=1', stdout=output)
+
+        image.refresh_from_db()
+        self.assertEqual((image.image_format, image.width, image.height), ('JPEG', 300, 200))
+        self.assertEqual(image.byte_size, os.path.getsize(image.file.path))
+        self.assertEqual(len(image.content_hash), 64)
+        self.assertIsNone(Image.objects.get(pk=missing.pk).width)
+        self.assertIn('1 images updated, 1 unreadable', output.getvalue())
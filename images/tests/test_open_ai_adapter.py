@@ -1,10 +1,15 @@
 from django.apps import apps
 from django.test import TestCase
-from ..openai_adapter import OpenAiAdapter
+from ..openai_adapter import (
+    OpenAiAdapter, AsyncOpenAiAdapter, OpenAIError, BatchReplyError, get_session, close_async_session, parse_retry_after,
+    parse_analysis,
+)
 from unittest.mock import patch
 import json
 import base64
 import os
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 import requests
 
 base64image = "iVBORw0KGgoAAAANSUhEUgAAAAUA" + "AAAFCAYAAACNbyblAAAAHElEQVQI12P4//8/w38GIAXDIBKE0DHxgljNBAAO" + "9TXL0Y4OHwAAAABJRU5ErkJggg=="
@@ -27,23 +32,87 @@ class OpenAiAdapterInstantiationTest(TestCase):
         
         self.assertIsInstance(OpenAiAdapter(), OpenAiAdapter)
         
+def make_response(status_code, content=b'{}', headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers or {})
+    return response
+
 class OpenAiAdapterMakeRequestTest(TestCase):
     def setUp(self):
-        apps.get_app_config('images').openai_api_key = 'some-random-key'
+        config = apps.get_app_config('images')
+        config.openai_api_key = 'some-random-key'
+        config.openai_max_retries = 3
+        # Plain backoff; the dispatcher's requeueing is covered in test_dispatcher
+        self.rate_limit_enabled = config.rate_limit_enabled
+        config.rate_limit_enabled = False
         self.adapter = OpenAiAdapter()
 
-    @patch('requests.post')
+    def tearDown(self):
+        apps.get_app_config('images').rate_limit_enabled = self.rate_limit_enabled
+
+    @patch('requests.Session.post')
     def test_it_makes_a_request_to_openai_with_default_headers_and_payload(self, post_mock):
+        post_mock.return_value = make_response(200)
         payload = {"key": "value"}
         
         self.adapter.make_request(payload)
         
-        post_mock.expect_called_with(
+        config = apps.get_app_config('images')
+        post_mock.assert_called_once_with(
+            f"{config.openai_api_base}/chat/completions",
             headers={
                 "Content-Type": "application/json",
-                "Authorization": f"Bearer {apps.get_app_config('images').openai_api_key}"
+                "Authorization": f"Bearer {config.openai_api_key}"
             }, 
-            payload=payload)
+            json=payload,
+            timeout=(config.openai_connect_timeout, config.openai_read_timeout))
+
+    def test_requests_share_one_pooled_session(self):
+        self.assertIs(get_session(), get_session())
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_it_retries_429_and_5xx_and_reports_the_attempt_that_succeeded(self, post_mock, sleep_mock):
+        post_mock.side_effect = [make_response(503), make_response(429, headers={'Retry-After': '7'}), make_response(200)]
+
+        response = self.adapter.make_request({})
+
+        self.assertEqual(response.attempts, 3)
+        self.assertEqual(post_mock.call_count, 3)
+        self.assertGreaterEqual(sleep_mock.call_args_list[1].args[0], 7)
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_it_retries_connection_errors_and_timeouts(self, post_mock, sleep_mock):
+        post_mock.side_effect = [requests.exceptions.ConnectTimeout(), requests.exceptions.ConnectionError(), make_response(200)]
+
+        self.assertEqual(self.adapter.make_request({}).attempts, 3)
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_it_raises_an_OpenAIError_when_retries_run_out(self, post_mock, sleep_mock):
+        post_mock.return_value = make_response(500)
+
+        self.assertRaises(OpenAIError, self.adapter.make_request, {})
+        self.assertEqual(post_mock.call_count, 4)
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_it_does_not_retry_client_errors(self, post_mock, sleep_mock):
+        post_mock.return_value = make_response(400)
+
+        self.assertRaises(OpenAIError, self.adapter.make_request, {})
+        post_mock.assert_called_once()
+        sleep_mock.assert_not_called()
+
+class ParseRetryAfterTest(TestCase):
+    def test_it_parses_seconds_and_http_dates(self):
+        self.assertEqual(parse_retry_after('12'), 12.0)
+        self.assertEqual(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
         
 class OpenAiAdapterMakeImagePromptTest(TestCase):
     def setUp(self):
@@ -60,11 +129,12 @@ class OpenAiAdapterMakeImagePromptTest(TestCase):
                 {
                     "role": "user", 
                     "content": [
-                        {"type": "text", "text": "what's in this image?"},
+                        {"type": "text", "text": OpenAiAdapter.prompt_text},
                         {
                             "type": "image_url", 
                             "image_url": {
-                                'url': f"data:image/jpg;base64,{base64image}"
+                                'url': f"data:image/png;base64,{base64image}",
+                                'detail': 'low'
                             }
                         }
                     ],
@@ -73,6 +143,146 @@ class OpenAiAdapterMakeImagePromptTest(TestCase):
             'max_tokens': 300
         })
 
+class OpenAiAdapterBatchPromptTest(TestCase):
+    def setUp(self):
+        apps.get_app_config('images').openai_api_key = 'some-api-key'
+        self.adapter = OpenAiAdapter()
+
+    def test_it_labels_every_image_and_scales_max_tokens(self):
+        image_paths = [create_test_file(f'/tmp/test-batch-image-{i}.png') for i in range(3)]
+        prompt = self.adapter.make_streamed_batch_prompt(image_paths).to_dict()
+
+        content = prompt['messages'][0]['content']
+        self.assertIn('3 images', content[0]['text'])
+        self.assertEqual([part['text'] for part in content[1::2]], ['Image 1:', 'Image 2:', 'Image 3:'])
+        self.assertEqual(
+            [part['image_url']['url'] for part in content[2::2]],
+            [f"data:image/png;base64,{base64image}"] * 3
+        )
+        self.assertEqual(prompt['max_tokens'], 900)
+
+    def test_it_parses_the_descriptions_out_of_the_reply(self):
+        self.assertEqual(OpenAiAdapter.parse_batch_reply('["a cat", "a dog"]', 2), ['a cat', 'a dog'])
+        self.assertEqual(OpenAiAdapter.parse_batch_reply('```json\n["a cat", "a dog"]\n```', 2), ['a cat', 'a dog'])
+        self.assertEqual(OpenAiAdapter.parse_batch_reply('{"descriptions": ["a cat"]}', 1), ['a cat'])
+
+    def test_it_normalizes_structured_descriptions(self):
+        reply = json.dumps([{'description': 'a cat', 'labels': ['Pet', 'pet'], 'objects': [{'name': 'Cat'}]}, 'a dog'])
+
+        self.assertEqual(OpenAiAdapter.parse_batch_reply(reply, 2), [
+            {'description': 'a cat', 'labels': ['pet'], 'objects': ['cat'], 'text': '', 'confidence': None},
+            'a dog',
+        ])
+
+    def test_it_rejects_malformed_replies(self):
+        for reply in ['a cat and a dog', '["a cat"]', '["a cat", ""]', '["a cat", 2]', None]:
+            with self.subTest(reply=reply):
+                self.assertRaises(BatchReplyError, OpenAiAdapter.parse_batch_reply, reply, 2)
+
+class StreamedPayloadTest(TestCase):
+    def setUp(self):
+        apps.get_app_config('images').openai_api_key = 'some-api-key'
+        self.adapter = OpenAiAdapter()
+        self.image_path = create_test_file()
+
+    def test_the_streamed_prompt_matches_the_in_memory_prompt(self):
+        streamed = self.adapter.make_streamed_image_prompt(self.image_path)
+        body = b''.join(streamed.iter_bytes(block_size=4))
+
+        self.assertEqual(json.loads(body), self.adapter.make_image_prompt(self.image_path))
+        self.assertEqual(len(streamed), len(body))
+
+    def test_the_reader_returns_the_whole_body_in_small_reads(self):
+        streamed = self.adapter.make_streamed_image_prompt(self.image_path)
+        reader = streamed.reader(block_size=9)
+
+        chunks = list(iter(lambda: reader.read(5), b''))
+
+        self.assertEqual(b''.join(chunks), b''.join(streamed.iter_bytes(block_size=9)))
+        self.assertTrue(all(len(chunk) <= 5 for chunk in chunks))
+
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_make_request_sends_a_fresh_reader_on_every_attempt(self, post_mock, sleep_mock):
+        bodies = []
+        def post(url, headers, timeout, data):
+            bodies.append(data.read())
+            return make_response(503 if len(bodies) == 1 else 200)
+        post_mock.side_effect = post
+
+        streamed = self.adapter.make_streamed_image_prompt(self.image_path)
+        self.adapter.make_request(streamed)
+
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual(bodies[0], bodies[1])
+        self.assertEqual(json.loads(bodies[1]), streamed.to_dict())
+
+class AsyncOpenAiAdapterTest(TestCase):
+    """
+    Runs the async adapter against a local aiohttp server answering with `statuses` in turn
+    """
+    def setUp(self):
+        self.config = apps.get_app_config('images')
+        self.config.openai_api_key = 'some-random-key'
+        self.config.openai_max_retries = 3
+        self.saved_api_base = self.config.openai_api_base
+        self.requests = []
+
+    def tearDown(self):
+        self.config.openai_api_base = self.saved_api_base
+
+    async def _serve(self, *statuses, content='some content'):
+        statuses = list(statuses)
+        async def handler(request):
+            self.requests.append((request.headers, await request.read()))
+            return web.json_response({'choices': [{'message': {'content': content}}]}, status=statuses.pop(0))
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', handler)
+        server = TestServer(app)
+        await server.start_server()
+        self.config.openai_api_base = str(server.make_url('/v1'))
+        return server
+
+    @patch('asyncio.sleep')
+    async def test_it_streams_the_prompt_and_retries_like_the_sync_adapter(self, sleep_mock):
+        image_path = create_test_file()
+        server = await self._serve(503, 200)
+        try:
+            description = await AsyncOpenAiAdapter().prompt_image_description(image_path)
+        finally:
+            await close_async_session()
+            await server.close()
+
+        self.assertEqual(description, 'some content')
+        self.assertEqual(len(self.requests), 2)
+        headers, body = self.requests[-1]
+        self.assertEqual(headers['Authorization'], 'Bearer some-random-key')
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        self.assertEqual(json.loads(body), OpenAiAdapter().make_image_prompt(image_path))
+
+    async def test_it_describes_a_batch_of_images_in_one_request(self):
+        image_path = create_test_file()
+        server = await self._serve(200, content=json.dumps(['first', 'second']))
+        try:
+            descriptions = await AsyncOpenAiAdapter().prompt_batch_descriptions([image_path, image_path])
+        finally:
+            await close_async_session()
+            await server.close()
+
+        self.assertEqual(descriptions, ['first', 'second'])
+        self.assertEqual(len(self.requests), 1)
+
+    @patch('asyncio.sleep')
+    async def test_it_raises_an_OpenAIError_for_client_errors(self, sleep_mock):
+        server = await self._serve(401)
+        try:
+            with self.assertRaises(OpenAIError):
+                await AsyncOpenAiAdapter().make_request({})
+        finally:
+            await close_async_session()
+            await server.close()
+        self.assertEqual(len(self.requests), 1)
+
 class OpenAiAdapterPromptImageDescriptionTest(TestCase):
     def setUp(self):
         apps.get_app_config('images').openai_api_key = 'some-random-key'
@@ -103,4 +313,16 @@ class OpenAiAdapterPromptImageDescriptionTest(TestCase):
         
 
         
-        
\ No newline at end of file
+        
+class ParseAnalysisTest(TestCase):
+    def test_a_json_reply_is_normalized(self):
+        reply = '```json\n{"description": " A whiteboard ", "labels": ["Math", "math", ""], "objects": ["Marker"], "text": "1/2", "confidence": 1.5}\n```'
+
+        self.assertEqual(parse_analysis(reply), {
+            'description': 'A whiteboard', 'labels': ['math'], 'objects': ['marker'], 'text': '1/2', 'confidence': 1.0,
+        })
+
+    def test_a_prose_reply_is_returned_as_is(self):
+        for reply in ['A whiteboard', '{"labels": ["math"]}', '["a", "b"]', None]:
+            with self.subTest(reply=reply):
+                self.assertEqual(parse_analysis(reply), reply)
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta, timezone
+
+from django.test import TestCase
+
+from ..models import Image
+from ..pagination import KeysetPaginator, InvalidCursor
+
+class KeysetPaginatorTest(TestCase):
+    def setUp(self):
+        start = datetime(2024, 1, 10, 17, 34, tzinfo=timezone.utc)
+        # Ties on analyzed_at, and unanalyzed images that sort last
+        times = [start, start, start + timedelta(minutes=1), None, start + timedelta(microseconds=1), None, start]
+        for analyzed_at in times:
+            Image.objects.create(file='some_test_file.jpg', analyzed_at=analyzed_at)
+        self.expected = list(
+            Image.objects.order_by('analyzed_at', 'id').values_list('id', flat=True)
+        )
+        self.paginator = KeysetPaginator(Image.objects.all(), 'analyzed_at', 3)
+
+    def _walk(self, token=None, direction='next'):
+        pages = []
+        page = self.paginator.page(token)
+        while True:
+            pages.append([image.id for image in page.items])
+            token = page.next if direction == 'next' else page.prev
+            if not token:
+                return pages, page
+            page = self.paginator.page(token)
+
+    def test_walking_forward_visits_every_image_once_in_order(self):
+        pages, last = self._walk()
+
+        self.assertEqual([image_id for page in pages for image_id in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertIsNone(self.paginator.page().prev)
+
+    def test_walking_back_from_the_last_page_returns_the_same_pages(self):
+        forward, last = self._walk()
+
+        backward, first = self._walk(last.prev, 'prev')
+
+        self.assertEqual(list(reversed(backward)), forward[:-1])
+        self.assertIsNone(first.prev)
+
+    def test_the_first_page_costs_no_count_query(self):
+        with self.assertNumQueries(1):
+            self.paginator.page()
+
+    def test_garbage_cursors_are_rejected(self):
+        for token in ['not-a-cursor', 'WyJ4Il0', self.paginator.encode(Image.objects.first(), 'next')[:-4] + '!!!!']:
+            with self.subTest(token=token):
+                self.assertRaises(InvalidCursor, self.paginator.page, token)
@@ -0,0 +1,96 @@
+import os
+from unittest.mock import patch
+
+from django.apps import apps
+from django.test import TestCase
+from PIL import Image as PILImage
+
+from ..disk_cache import DiskCache
+from ..preprocessing import prepare_image
+from .helpers import MediaRootMixin, image_bytes
+
+class PrepareImageTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        config = apps.get_app_config('images')
+        self.saved_config = (config.preprocess_max_side, config.preprocess_low_detail_side, config.preprocess_target_bytes)
+        config.preprocess_max_side = 256
+        config.preprocess_low_detail_side = 128
+        config.preprocess_target_bytes = 200_000
+
+    def tearDown(self):
+        config = apps.get_app_config('images')
+        config.preprocess_max_side, config.preprocess_low_detail_side, config.preprocess_target_bytes = self.saved_config
+        super().tearDown()
+
+    def _make_image(self, name, size, format, mode='RGB', orientation=None):
+        path = self._media_path(name)
+        with open(path, 'wb') as image_file:
+            image_file.write(image_bytes(size, format, mode=mode, orientation=orientation))
+        return path
+
+    def test_small_images_in_supported_formats_are_uploaded_untouched(self):
+        path = self._make_image('small.png', (64, 32), 'PNG')
+
+        prepared = prepare_image(path)
+
+        self.assertEqual(prepared.path, path)
+        self.assertEqual(prepared.mime_type, 'image/png')
+        self.assertEqual(prepared.detail, 'low')
+
+    def test_large_images_are_downscaled_and_reencoded(self):
+        path = self._make_image('large.jpg', (1024, 512), 'JPEG')
+
+        prepared = prepare_image(path)
+
+        self.assertNotEqual(prepared.path, path)
+        self.assertEqual(prepared.mime_type, 'image/jpeg')
+        self.assertEqual((prepared.width, prepared.height), (256, 128))
+        self.assertEqual(prepared.detail, 'high')
+        with PILImage.open(prepared.path) as output:
+            self.assertEqual(output.size, (256, 128))
+
+    def test_the_exif_orientation_is_applied(self):
+        path = self._make_image('rotated.jpg', (200, 100), 'JPEG', orientation=6)
+
+        prepared = prepare_image(path)
+
+        self.assertEqual((prepared.width, prepared.height), (100, 200))
+
+    def test_unsupported_formats_are_converted_with_the_real_mime_type(self):
+        self.assertEqual(prepare_image(self._make_image('image.bmp', (32, 32), 'BMP')).mime_type, 'image/jpeg')
+        self.assertEqual(prepare_image(self._make_image('alpha.tiff', (32, 32), 'TIFF', mode='RGBA')).mime_type, 'image/png')
+
+    def test_reencoded_output_is_cached_on_disk(self):
+        path = self._make_image('large.jpg', (1024, 512), 'JPEG')
+        first = prepare_image(path)
+
+        with patch('images.preprocessing._reencode') as reencode_mock:
+            second = prepare_image(path)
+
+        reencode_mock.assert_not_called()
+        self.assertEqual(first, second)
+
+    def test_a_known_content_hash_keys_the_cache_without_rehashing(self):
+        path = self._make_image('large.jpg', (1024, 512), 'JPEG')
+        first = prepare_image(path, 'abc')
+        # Same hash, different bytes: only a cache keyed by the given hash finds the first output
+        self._make_image('large.jpg', (1024, 256), 'JPEG')
+
+        with patch('images.preprocessing._reencode') as reencode_mock:
+            second = prepare_image(path, 'abc')
+
+        reencode_mock.assert_not_called()
+        self.assertEqual(first, second)
+
+class DiskCacheTest(MediaRootMixin, TestCase):
+    def test_it_prunes_the_least_recently_used_files(self):
+        cache = DiskCache('cache', max_bytes=20)
+        oldest = cache.put('aa01', 'bin', b'x' * 10)
+        os.utime(oldest, (0, 0))
+        cache.put('bb02', 'bin', b'x' * 10)
+        cache.put('cc03', 'bin', b'x' * 10)
+
+        self.assertIsNone(cache.get('aa01', 'bin'))
+        self.assertIsNotNone(cache.get('cc03', 'bin'))
+        self.assertLessEqual(cache.size(), 20)
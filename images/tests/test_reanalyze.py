@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from ..models import Image
+
+class ReanalyzeCommandTest(TransactionTestCase):
+    def setUp(self):
+        apps.get_app_config('images').openai_api_key = ''
+        self.workdir = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.workdir.name, 'checkpoint.json')
+        self.images = [Image.objects.create(file=f'some_test_file_{i}.jpg') for i in range(5)]
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def _reanalyze(self, *args):
+        output = StringIO()
+        call_command('reanalyze', f'--checkpoint={self.checkpoint}', '--workers=2', '--chunk-size=2', *args, stdout=output)
+        return output.getvalue()
+
+    def test_it_analyzes_the_selected_images_and_reports_progress(self):
+        old = timezone.now() - timedelta(days=30)
+        Image.objects.filter(pk=self.images[0].pk).update(analyzed_at=old, description='old')
+        Image.objects.filter(pk=self.images[1].pk).update(analyzed_at=timezone.now(), description='fresh')
+
+        output = self._reanalyze(f'--analyzed-before={(old + timedelta(days=1)).date()}', f'--max-id={self.images[3].id}')
+
+        self.assertIn('3 images to analyze', output)
+        self.assertIn('3/3 (0 failed)', output)
+        self.assertIn('ETA', output)
+        descriptions = {image.id: image.description for image in Image.objects.all()}
+        self.assertEqual(descriptions[self.images[1].id], 'fresh')
+        self.assertIsNone(descriptions[self.images[4].id])
+        for image in (self.images[0], self.images[2], self.images[3]):
+            self.assertEqual(descriptions[image.id], f'A description for {Image.objects.get(pk=image.pk).file.path}')
+        self.assertEqual(Image.objects.filter(status=Image.Status.ANALYZED).count(), 3)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_unstructured_selects_analyzed_images_without_an_analysis(self):
+        Image.objects.filter(pk__in=[self.images[0].pk, self.images[1].pk]).update(analyzed_at=timezone.now(), description='old')
+        Image.objects.filter(pk=self.images[1].pk).update(analysis={'labels': [], 'objects': []})
+
+        output = self._reanalyze('--unstructured')
+
+        self.assertIn('1 images to analyze', output)
+        self.assertNotEqual(Image.objects.get(pk=self.images[0].pk).description, 'old')
+        self.assertEqual(Image.objects.get(pk=self.images[1].pk).description, 'old')
+
+    def test_it_resumes_after_the_checkpoint(self):
+        with open(self.checkpoint, 'w') as checkpoint_file:
+            json.dump({'filters': {'unanalyzed': True, 'analyzed_before': None, 'min_id': None, 'max_id': None},
+                       'last_id': self.images[2].id}, checkpoint_file)
+
+        output = self._reanalyze('--unanalyzed')
+
+        self.assertIn(f'2 images to analyze, resuming after id {self.images[2].id}', output)
+        self.assertEqual(
+            list(Image.objects.filter(analyzed_at__isnull=False).order_by('id').values_list('id', flat=True)),
+            [image.id for image in self.images[3:]]
+        )
+
+    def test_a_checkpoint_from_other_filters_is_refused(self):
+        with open(self.checkpoint, 'w') as checkpoint_file:
+            json.dump({'filters': {'unanalyzed': False, 'analyzed_before': None, 'min_id': 7, 'max_id': None},
+                       'last_id': 1}, checkpoint_file)
+
+        self.assertRaises(CommandError, self._reanalyze, '--unanalyzed')
+
+    @patch('images.describers.DummyDescriber.describe_image', autospec=True)
+    def test_failures_are_marked_and_the_rest_are_saved_in_bulk(self, describe_mock):
+        describe_mock.side_effect = lambda describer, path, content_hash=None: None if path.endswith('_1.jpg') else 'described'
+
+        with patch('images.models.Image.save') as save_mock:
+            output = self._reanalyze()
+
+        save_mock.assert_not_called()
+        self.assertIn('finished: 4 analyzed, 1 failed', output)
+        self.assertEqual(Image.objects.get(pk=self.images[1].pk).status, Image.Status.FAILED)
+        self.assertEqual(Image.objects.filter(description='described').count(), 4)
+
+    @patch('images.describers.DummyDescriber.describe_image', autospec=True)
+    def test_a_failed_reanalysis_keeps_the_earlier_analysis(self, describe_mock):
+        describe_mock.return_value = None
+        analyzed_at = timezone.now() - timedelta(days=30)
+        Image.objects.filter(pk=self.images[0].pk).update(analyzed_at=analyzed_at, description='old', status=Image.Status.ANALYZED)
+
+        output = self._reanalyze(f'--max-id={self.images[1].id}')
+
+        self.assertIn('finished: 0 analyzed, 2 failed', output)
+        image = Image.objects.get(pk=self.images[0].pk)
+        self.assertEqual((image.status, image.description, image.analyzed_at), (Image.Status.ANALYZED, 'old', analyzed_at))
+        self.assertEqual(Image.objects.get(pk=self.images[1].pk).status, Image.Status.FAILED)
+
+    @patch('images.describers.DummyDescriber.describe_images', autospec=True)
+    def test_images_are_described_in_batches(self, describe_mock):
+        describe_mock.side_effect = lambda describer, paths, content_hashes=None: ['described'] * len(paths)
+
+        output = self._reanalyze('--batch-size=2', '--chunk-size=4')
+
+        self.assertIn('finished: 5 analyzed, 0 failed', output)
+        self.assertEqual(sorted(len(call.args[1]) for call in describe_mock.call_args_list), [2, 2])
+        self.assertEqual(Image.objects.filter(description='described').count(), 4)
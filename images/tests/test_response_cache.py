@@ -0,0 +1,115 @@
+from django.apps import apps
+from django.test import TestCase, override_settings
+
+from .. import actions, response_cache
+from ..models import Comment, Image
+from .helpers import CountedCommentsMixin
+
+RESPONSE_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-responses'},
+}
+
+@override_settings(CACHES=RESPONSE_CACHES)
+class ResponseCacheTest(CountedCommentsMixin, TestCase):
+    fixtures = ['images.json', 'comments.json']
+
+    def setUp(self):
+        response_cache.get_cache().clear()
+        response_cache.reset_counters()
+        self.config = apps.get_app_config('images')
+        self.saved_enabled = self.config.response_cache_enabled
+
+    def tearDown(self):
+        self.config.response_cache_enabled = self.saved_enabled
+
+    def test_a_repeated_request_is_served_from_the_cache(self):
+        first = self.client.get('/image/1')
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/image/1')
+
+        self.assertEqual(first['X-Cache'], 'miss')
+        self.assertEqual(second['X-Cache'], 'hit')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_a_matching_etag_is_not_modified(self):
+        etag = self.client.get('/images/')['ETag']
+
+        with self.assertNumQueries(0):
+            rsp = self.client.get('/images/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(rsp.status_code, 304)
+        self.assertEqual(rsp['ETag'], etag)
+        self.assertEqual(response_cache.stats()['hit_ratio'], 0.5)
+
+    def test_query_strings_are_cached_separately(self):
+        paged = self.client.get('/image/1?comment_page=1')
+        cursored = self.client.get('/image/1?comment_cursor=')
+
+        self.assertNotEqual(paged['ETag'], cursored['ETag'])
+        self.assertEqual(cursored['X-Cache'], 'miss')
+
+    def test_a_comment_changes_the_image_but_not_the_list(self):
+        image_etag = self.client.get('/image/1')['ETag']
+        list_etag = self.client.get('/images/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/image/1/comments', {'content': 'a new comment'})
+
+        rsp = self.client.get('/image/1', HTTP_IF_NONE_MATCH=image_etag)
+        self.assertEqual(rsp.status_code, 200)
+        self.assertIn('a new comment', [comment['content'] for comment in rsp.json()['comments']['data']])
+        self.assertEqual(self.client.get('/images/', HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+
+    def test_a_comment_changes_lists_that_embed_comments(self):
+        embedded_etag = self.client.get('/images/?embed_comments=1')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/image/2/comments', {'content': 'a new comment'})
+
+        self.assertEqual(self.client.get('/images/?embed_comments=1', HTTP_IF_NONE_MATCH=embedded_etag).status_code, 200)
+
+    def test_moving_a_comment_changes_the_image_it_left(self):
+        comment = Comment.objects.filter(image_id=1).first()
+        self.client.get('/image/1')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.image_id = 2
+            comment.save()
+
+        rsp = self.client.get('/image/1')
+        self.assertEqual(rsp['X-Cache'], 'miss')
+        self.assertNotIn(comment.id, [moved['id'] for moved in rsp.json()['comments']['data']])
+
+    def test_updating_an_image_changes_the_image_and_the_list(self):
+        image_etag = self.client.get('/image/2')['ETag']
+        list_etag = self.client.get('/images/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            actions._save_description(Image.objects.get(pk=2), 'a fresh description')
+
+        self.assertEqual(self.client.get('/image/2').json()['description'], 'a fresh description')
+        self.assertNotEqual(self.client.get('/image/2')['ETag'], image_etag)
+        self.assertEqual(self.client.get('/images/', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+
+    def test_bulk_updates_are_bumped_explicitly(self):
+        etag = self.client.get('/image/3')['ETag']
+        Image.objects.filter(pk=3).update(status=Image.Status.FAILED)
+        response_cache.bump_images([3])
+
+        self.assertEqual(self.client.get('/image/3', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_errors_are_not_cached(self):
+        self.client.get('/image/999')
+
+        self.assertEqual(self.client.get('/image/999').status_code, 404)
+        self.assertEqual(response_cache.stats()['hits'], 0)
+
+    def test_disabled(self):
+        self.config.response_cache_enabled = False
+
+        rsp = self.client.get('/image/1')
+
+        self.assertNotIn('ETag', rsp)
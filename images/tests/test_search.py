@@ -0,0 +1,87 @@
+from django.apps import apps
+from django.test import TestCase
+
+from .. import actions
+from ..models import Image, Comment
+from ..search import search, update_search_vectors
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.config = apps.get_app_config('images')
+        self.saved = (self.config.image_page_size, self.config.search_comments_max, self.config.search_max_ranked)
+        self.whiteboard = actions._save_description(Image.objects.create(file='a.jpg'), 'A whiteboard covered in fractions')
+        self.dog = actions._save_description(Image.objects.create(file='b.jpg'), 'A dog asleep on a rug')
+        self.unanalyzed = Image.objects.create(file='c.jpg')
+
+    def tearDown(self):
+        self.config.image_page_size, self.config.search_comments_max, self.config.search_max_ranked = self.saved
+
+    def _ids(self, text):
+        return list(search(text).order_by('search_key', 'pk').values_list('id', flat=True))
+
+    def test_analyzed_descriptions_are_searchable(self):
+        self.assertEqual(self._ids('fraction'), [self.whiteboard.id])
+        self.assertEqual(self._ids('"whiteboard covered"'), [self.whiteboard.id])
+        self.assertEqual(self._ids('dog -whiteboard'), [self.dog.id])
+        self.assertEqual(self._ids('giraffe'), [])
+
+    def test_comments_are_searchable_until_deleted(self):
+        rsp = self.client.post(f'/image/{self.unanalyzed.id}/comments', {'content': 'Looks like long division'})
+        self.assertEqual(self._ids('division'), [self.unanalyzed.id])
+
+        Comment.objects.get(pk=rsp.json()['id']).delete()
+        self.assertEqual(self._ids('division'), [])
+
+    def test_only_the_newest_comments_are_indexed(self):
+        self.config.search_comments_max = 1
+        Comment.objects.create(image=self.dog, content='oldest remark')
+        Comment.objects.create(image=self.dog, content='newest remark')
+
+        self.assertEqual(self._ids('newest'), [self.dog.id])
+        self.assertEqual(self._ids('oldest'), [])
+
+    def test_description_matches_rank_above_comment_matches(self):
+        Comment.objects.create(image=self.dog, content='reminds me of a whiteboard')
+
+        self.assertEqual(self._ids('whiteboard'), [self.whiteboard.id, self.dog.id])
+
+    def test_only_the_newest_matches_are_ranked(self):
+        Comment.objects.create(image=self.dog, content='reminds me of a whiteboard')
+        self.config.search_max_ranked = 1
+
+        self.assertEqual(self._ids('whiteboard'), [self.dog.id])
+
+    def test_bulk_updates_are_indexed_explicitly(self):
+        self.unanalyzed.description = 'A fern in a pot'
+        Image.objects.bulk_update([self.unanalyzed], ['description'])
+        self.assertEqual(self._ids('fern'), [])
+
+        update_search_vectors([self.unanalyzed.id])
+        self.assertEqual(self._ids('fern'), [self.unanalyzed.id])
+
+class SearchEndpointTest(TestCase):
+    def setUp(self):
+        self.config = apps.get_app_config('images')
+        self.saved_page_size = self.config.image_page_size
+        self.config.image_page_size = 2
+        self.images = [
+            actions._save_description(Image.objects.create(file=f'{i}.jpg'), 'chalkboard ' * (3 - i) + 'lesson')
+            for i in range(3)
+        ]
+
+    def tearDown(self):
+        self.config.image_page_size = self.saved_page_size
+
+    def test_pages_through_the_best_matches_first(self):
+        first = self.client.get('/images/search', {'q': 'chalkboard'}).json()
+        second = self.client.get('/images/search', {'q': 'chalkboard', 'cursor': first['next']}).json()
+
+        self.assertEqual([image['id'] for image in first['data'] + second['data']], [image.id for image in self.images])
+        self.assertGreater(first['data'][0]['rank'], first['data'][1]['rank'])
+        self.assertIsNone(second['next'])
+        back = self.client.get('/images/search', {'q': 'chalkboard', 'cursor': second['prev']}).json()
+        self.assertEqual(back['data'], first['data'])
+
+    def test_q_is_required(self):
+        self.assertEqual(self.client.get('/images/search').status_code, 400)
+        self.assertEqual(self.client.get('/images/search?q=%20').status_code, 400)
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import time
+from io import StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+
+from ..models import Image, StoredFile
+from ..storage import is_content_addressed
+from .helpers import MediaRootMixin, image_bytes
+
+class ContentAddressedStorageTest(MediaRootMixin, TestCase):
+    def _create(self, data: bytes, name='upload.png') -> Image:
+        return Image.objects.create(file=SimpleUploadedFile(name, data))
+
+    def test_files_are_named_by_content_under_shard_directories(self):
+        data = image_bytes()
+        image = self._create(data, name='Holiday Photo.PNG')
+
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(image.file.name, f'images/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertTrue(is_content_addressed(image.file.name))
+        self.assertFalse(is_content_addressed('images/holiday.png'))
+
+    def test_identical_uploads_share_one_file_until_the_last_image_goes(self):
+        data = image_bytes()
+        first, second = self._create(data), self._create(data, name='copy.png')
+        other = self._create(image_bytes(color='blue'))
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(len(self._stored_files()), 2)
+        self.assertEqual(StoredFile.objects.get(name=first.file.name).ref_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(os.path.exists(second.file.path))
+        self.assertEqual(StoredFile.objects.get(name=second.file.name).ref_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(os.path.exists(second.file.path))
+        self.assertFalse(StoredFile.objects.filter(name=second.file.name).exists())
+        self.assertEqual(self._stored_files(), [other.file.name])
+
+    def test_replacing_an_images_file_releases_the_old_one(self):
+        image = self._create(image_bytes())
+        old_name = image.file.name
+
+        image.file = SimpleUploadedFile('replacement.png', image_bytes(color='blue'))
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+
+        self.assertFalse(StoredFile.objects.filter(name=old_name).exists())
+        self.assertEqual(self._stored_files(), [image.file.name])
+        self.assertEqual(StoredFile.objects.get(name=image.file.name).ref_count, 1)
+
+    def test_reuploading_the_same_bytes_keeps_one_reference(self):
+        image = self._create(image_bytes())
+
+        image.file = SimpleUploadedFile('again.png', image_bytes())
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+
+        self.assertEqual(StoredFile.objects.get(name=image.file.name).ref_count, 1)
+        self.assertTrue(os.path.exists(image.file.path))
+
+class RehomeMediaCommandTest(MediaRootMixin, TransactionTestCase):
+    def _legacy_image(self, name: str, data: bytes) -> Image:
+        path = self._media_path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as legacy_file:
+            legacy_file.write(data)
+        # Old enough for cleanup to remove once it's moved
+        os.utime(path, (time.time() - 2 * 60 * 60,) * 2)
+        return Image.objects.create(file=name)
+
+    def test_it_moves_legacy_files_into_shards_and_removes_the_old_names(self):
+        data = image_bytes()
+        first, second = self._legacy_image('images/a.png', data), self._legacy_image('images/b.png', data)
+        missing = Image.objects.create(file='images/gone.png')
+
+        output = StringIO()
+        call_command('rehome_media', '--workers=2', '--chunk-size=2', stdout=output)
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(first.file.name, f'images/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual(first.content_hash, digest)
+        self.assertEqual(Image.objects.get(pk=missing.pk).file.name, 'images/gone.png')
+        self.assertEqual(self._stored_files(), [first.file.name])
+        self.assertEqual(StoredFile.objects.get(name=first.file.name).ref_count, 2)
+        self.assertIn('2 images moved, 1 files skipped', output.getvalue())
+        self.assertIn('removed 2 old files', output.getvalue())
+        self.assertIn('1 files for 2 images', output.getvalue())
@@ -0,0 +1,106 @@
+import io
+import os
+import threading
+import time
+from unittest.mock import patch
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from PIL import Image as PILImage
+
+from .. import thumbnails
+from ..models import Image
+from .helpers import MediaRootMixin, image_bytes
+
+def jpeg_bytes(size=(800, 600)) -> bytes:
+    return image_bytes(size, 'JPEG', 'green')
+
+class ThumbnailTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.image = Image.objects.create(file=SimpleUploadedFile('photo.jpg', jpeg_bytes()))
+
+    def _get(self, query='', headers=None):
+        return self.client.get(f'/image/{self.image.id}/thumb{query}', headers=headers or {})
+
+    def test_thumbnails_are_scaled_to_the_width_in_the_format_asked_for(self):
+        rsp = self._get('?w=128&fmt=png')
+
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(rsp['Content-Type'], 'image/png')
+        self.assertIn('max-age', rsp['Cache-Control'])
+        with PILImage.open(io.BytesIO(b''.join(rsp.streaming_content))) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('PNG', (128, 96)))
+
+        rsp = self._get()
+        self.assertEqual(rsp['Content-Type'], 'image/webp')
+        with PILImage.open(io.BytesIO(b''.join(rsp.streaming_content))) as thumb:
+            self.assertEqual(thumb.size, (256, 192))
+
+    def test_images_are_not_scaled_up(self):
+        rsp = self._get('?w=1024&fmt=jpeg')
+
+        with PILImage.open(io.BytesIO(b''.join(rsp.streaming_content))) as thumb:
+            self.assertEqual(thumb.size, (800, 600))
+
+    def test_thumbnails_are_rendered_once_and_then_served_from_the_cache(self):
+        with patch('images.thumbnails.render', wraps=thumbnails.render) as render:
+            first = b''.join(self._get('?w=64').streaming_content)
+            second = b''.join(self._get('?w=64').streaming_content)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first, second)
+
+    def test_images_with_the_same_content_share_thumbnails(self):
+        other = Image.objects.create(file=SimpleUploadedFile('copy.jpg', jpeg_bytes()))
+        self._get('?w=64')
+
+        with patch('images.thumbnails.render') as render:
+            rsp = self.client.get(f'/image/{other.id}/thumb?w=64')
+
+        self.assertEqual(rsp.status_code, 200)
+        render.assert_not_called()
+
+    def test_a_matching_etag_gets_a_304(self):
+        etag = self._get()['ETag']
+
+        rsp = self._get(headers={'If-None-Match': etag})
+
+        self.assertEqual(rsp.status_code, 304)
+        self.assertEqual(rsp['ETag'], etag)
+
+    def test_invalid_widths_and_formats_are_rejected(self):
+        for query in ('?w=100', '?w=big', '?fmt=gif'):
+            rsp = self._get(query)
+            self.assertEqual(rsp.status_code, 400, query)
+            self.assertIn('error', rsp.json())
+
+    def test_missing_images_and_files_are_404(self):
+        self.assertEqual(self.client.get('/image/0/thumb').status_code, 404)
+        os.remove(self.image.file.path)
+        self.assertEqual(self._get().status_code, 404)
+
+    def test_concurrent_requests_for_a_thumbnail_share_one_render(self):
+        image = Image.objects.get(pk=self.image.pk)
+        # Hashed (and saved) here, so the threads don't touch the database
+        thumbnails.get_thumbnail(image, 64, 'webp')
+        real_render = thumbnails.render
+
+        def slow_render(*args):
+            time.sleep(0.2)
+            return real_render(*args)
+
+        with patch('images.thumbnails.render', side_effect=slow_render) as render:
+            workers = [threading.Thread(target=thumbnails.get_thumbnail, args=(image, 128, 'webp')) for _ in range(4)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        self.assertEqual(render.call_count, 1)
+
+    def test_the_image_list_links_thumbnails(self):
+        rsp = self.client.get('/images/')
+
+        urls = rsp.json()['data'][0]['thumbnails']
+        self.assertEqual(urls['128'], f'/image/{self.image.id}/thumb?w=128&fmt=webp')
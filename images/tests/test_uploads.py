@@ -0,0 +1,81 @@
+import hashlib
+import struct
+import zlib
+
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from ..models import Image
+from .helpers import MediaRootMixin, image_bytes
+from ..uploads import read_dimensions, sniff_format
+
+def png_header(width, height) -> bytes:
+    # A PNG signature, IHDR chunk and the start of an IDAT chunk, where Pillow stops reading
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr
+            + struct.pack('>I', zlib.crc32(b'IHDR' + ihdr)) + struct.pack('>I', 0) + b'IDAT')
+
+class ImageUploadHandlerTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        config = apps.get_app_config('images')
+        self.saved_config = (config.analyze_async, config.upload_max_bytes, config.upload_max_pixels)
+        config.analyze_async = True
+
+    def tearDown(self):
+        config = apps.get_app_config('images')
+        config.analyze_async, config.upload_max_bytes, config.upload_max_pixels = self.saved_config
+        super().tearDown()
+
+    def _post(self, data: bytes, name='photo.jpg'):
+        return self.client.post('/analyze-image', data={'file': SimpleUploadedFile(name, data)})
+
+    def test_the_upload_is_written_once_to_its_place_in_storage_and_hashed(self):
+        data = image_bytes((640, 480), 'JPEG')
+        rsp = self._post(data)
+
+        self.assertEqual(rsp.status_code, 202)
+        image = Image.objects.get(pk=rsp.json()['id'])
+        self.assertEqual(image.content_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(image.file.name, f'images/{image.content_hash[:2]}/{image.content_hash[2:4]}/{image.content_hash}.jpg')
+        with open(image.file.path, 'rb') as stored:
+            self.assertEqual(stored.read(), data)
+        self.assertEqual(self._stored_files(), [image.file.name])
+
+    def test_the_same_bytes_uploaded_twice_are_stored_once(self):
+        data = image_bytes((640, 480), 'JPEG')
+        first, second = self._post(data, name='a.jpg').json(), self._post(data, name='b.jpeg').json()
+
+        self.assertEqual(Image.objects.get(pk=first['id']).file.name, Image.objects.get(pk=second['id']).file.name)
+        self.assertEqual(len(self._stored_files()), 1)
+
+    def test_uploads_over_the_size_limit_are_stopped_and_removed(self):
+        apps.get_app_config('images').upload_max_bytes = 1000
+        rsp = self._post(image_bytes((1000, 1000), 'JPEG'))
+
+        self.assertEqual(rsp.status_code, 413)
+        self.assertFalse(Image.objects.exists())
+        self.assertEqual(self._stored_files(), [])
+
+    def test_images_with_too_many_pixels_are_stopped_at_the_header(self):
+        apps.get_app_config('images').upload_max_pixels = 100 * 100
+        rsp = self._post(png_header(101, 100) + b'\x00' * 100, name='big.png')
+
+        self.assertEqual(rsp.status_code, 413)
+        self.assertIn('pixels', rsp.json()['errors']['file'][0])
+        self.assertEqual(self._stored_files(), [])
+
+    def test_files_that_are_not_images_are_rejected_whatever_their_name(self):
+        for data in (b'%PDF-1.7 not an image at all', b'\xff\xd8\xff' + b'\x00' * 64, b'GIF89a'):
+            rsp = self._post(data, name='photo.gif')
+            self.assertEqual(rsp.status_code, 422, data)
+            self.assertIn('file', rsp.json()['errors'])
+        self.assertFalse(Image.objects.exists())
+        self.assertEqual(self._stored_files(), [])
+
+    def test_formats_and_dimensions_come_from_the_header(self):
+        self.assertEqual(sniff_format(b'RIFF\x00\x00\x00\x00WEBPVP8 '), 'WEBP')
+        self.assertIsNone(sniff_format(b'<html><body>'))
+        self.assertEqual(read_dimensions(png_header(320, 200)), ('PNG', 320, 200, 1))
+        self.assertIsNone(read_dimensions(b'\x89PNG\r\n\x1a\n'))
@@ -1,17 +1,31 @@
 import base64
+from datetime import datetime, timezone as dt_timezone
 from unittest.mock import patch, Mock
 
 from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 
-from ..models import Image
+from ..counters import IMAGE_TOTAL_KEY
+from ..models import Image, AnalysisJob, Comment
 from ..describers import ImageDescriberError
+from ..search import search
+from .helpers import CountedCommentsMixin, MediaRootMixin
 
 # View Tests
-class AnalyzeImageEndpointTest(TestCase):
+class AnalyzeImageEndpointTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        """
+        These tests cover inline analysis; see AnalyzeImageAsyncEndpointTest for the queued path
+        """
+        super().setUp()
+        apps.get_app_config('images').analyze_async = False
+
     def test_if_the_request_method_is_get_it_responds_with_405(self):
         rsp = self.client.get('/analyze-image')
         self.assertEqual(rsp.status_code, 405)
@@ -57,6 +71,57 @@ class AnalyzeImageEndpointTest(TestCase):
         
         return self.client.post('/analyze-image', data={'file': image_file})
 
+class AnalyzeImageAsyncEndpointTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        apps.get_app_config('images').analyze_async = True
+
+    @patch('images.actions.analyze_image')
+    def test_it_stores_the_image_queues_a_job_and_responds_with_202(self, action_mock):
+        rsp = AnalyzeImageEndpointTest._post_image(self)
+
+        self.assertEqual(rsp.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(rsp.json()['status'], 'pending')
+        self.assertFalse(rsp.json()['analyzed'])
+        action_mock.assert_not_called()
+        job = AnalysisJob.objects.get(image_id=rsp.json()['id'])
+        self.assertEqual(job.status, AnalysisJob.Status.QUEUED)
+
+    def test_it_stores_the_content_hash_of_the_upload(self):
+        rsp = AnalyzeImageEndpointTest._post_image(self)
+
+        self.assertEqual(len(Image.objects.get(pk=rsp.json()['id']).content_hash), 64)
+
+class AnalyzeImageAsyncViewTest(MediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        apps.get_app_config('images').openai_api_key = ''
+
+    async def test_it_stores_and_analyzes_the_image_in_the_request(self):
+        rsp = await self.async_client.post('/analyze-image/async', data={'file': self._image_file()})
+
+        self.assertEqual(rsp.status_code, 200)
+        self.assertTrue(rsp.json()['analyzed'])
+        self.assertEqual(rsp.json()['status'], 'analyzed')
+
+    @patch('images.actions.aanalyze_image', side_effect=ImageDescriberError('this is a bad scene!'))
+    async def test_it_returns_the_image_and_an_error_message_if_analysis_failed(self, action_mock):
+        rsp = await self.async_client.post('/analyze-image/async', data={'file': self._image_file()})
+
+        self.assertEqual(rsp.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(rsp.json()['errors']['describer'], ['this is a bad scene!'])
+
+    async def test_it_validates_the_uploaded_file_is_an_image(self):
+        non_image_file = SimpleUploadedFile("non_image.xlsx", b"file_content", content_type="application/vnd.ms-excel")
+        rsp = await self.async_client.post('/analyze-image/async', data={'file': non_image_file})
+
+        self.assertEqual(rsp.status_code, 422)
+        self.assertIn('file', rsp.json()['errors'])
+
+    def _image_file(self):
+        image_data = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAUA" + "AAAFCAYAAACNbyblAAAAHElEQVQI12P4//8/w38GIAXDIBKE0DHxgljNBAAO" + "9TXL0Y4OHwAAAABJRU5ErkJggg==")
+        return SimpleUploadedFile("image_file.png", image_data, content_type="image/png")
+
 class ImageIndexEndpointTest(TestCase):
     fixtures = ['images.json']
 
@@ -65,6 +130,8 @@ class ImageIndexEndpointTest(TestCase):
         Set the image_page_size to test pagination without creating lots of image records
         """
         apps.get_app_config('images').image_page_size = 2
+        # The image total is cached across requests; start each test from a fresh count
+        cache.delete(IMAGE_TOTAL_KEY)
 
     def test_if_no_page_is_provided_it_returns_the_first_page_of_images(self):
         """
@@ -96,7 +163,72 @@ class ImageIndexEndpointTest(TestCase):
         self.assertEqual(rsp.status_code, 416)
         self.assertEqual(2, int(rsp.json()['num_pages']))
 
-class ImageShowWithCommentsEndpointTest(TestCase):
+    def test_with_a_cursor_it_pages_with_next_and_prev_cursors(self):
+        first = self.client.get("/images/?cursor=").json()
+        self.assertEqual([1,2], [i['id'] for i in first['data']])
+        self.assertIsNone(first['prev'])
+        self.assertNotIn('num_pages', first)
+
+        second = self.client.get("/images/", {'cursor': first['next']}).json()
+        self.assertEqual([3], [i['id'] for i in second['data']])
+        self.assertIsNone(second['next'])
+
+        back = self.client.get("/images/", {'cursor': second['prev']}).json()
+        self.assertEqual([1,2], [i['id'] for i in back['data']])
+
+    def test_an_invalid_cursor_returns_a_400_response(self):
+        rsp = self.client.get("/images/?cursor=garbage")
+
+        self.assertEqual(rsp.status_code, 400)
+
+class ImageIndexEmbedAndIdsTest(CountedCommentsMixin, TestCase):
+    fixtures = ['images', 'comments']
+
+    def setUp(self):
+        self.config = apps.get_app_config('images')
+        self.saved = (self.config.image_page_size, self.config.response_cache_enabled)
+        self.config.image_page_size = 3
+        # The query counts below are for the view, not the response cache
+        self.config.response_cache_enabled = False
+        cache.delete(IMAGE_TOTAL_KEY)
+        for minute in range(3):
+            Comment.objects.create(image_id=2, content=f'comment {minute}')
+            Comment.objects.filter(content=f'comment {minute}').update(created_at=datetime(2024, 1, 1, 0, minute, tzinfo=dt_timezone.utc))
+
+    def tearDown(self):
+        self.config.image_page_size, self.config.response_cache_enabled = self.saved
+
+    def test_embed_comments_adds_the_newest_comments_and_the_total(self):
+        images = {image['id']: image for image in self.client.get('/images/?embed_comments=2').json()['data']}
+
+        self.assertEqual([c['content'] for c in images[2]['comments']['data']], ['comment 2', 'comment 1'])
+        self.assertEqual(images[2]['comments']['total'], 3)
+        self.assertEqual(len(images[1]['comments']['data']), 2)
+        self.assertEqual(images[3]['comments'], {'data': [], 'total': 0})
+
+    def test_embedding_takes_the_same_queries_for_any_page_size(self):
+        queries = []
+        self.client.get('/images/')
+        for page_size in (1, 3):
+            self.config.image_page_size = page_size
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.client.get('/images/?embed_comments=3').status_code, 200)
+            queries.append(len(captured))
+
+        self.assertEqual(queries, [2, 2])
+
+    def test_ids_returns_those_images_in_the_order_asked(self):
+        rsp = self.client.get('/images/?ids=3,1,999,3&embed_comments=1')
+
+        self.assertEqual([image['id'] for image in rsp.json()['data']], [3, 1])
+        self.assertEqual(rsp.json()['data'][1]['comments']['total'], 3)
+
+    def test_bad_parameters_return_a_400_response(self):
+        too_many = ','.join(str(i) for i in range(self.config.multi_get_max_ids + 1))
+        for query in ('embed_comments=0', 'embed_comments=11', 'embed_comments=x', 'ids=1,two', f'ids={too_many}'):
+            self.assertEqual(self.client.get(f'/images/?{query}').status_code, 400, query)
+
+class ImageShowWithCommentsEndpointTest(CountedCommentsMixin, TestCase):
     fixtures = ['images', 'comments']
     
     def test_if_image_not_found_it_responds_w_404(self):
@@ -131,6 +263,33 @@ class ImageShowWithCommentsEndpointTest(TestCase):
         rsp = self.client.get('/image/1?comment_page=99')
         self.assertEqual(rsp.status_code, 416)
 
+class ImageShowWithCommentCursorEndpointTest(CountedCommentsMixin, TestCase):
+    fixtures = ['images', 'comments']
+
+    def setUp(self):
+        apps.get_app_config('images').comment_page_size = 2
+
+    def test_it_pages_comments_by_cursor_without_counting_them(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get('/image/1?comment_cursor=').json()['comments']
+        self.assertFalse([q for q in queries if 'COUNT(' in q['sql']])
+        self.assertEqual([1, 2], [c['id'] for c in first['data']])
+        self.assertIsNone(first['prev'])
+        self.assertNotIn('num_pages', first)
+        self.assertNotIn('total', first)
+
+        second = self.client.get('/image/1', {'comment_cursor': first['next']}).json()['comments']
+        self.assertEqual([3], [c['id'] for c in second['data']])
+        self.assertIsNone(second['next'])
+
+    def test_the_total_is_counted_when_asked_for(self):
+        rsp = self.client.get('/image/1?comment_cursor=&comment_total=1')
+
+        self.assertEqual(rsp.json()['comments']['total'], 3)
+
+    def test_an_invalid_comment_cursor_returns_a_400_response(self):
+        self.assertEqual(self.client.get('/image/1?comment_cursor=garbage').status_code, 400)
+
 class AddCommentEndpointTest(TestCase):
     fixtures = ['images']
 
@@ -163,3 +322,42 @@ class AddCommentEndpointTest(TestCase):
         self.assertEqual(rsp.json()['content'], 'This is content')
         self.assertIsNotNone(rsp.json()['id'])
         
+
+class CommentBatchEndpointTest(TestCase):
+    fixtures = ['images']
+
+    def test_it_creates_the_valid_comments_and_reports_each_item(self):
+        batch = [
+            {'image_id': 1, 'content': 'First'},
+            {'image_id': 999, 'content': 'Lost'},
+            {'image_id': 2, 'content': ''},
+            {'image_id': 1, 'content': 'Second'},
+        ]
+        count_before = Image.objects.get(pk=1).comment_count
+        with CaptureQueriesContext(connection) as queries:
+            rsp = self.client.post('/comments', batch, content_type='application/json')
+
+        self.assertEqual(rsp.status_code, 207)
+        self.assertEqual((rsp.json()['created'], rsp.json()['failed']), (2, 2))
+        self.assertEqual([result['status'] for result in rsp.json()['results']], [201, 404, 422, 201])
+        self.assertEqual(rsp.json()['results'][3]['comment']['content'], 'Second')
+        self.assertIn('content', rsp.json()['results'][2]['errors'])
+        self.assertEqual(Image.objects.get(pk=1).comment_count, count_before + 2)
+        self.assertEqual(list(Comment.objects.filter(image_id=1).order_by('id').values_list('content', flat=True)), ['First', 'Second'])
+        # Image lookup, insert, counters and search vectors, whatever the batch size
+        self.assertLessEqual(len([q for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]), 4)
+
+    def test_it_responds_200_when_every_comment_is_created(self):
+        rsp = self.client.post('/comments', [{'image_id': 2, 'content': 'Fine'}], content_type='application/json')
+        self.assertEqual(rsp.status_code, 200)
+        self.assertEqual(list(search('fine').values_list('id', flat=True)), [2])
+
+    def test_a_body_that_is_not_a_list_is_rejected(self):
+        apps.get_app_config('images').comment_batch_max = 1
+        try:
+            for body in ({'image_id': 1, 'content': 'Not a list'}, [{'image_id': 1, 'content': 'a'}] * 2):
+                rsp = self.client.post('/comments', body, content_type='application/json')
+                self.assertEqual(rsp.status_code, 422)
+        finally:
+            apps.get_app_config('images').comment_batch_max = 10000
+        self.assertFalse(Comment.objects.exists())
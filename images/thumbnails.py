@@ -0,0 +1,112 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import hashlib
+import io
+import threading
+import weakref
+from typing import NamedTuple, Union
+from django.apps import apps
+from django.urls import reverse
+from PIL import Image as PILImage, ImageOps
+from .description_cache import hash_file
+from .disk_cache import DiskCache
+from .models import Image
+
+# ?fmt= values, the Pillow format each renders to, its file extension and MIME type
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+    'png': ('PNG', 'png', 'image/png'),
+}
+
+class Thumbnail(NamedTuple):
+    # A rendered (or cached) variant of an image, and the key it's cached under.
+    path: str
+    mime_type: str
+    key: str
+
+class InvalidThumbnail(ValueError):
+    pass
+
+_cache = None
+# A lock per variant being rendered, so concurrent requests for it wait for one render
+_render_locks = weakref.WeakValueDictionary()
+_render_locks_guard = threading.Lock()
+
+def get_cache() -> DiskCache:
+    global _cache
+    config = apps.get_app_config('images')
+    if _cache is None or _cache.max_bytes != config.thumbnail_cache_max_bytes:
+        _cache = DiskCache(config.thumbnail_cache_dir, config.thumbnail_cache_max_bytes)
+    return _cache
+
+def parse_params(width: Union[str, None], fmt: Union[str, None]) -> tuple:
+    """
+    The (width, fmt) of a thumbnail request, defaulting to thumbnail_default_width and
+    webp.  Only thumbnail_widths are rendered, so the cache holds a few variants per image.
+    """
+    config = apps.get_app_config('images')
+    try:
+        width = int(width) if width else config.thumbnail_default_width
+    except ValueError:
+        raise InvalidThumbnail(f'w must be one of {", ".join(map(str, config.thumbnail_widths))}')
+    if width not in config.thumbnail_widths:
+        raise InvalidThumbnail(f'w must be one of {", ".join(map(str, config.thumbnail_widths))}')
+    fmt = (fmt or 'webp').lower()
+    if fmt not in FORMATS:
+        raise InvalidThumbnail(f'fmt must be one of {", ".join(FORMATS)}')
+    return width, fmt
+
+def cache_key(content_hash: str, width: int, fmt: str) -> str:
+    quality = apps.get_app_config('images').thumbnail_quality
+    return hashlib.sha256(f'{content_hash}:{width}:{fmt}:{quality}'.encode('utf-8')).hexdigest()
+
+def get_thumbnail(image: Image, width: int, fmt: str) -> Thumbnail:
+    """
+    The image scaled to `width` (never up) in `fmt`, from the disk cache or rendered into
+    it.  Variants are keyed by the image's content, so identical uploads share them, and
+    a render is shared by all the requests for that variant that arrive during it.
+    """
+    if not image.content_hash:
+        image.content_hash = hash_file(image.file)
+        image.file.close()
+        Image.objects.filter(pk=image.pk).update(content_hash=image.content_hash)
+    pil_format, extension, mime_type = FORMATS[fmt]
+    key = cache_key(image.content_hash, width, fmt)
+
+    path = get_cache().get(key, extension)
+    if path:
+        return Thumbnail(path, mime_type, key)
+    with _render_locks_guard:
+        lock = _render_locks.setdefault(key, threading.Lock())
+    with lock:
+        # Rendered by whoever held the lock first
+        path = get_cache().get(key, extension)
+        if path is None:
+            path = get_cache().put(key, extension, render(image.file.path, width, pil_format))
+    return Thumbnail(path, mime_type, key)
+
+def render(path: str, width: int, pil_format: str) -> bytes:
+    quality = apps.get_app_config('images').thumbnail_quality
+    with PILImage.open(path) as img:
+        # JPEGs decode at the smallest scale that keeps both sides at least `width` (so an EXIF
+        # rotation can't leave it short), which is most of the work saved
+        img.draft('RGB', (width, width))
+        img = ImageOps.exif_transpose(img)
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), PILImage.LANCZOS)
+        if pil_format == 'JPEG' or img.mode not in ('RGB', 'RGBA'):
+            has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+            img = img.convert('RGBA' if has_alpha and pil_format != 'JPEG' else 'RGB')
+        buffer = io.BytesIO()
+        img.save(buffer, format=pil_format, quality=quality)
+        return buffer.getvalue()
+
+def urls(image_id: int, name: str) -> Union[dict, None]:
+    # Thumbnail URLs for the image list, by width, or None for an image without a file
+    if not name:
+        return None
+    url = reverse('image_thumbnail', args=[image_id])
+    return {str(width): f'{url}?w={width}&fmt=webp' for width in apps.get_app_config('images').thumbnail_list_widths}
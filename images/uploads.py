@@ -0,0 +1,194 @@
+"""
+Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
+"""
+
+import functools
+import hashlib
+import logging
+import os
+from typing import Union
+from django.apps import apps
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopFutureHandlers, StopUpload
+from PIL import Image as PILImage
+from . import metadata
+from .models import Image
+from .storage import SIGNATURE_BYTES, sniff_format
+
+# Allowance for the multipart boundaries and other fields around the file
+MULTIPART_OVERHEAD = 64 * 1024
+# ImageField's message for a file Pillow can't open
+INVALID_IMAGE = 'Upload a valid image. The file you uploaded was either not an image or a corrupted image.'
+
+class UploadRejected(Exception):
+    """
+    An upload that was stopped because it isn't an image, or is too big.
+    """
+    def __init__(self, message: str, status: int = 422):
+        super().__init__(message)
+        self.status = status
+
+class StoredImageUpload(UploadedFile):
+    """
+    An upload already written to its place in storage.  `storage_name` is the name to give
+    Image.file, which then saves nothing.  `metadata` was read from the header.
+    """
+    def __init__(self, file, storage_name: str, content_type: str, size: int, content_hash: str,
+                 metadata: metadata.ImageMetadata):
+        super().__init__(file, storage_name, content_type, size)
+        self.storage_name = storage_name
+        self.content_hash = content_hash
+        self.metadata = metadata
+
+def read_dimensions(header: bytes) -> Union[metadata.ImageMetadata, None]:
+    """
+    The format, dimensions and orientation from the start of an image file, or None when
+    more of it is needed.  Pillow only reads the header when opening, so no pixels are decoded.
+    """
+    try:
+        return metadata.read_header(header)
+    except PILImage.DecompressionBombError:
+        raise UploadRejected('The image has too many pixels', 413)
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Streams the `file` field of an upload straight to where Image.file stores it, in one
+    pass: each chunk is hashed and written as it arrives, the first bytes are checked for
+    an image signature and the dimensions read from the header.  Bodies larger than
+    upload_max_bytes, and files that aren't images, are stopped without reading the rest.
+    Other fields, and storages without local paths, are left to the next handlers.
+    """
+    def __init__(self, request=None):
+        super().__init__(request)
+        config = apps.get_app_config('images')
+        self.max_bytes = config.upload_max_bytes
+        self.max_pixels = config.upload_max_pixels
+        self.sniff_bytes = config.upload_sniff_bytes
+        self.rejection = None
+        # Set once this handler takes the file.  (`file` is left unset until then, as the
+        # multipart parser closes the `file` of every handler when an upload stops.)
+        self.path = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Refused once the parser reaches the file, as raising here would fail the request
+        if content_length > self.max_bytes + MULTIPART_OVERHEAD:
+            self.rejection = UploadRejected(f'The upload is larger than {self.max_bytes} bytes', 413)
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        if self.rejection:
+            raise StopUpload(connection_reset=True)
+        if field_name != 'file' or self.path is not None:
+            return
+        field = Image._meta.get_field('file')
+        try:
+            self.path = self._create(field.storage, field.generate_filename(None, file_name))
+        except NotImplementedError:
+            # No local path to stream to
+            return
+        self.digest = hashlib.sha256()
+        self.header = bytearray()
+        self.image_info = None
+        raise StopFutureHandlers()
+
+    def _create(self, storage, name: str) -> str:
+        # Opens a new file at an available name, the way FileSystemStorage saves one
+        while True:
+            name = storage.get_available_name(name)
+            path = storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+            except FileExistsError:
+                continue
+            self.storage_name = name
+            self.file = os.fdopen(fd, 'w+b')
+            return path
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.path is None:
+            return raw_data
+        try:
+            if start + len(raw_data) > self.max_bytes:
+                raise UploadRejected(f'The upload is larger than {self.max_bytes} bytes', 413)
+            if self.image_info is None:
+                self._sniff(raw_data)
+        except UploadRejected as e:
+            self._reject(e)
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def _sniff(self, raw_data: bytes):
+        self.header += raw_data[:self.sniff_bytes - len(self.header)]
+        if len(self.header) < SIGNATURE_BYTES:
+            return
+        if sniff_format(self.header) is None:
+            raise UploadRejected(INVALID_IMAGE)
+        self.image_info = read_dimensions(bytes(self.header))
+        if self.image_info is None:
+            if len(self.header) >= self.sniff_bytes:
+                raise UploadRejected('The image header could not be read')
+            return
+        image_format, width, height, _ = self.image_info
+        if image_format != sniff_format(self.header):
+            raise UploadRejected(f'The file looks like {sniff_format(self.header)} but is {image_format}')
+        if width * height > self.max_pixels:
+            raise UploadRejected(f'The image has more than {self.max_pixels} pixels', 413)
+        self.header = None
+
+    def file_complete(self, file_size):
+        if self.path is None:
+            return None
+        if self.image_info is None:
+            # Shorter than a signature, or it ended inside the header
+            self._reject(UploadRejected(INVALID_IMAGE))
+        self.file.flush()
+        self.file.seek(0)
+        storage = Image._meta.get_field('file').storage
+        if hasattr(storage, 'adopt'):
+            # Moved (a rename) to its content-addressed name, or dropped for the stored copy
+            directory = os.path.dirname(self.storage_name)
+            self.storage_name = storage.adopt(self.path, self.digest.hexdigest(), directory)
+            self.path = None
+        image_format = self.image_info.image_format
+        logging.debug(f'streamed {file_size} bytes of {image_format} to {self.storage_name}')
+        return StoredImageUpload(
+            self.file, self.storage_name, PILImage.MIME.get(image_format, self.content_type), file_size,
+            self.digest.hexdigest(), self.image_info,
+        )
+
+    def upload_interrupted(self):
+        self._discard()
+
+    def _reject(self, rejection: UploadRejected):
+        self.rejection = rejection
+        self._discard()
+        raise StopUpload(connection_reset=True)
+
+    def _discard(self):
+        if self.path is None:
+            return
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def rejection(request) -> Union[UploadRejected, None]:
+    # Why the request's upload was stopped, once its body has been parsed
+    for handler in request.upload_handlers:
+        if isinstance(handler, ImageUploadHandler) and handler.rejection:
+            return handler.rejection
+    return None
+
+def streamed_image_upload(view):
+    """
+    Parse the view's uploads with ImageUploadHandler, when upload_streaming_enabled.  Goes
+    outside @api_view, as the handlers can't change once anything (authentication or CSRF
+    checks) reads the body.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if apps.get_app_config('images').upload_streaming_enabled:
+            request.upload_handlers.insert(0, ImageUploadHandler(request))
+        return view(request, *args, **kwargs)
+    return wrapper
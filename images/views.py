@@ -2,10 +2,22 @@
 Pogramming task for TJ Ward's application the edLight Senior Fullstack Developer positon
 """
 
+import os
+import re
+
 from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
 from django.shortcuts import get_object_or_404
-from django.core.paginator import Paginator, EmptyPage
-from django.http import JsonResponse, Http404
+from django.core.paginator import EmptyPage
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponseNotModified, JsonResponse, Http404, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils._os import safe_join
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST, require_safe
+from asgiref.sync import sync_to_async
 from rest_framework.decorators import api_view, parser_classes
 from rest_framework import status
 from rest_framework.response import Response
@@ -16,31 +28,71 @@ from drf_spectacular.types import OpenApiTypes
 
 from .forms import ImageForm, CommentForm
 from .models import Image
+from .pagination import KeysetPaginator, InvalidCursor
+from .counters import CountedPaginator, image_total
 from . import serializers
 from . import actions
+from . import description_cache
+from . import export
+from . import facets
+from . import fast_json
+from . import media
+from . import metadata
+from . import search as image_search
+from . import thumbnails
+from . import uploads
+from .response_cache import cached_response
 import logging
 from .describers import ImageDescriberError
 
 @extend_schema(
-     description='Returns a page (10) image records at a time.',
+     description='Returns a page (10) image records at a time.  Pass `cursor` (empty for the first page) '
+                 'instead of `page` to page with the opaque `next`/`prev` cursors in the response, which stay fast at any depth.  '
+                 'Pass `ids` instead to get just those images.',
      responses=serializers.ImageSerializer(many=True),
      parameters=[
         OpenApiParameter("page", OpenApiTypes.NUMBER, OpenApiParameter.QUERY),
+        OpenApiParameter("cursor", OpenApiTypes.STR, OpenApiParameter.QUERY),
+        OpenApiParameter("ids", OpenApiTypes.STR, OpenApiParameter.QUERY,
+                         description='Comma separated image ids (at most 100) to get in one request, in that order; unknown ids are left out'),
+        OpenApiParameter("embed_comments", OpenApiTypes.NUMBER, OpenApiParameter.QUERY,
+                         description='Embed the newest N (at most 10) comments of each image, and its comment total, as comments: {data, total}'),
+        OpenApiParameter("tag", OpenApiTypes.STR, OpenApiParameter.QUERY, many=True,
+                         description='Only images whose analysis has this label; repeat for images with all of them'),
+        OpenApiParameter("object", OpenApiTypes.STR, OpenApiParameter.QUERY, many=True,
+                         description='Only images whose analysis has this object; repeat for images with all of them'),
+        *[OpenApiParameter(param, OpenApiTypes.NUMBER, OpenApiParameter.QUERY) for param, _ in metadata.RANGE_FILTERS],
+        OpenApiParameter("image_format", OpenApiTypes.STR, OpenApiParameter.QUERY,
+                         description='Only images in this format, e.g. jpeg or png'),
      ]
 )
+@cached_response(comments_param='embed_comments')
 @api_view(['GET'])
 def index(request):
     """
     Responds with a list of image records
     """
+    images = facets.filter_images(Image.objects.all(), request.GET.getlist('tag'), request.GET.getlist('object'))
+    try:
+        images = metadata.filter_images(images, request.GET)
+        embed = _embed_count(request.GET.get('embed_comments'))
+        if 'ids' in request.GET:
+            return _multi_get(images, _image_ids(request.GET['ids']), embed)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if 'cursor' in request.GET:
+        return _cursor_index(images, request.GET['cursor'], embed)
+
     current_page = request.GET.get('page', 1)
-    images = Image.objects.all().order_by('analyzed_at')
-    paginator = Paginator(images, apps.get_app_config('images').image_page_size)
+    # Filtered lists are counted; the cached total is for the whole table
+    count = images.count() if images.query.where else image_total()
+    images = images.order_by('analyzed_at', 'id')
+    paginator = CountedPaginator(images, apps.get_app_config('images').image_page_size, count=count)
 
     try:
-        image_page = serializers.ImageSerializer(paginator.page(current_page), many=True)
-        return JsonResponse({
-                'data': image_page.data,
+        image_page = paginator.page(current_page)
+        return fast_json.response({
+                'data': actions.embed_comments(fast_json.images(image_page.object_list), embed),
                 'num_pages': paginator.num_pages,
                 'current_page': current_page
             }
@@ -48,10 +100,146 @@ def index(request):
     except EmptyPage:
         return JsonResponse({"error": 'The page is empty', 'num_pages': paginator.num_pages}, status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
 
+def _cursor_index(images, cursor: str, embed: int):
+    paginator = KeysetPaginator(images, 'analyzed_at', apps.get_app_config('images').image_page_size)
+    try:
+        page = paginator.page(cursor)
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return fast_json.response({
+        'data': actions.embed_comments(fast_json.images(page.items), embed),
+        'next': page.next,
+        'prev': page.prev,
+    })
+
+def _multi_get(images, image_ids: list, embed: int):
+    images = {image['id']: image for image in fast_json.images(images.filter(id__in=image_ids))}
+    found = [images[image_id] for image_id in image_ids if image_id in images]
+    return fast_json.response({'data': actions.embed_comments(found, embed)})
+
+def _embed_count(value) -> int:
+    if value is None:
+        return 0
+    limit = apps.get_app_config('images').embed_comments_max
+    if not value.isdigit() or not 1 <= int(value) <= limit:
+        raise ValueError(f'embed_comments must be a number from 1 to {limit}')
+    return int(value)
+
+def _image_ids(value: str) -> list:
+    # Unique ids, in the order given
+    limit = apps.get_app_config('images').multi_get_max_ids
+    parts = [part.strip() for part in value.split(',') if part.strip()]
+    if not all(part.isdigit() for part in parts):
+        raise ValueError('ids must be comma separated image ids')
+    image_ids = list(dict.fromkeys(int(part) for part in parts))
+    if len(image_ids) > limit:
+        raise ValueError(f'at most {limit} ids can be requested at once')
+    return image_ids
+
 @extend_schema(
-    description='Ingest a new image.  Stores an image model and analyze the image',
+     description='The most common labels and objects in image analyses, with the number of images that have each.  '
+                 'With `tag`/`object` filters, the counts are among the images that match them.',
+     parameters=[
+        OpenApiParameter("tag", OpenApiTypes.STR, OpenApiParameter.QUERY, many=True),
+        OpenApiParameter("object", OpenApiTypes.STR, OpenApiParameter.QUERY, many=True),
+        OpenApiParameter("limit", OpenApiTypes.NUMBER, OpenApiParameter.QUERY, description='How many of each to return (default 20, at most 100)'),
+     ],
+     responses={
+        (200, "application/json"): {
+            "type": "object",
+            "properties": {
+                facet: {
+                    "type": "array",
+                    "items": {"type": "object", "properties": {"name": {"type": "string"}, "count": {"type": "integer"}}},
+                }
+                for facet in facets.FACETS
+            },
+        },
+     },
+)
+@cached_response()
+@api_view(['GET'])
+def tags(request):
+    """
+    Responds with label and object counts
+    """
+    limit = request.GET.get('limit', '20')
+    maximum = apps.get_app_config('images').tag_counts_max
+    if not limit.isdigit() or not 1 <= int(limit) <= maximum:
+        return JsonResponse({"error": f'limit must be a number from 1 to {maximum}'}, status=status.HTTP_400_BAD_REQUEST)
+    images = facets.filter_images(Image.objects.all(), request.GET.getlist('tag'), request.GET.getlist('object'))
+    return fast_json.response(facets.facet_counts(images, int(limit)))
+
+@extend_schema(
+     description='Full-text search of image descriptions and comments, best matches first, a page (10) at a time.  '
+                 'Page with the opaque `next`/`prev` cursors in the response.',
+     responses=serializers.ImageSerializer(many=True),
+     parameters=[
+        OpenApiParameter("q", OpenApiTypes.STR, OpenApiParameter.QUERY, required=True,
+                         description='Words to find; "quoted phrases", or and -word work as in web search engines'),
+        OpenApiParameter("cursor", OpenApiTypes.STR, OpenApiParameter.QUERY),
+     ]
+)
+@cached_response(comments_param='q')
+@api_view(['GET'])
+def search(request):
+    """
+    Responds with a page of the images matching a search
+    """
+    text = request.GET.get('q', '').strip()
+    if not text:
+        return JsonResponse({"error": 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = KeysetPaginator(image_search.search(text), 'search_key', apps.get_app_config('images').image_page_size)
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    data = fast_json.images(page.items)
+    for row, image in zip(data, page.items):
+        row['rank'] = image.rank
+    return fast_json.response({
+        'data': data,
+        'next': page.next,
+        'prev': page.prev,
+    })
+
+@extend_schema(
+     description='Every image, then every comment, as newline delimited JSON records with a `type` of `image` or `comment`, '
+                 'streamed straight from the database.  The last record has `type` `end`, the counts, and the `next_since` '
+                 'to pass for an incremental export continuing from this one; a stream without it was cut short.  '
+                 'Gzip compressed when the request accepts it.',
+     parameters=[
+        OpenApiParameter("since", OpenApiTypes.DATETIME, OpenApiParameter.QUERY,
+                         description='Only images created or analyzed and comments created since this date/time'),
+     ],
+     responses={(200, "application/x-ndjson"): OpenApiTypes.STR},
+)
+@api_view(['GET'])
+def export_ndjson(request):
+    """
+    Responds with a streamed export of all images and comments
+    """
+    try:
+        since = export.date_or_datetime(request.GET['since']) if 'since' in request.GET else None
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    compress = bool(re.search(r'\bgzip\b', request.headers.get('Accept-Encoding', '')))
+    blocks = export.ndjson(export.records(since), compress)
+    if isinstance(request._request, ASGIRequest):
+        blocks = export.async_blocks(blocks)
+    response = StreamingHttpResponse(blocks, content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="images.ndjson"'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+@extend_schema(
+    description='Ingest a new image.  Stores an image model and queues it for analysis (202), or analyzes it inline when analyze_async is off (200/207)',
     responses={
         200: serializers.ImageSerializer,
+        202: serializers.ImageSerializer,
         (207, "application/json"): {
             "description": "Image stored, but analysis failed",
             "type": "object",
@@ -68,6 +256,7 @@ def index(request):
                 },
             }
         },
+        413: OpenApiResponse(description='The upload is larger than upload_max_bytes, or the image has more than upload_max_pixels pixels'),
         422: OpenApiResponse(description='Bad request response includes errors'),
     },
     request={
@@ -82,17 +271,23 @@ def index(request):
         }
     },
 )
+@uploads.streamed_image_upload
 @api_view(['POST'])
 def ingest_image(request):
     """
-    Ingest a new image.  Store an image model and analyze the image
+    Ingest a new image.  Store an image model and queue it for analysis
     """
-    serializer = serializers.ImageUploadSerializer(data=request.data)
-    if not serializer.is_valid():
-        return JsonResponse({'errors': serializer.errors}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
-    imageModel = Image(file=request.data['file'])
-    imageModel.save()
-    logging.debug(f"stored image at {imageModel.file.path} for Image {imageModel.id}")
+    data = request.data
+    rejection = uploads.rejection(request)
+    if rejection:
+        return JsonResponse({'errors': {'file': [str(rejection)]}}, status=rejection.status)
+    imageModel, errors = _store_upload(data)
+    if errors:
+        return JsonResponse({'errors': errors}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    if apps.get_app_config('images').analyze_async:
+        actions.enqueue_analysis(imageModel)
+        return Response(serializers.ImageSerializer(imageModel).data, status.HTTP_202_ACCEPTED)
 
     status_code = status.HTTP_200_OK
     response_data = serializers.ImageSerializer(imageModel).data
@@ -106,10 +301,61 @@ def ingest_image(request):
         
     return Response(response_data, status_code)
 
+@csrf_exempt
+@require_POST
+async def ingest_image_async(request):
+    """
+    Ingest a new image and analyze it during the request without holding a thread.
+    Served by the ASGI entry point, where one process keeps many analyses in flight.
+    """
+    imageModel, errors = await sync_to_async(_store_upload)(request.FILES)
+    if errors:
+        return JsonResponse({'errors': errors}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    status_code = status.HTTP_200_OK
+    errors = None
+    try:
+        imageModel = await actions.aanalyze_image(imageModel)
+    except Exception as e:
+        logging.debug(str(e))
+        status_code = status.HTTP_207_MULTI_STATUS
+        errors = {'describer': [str(e)]}
+
+    response_data = serializers.ImageSerializer(imageModel).data
+    if errors:
+        response_data['errors'] = errors
+    return JsonResponse(response_data, status=status_code)
+
+def _store_upload(data) -> tuple:
+    """
+    Validate and store an uploaded image.  Returns (image, None) or (None, errors).
+    Uploads streamed to storage by ImageUploadHandler were checked as they arrived.
+    """
+    upload = data.get('file')
+    if isinstance(upload, uploads.StoredImageUpload):
+        imageModel = Image.objects.create(
+            file=upload.storage_name, content_hash=upload.content_hash, **metadata.fields(upload.metadata, upload.size),
+        )
+        logging.debug(f"streamed image to {imageModel.file.path} for Image {imageModel.id}")
+        return imageModel, None
+    serializer = serializers.ImageUploadSerializer(data=data)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    # ImageField's validation opened the upload with Pillow, which read the header
+    header = metadata.read(data['file'].image)
+    imageModel = Image(
+        file=data['file'], content_hash=description_cache.hash_file(data['file']),
+        **metadata.fields(header, data['file'].size),
+    )
+    imageModel.save()
+    logging.debug(f"stored image at {imageModel.file.path} for Image {imageModel.id}")
+    return imageModel, None
+
 @extend_schema(
      description='Returns an image record without comments.',
      responses=serializers.ImageSerializer,
 )
+@cached_response(per_image=True)
 @api_view(['GET'])
 def show(request, image_id):
     """
@@ -117,7 +363,7 @@ def show(request, image_id):
     """
     image = get_object_or_404(Image, pk=image_id)
     
-    return JsonResponse(serializers.ImageSerializer(image).data)
+    return fast_json.response(fast_json.image(image))
 
 @extend_schema(
     responses = {
@@ -140,6 +386,9 @@ def show(request, image_id):
                     "properties": {
                         "num_pages": { "type": "integer" },
                         "current_page": { "type": "integer" },
+                        "next": { "type": "string", "nullable": True },
+                        "prev": { "type": "string", "nullable": True },
+                        "total": { "type": "integer" },
                         "data": {
                             "type": "array",
                             "items": {
@@ -162,25 +411,88 @@ def show(request, image_id):
         },
     },
     parameters = [
-        OpenApiParameter('comment_page', OpenApiTypes.NUMBER, OpenApiParameter.QUERY)
+        OpenApiParameter('comment_page', OpenApiTypes.NUMBER, OpenApiParameter.QUERY),
+        OpenApiParameter('comment_cursor', OpenApiTypes.STR, OpenApiParameter.QUERY,
+                         description='Page comments by cursor (empty for the first page) instead of comment_page; '
+                                     'comments then has next/prev cursors in place of num_pages/current_page'),
+        OpenApiParameter('comment_total', OpenApiTypes.BOOL, OpenApiParameter.QUERY,
+                         description='With comment_cursor, also count the comments (comments.total)'),
     ]
 )
+@cached_response(per_image=True)
 @api_view(['GET'])
 def show_with_comments(request, image_id):
     """
     Get an image record with a page of comments
     """
     image = get_object_or_404(Image, pk=image_id)
-    try:
-        comment_page = actions.get_paginated_comments(image, current_page=int(request.GET.get('comment_page', 1)))
-    except EmptyPage as e:
-        return JsonResponse({"error": 'The page of comments you requested is empty', 'num_pages': e.num_pages}, status=416)
+    if 'comment_cursor' in request.GET:
+        try:
+            comment_page = actions.get_comment_cursor_page(
+                image, request.GET['comment_cursor'], request.GET.get('comment_total') in ('1', 'true')
+            )
+        except InvalidCursor as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    else:
+        try:
+            comment_page = actions.get_paginated_comments(image, current_page=int(request.GET.get('comment_page', 1)))
+        except EmptyPage as e:
+            return JsonResponse({"error": 'The page of comments you requested is empty', 'num_pages': e.num_pages}, status=416)
     
-    data = serializers.ImageSerializer(image).data
+    data = fast_json.image(image)
     data['comments'] = comment_page
    
-    return JsonResponse(data)
+    return fast_json.response(data)
     
+@require_safe
+def thumbnail(request, image_id):
+    """
+    Get the image scaled to ?w= (one of thumbnail_widths) in ?fmt= (webp, jpeg or png),
+    rendered on first request and then served from the thumbnail cache.  A plain view
+    rather than an api_view, so DRF doesn't answer an image Accept header with a 406.
+    """
+    try:
+        width, fmt = thumbnails.parse_params(request.GET.get('w'), request.GET.get('fmt'))
+    except thumbnails.InvalidThumbnail as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    image = get_object_or_404(Image.objects.only('id', 'file', 'content_hash'), pk=image_id)
+    if not image.file:
+        raise Http404('The image has no file')
+
+    # Variants are named by content, so a client's copy is good as long as the key matches
+    if image.content_hash:
+        etag = f'"{thumbnails.cache_key(image.content_hash, width, fmt)}"'
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+    try:
+        thumb = thumbnails.get_thumbnail(image, width, fmt)
+    except FileNotFoundError:
+        raise Http404('The image file is missing')
+
+    return media.file_response(request, thumb.path, thumb.mime_type, etag=thumb.key,
+                               max_age=apps.get_app_config('images').thumbnail_max_age)
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve an uploaded file at MEDIA_URL, with byte ranges, conditional GETs and cache
+    headers (see images.media).  Unlike django.views.static.serve it runs with DEBUG off,
+    and media_offload hands the sending to a proxy in front.  Only the upload directory is
+    served; the caches derived from uploads elsewhere under MEDIA_ROOT are not.
+    """
+    upload_to = Image._meta.get_field('file').upload_to
+    if not path.startswith(f'{upload_to}/'):
+        raise Http404('Not found')
+    try:
+        path = safe_join(settings.MEDIA_ROOT, upload_to, path[len(upload_to) + 1:])
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    if not os.path.isfile(path):
+        raise Http404('Not found')
+    return media.file_response(request, path)
+
 @extend_schema(
     description='Ingest a new image.  Stores an image model and analyze the image',
     responses={
@@ -207,3 +519,49 @@ def comments(request, image_id):
         return Response(serializer.data)
     except Exception as e:
         return Response(str(e), 400)
+
+@extend_schema(
+    description='Create a batch of comments, on any images, in one request.  The body is a JSON array of '
+                '`{image_id, content}` objects.  Responds 200 when every comment was created, otherwise 207, with a '
+                'result per comment in the order posted.',
+    request=serializers.CommentBatchItemSerializer(many=True),
+    responses={
+        (200, "application/json"): {
+            "description": "Every comment created (207 when some were not)",
+            "type": "object",
+            "properties": {
+                "created": { "type": "integer" },
+                "failed": { "type": "integer" },
+                "results": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "status": { "type": "integer" },
+                            "comment": { "type": "object" },
+                            "errors": { "type": "object" },
+                        }
+                    }
+                }
+            }
+        },
+        422: OpenApiResponse(description='The body is not a list of at most comment_batch_max comments'),
+    },
+)
+@api_view(['POST'])
+def comment_batch(request):
+    """
+    Create a batch of comments with batched inserts
+    """
+    limit = apps.get_app_config('images').comment_batch_max
+    if not isinstance(request.data, list) or len(request.data) > limit:
+        return JsonResponse({'errors': {'comments': [f'Expected a list of at most {limit} comments']}},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    results = actions.add_comments(request.data)
+    created = sum(result['status'] == 201 for result in results)
+    return fast_json.response(
+        {'created': created, 'failed': len(results) - created, 'results': results},
+        status=status.HTTP_200_OK if created == len(results) else status.HTTP_207_MULTI_STATUS,
+    )
+